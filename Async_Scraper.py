@@ -0,0 +1,396 @@
+"""Orquestrador asyncio para coletar milhares de fundos a partir de um único processo.
+
+Utiliza o mesmo fluxo e o mesmo parsing do CVM_HTTP_Page, porém com aiohttp:
+
+ 1) Host_Limiter: limites de requisições simultâneas, global e por host.
+
+ 2) Async_CVM_HTTP_Page: passos da página da CVM (captcha, login, picklist de meses e
+ tabela dgDocDiario) com requisições assíncronas. Respostas HTTP 403/429/5xx e timeouts
+ são repetidas com backoff exponencial (com jitter), liberando o limite durante a espera.
+ O POST do login não é repetido (o captcha só vale para uma tentativa): em caso de falha, o
+ scrape_fund_async recomeça o login a partir da página inicial, com um novo captcha.
+
+ 3) scrape_fund_async: fluxo de um fundo. O captcha é resolvido num executor, para que
+ o pré-processamento e a inferência não bloqueiem o event loop. Após o login, os meses são
+ coletados simultaneamente.
+
+ 4) run_async: descarta os fundos já atualizados e mantém até max_funds fundos em andamento
+ simultaneamente. Grava as tabelas coletadas no banco de dados conforme cada fundo é
+ concluído, numa thread dedicada, para que a gravação não bloqueie o event loop.
+
+Para utilizar o Tor, fornecer um connector com proxy SOCKS, ex.: aiohttp_socks.ProxyConnector."""
+
+import os
+import time
+import datetime
+import random
+import asyncio
+import logging
+import logging.config
+from concurrent.futures import ThreadPoolExecutor
+from collections import defaultdict
+from contextlib import asynccontextmanager
+from urllib.parse import urlsplit
+
+import aiohttp
+
+from BasePage import Base_page
+from CVM_HTTP_Page import (
+    parse_page,
+    form_action,
+    link_target,
+    frame_url,
+    captcha_url,
+    log_in_data,
+    fund_link,
+    months_available,
+    pick_month_data,
+    table_html,
+)
+from Fund_Scraper import Fund_Result, plan_months, feed_tables, _pending_funds
+
+# Configura o display e salvamento de logs
+logging.config.fileConfig(
+    os.path.join(os.path.dirname(os.path.abspath(__file__)), "logging.conf"),
+    disable_existing_loggers=False,
+)
+logger = logging.getLogger("main")
+
+# Respostas que indicam bloqueio / sobrecarga temporária do site
+RETRY_STATUS = {403, 429, 500, 502, 503, 504}
+
+
+class Host_Limiter(object):
+    """Limita o número de requisições em andamento, no total e por host. O limite do host é
+    obtido antes do global: uma requisição que aguarda um host saturado não ocupa o limite
+    global, que continua disponível para os demais hosts."""
+
+    def __init__(self, global_limit: int = 100, per_host_limit: int = 20):
+
+        self._global = asyncio.Semaphore(global_limit)
+        self._hosts = defaultdict(lambda: asyncio.Semaphore(per_host_limit))
+
+    @asynccontextmanager
+    async def slot(self, url: str):
+
+        async with self._hosts[urlsplit(url).hostname], self._global:
+            yield
+
+
+class Async_CVM_HTTP_Page(object):
+    """Versão assíncrona do CVM_HTTP_Page. Cada fundo deve utilizar a sua própria
+    aiohttp.ClientSession (cookies), que podem compartilhar o mesmo connector."""
+
+    url = Base_page.url
+
+    def __init__(
+        self,
+        session: aiohttp.ClientSession,
+        limiter: Host_Limiter,
+        max_retries: int = 5,
+        backoff: float = 1.0,
+    ):
+
+        self.session = session
+        self.limiter = limiter
+        self.max_retries = max_retries
+        self.backoff = backoff
+
+        # Página corrente: url e html parseado
+        self.page_url = None
+        self.soup = None
+
+    async def _request(
+        self, method: str, url: str, data: dict = None, binary=False, retry=True
+    ):
+        """Requisição com backoff. Retorna a tupla (url final, conteúdo). Com retry=False
+        (requisições que não podem ser repetidas), a primeira falha gera o ConnectionError."""
+
+        for attempt in range(self.max_retries + 1 if retry else 1):
+            try:
+                async with self.limiter.slot(url):
+                    async with self.session.request(method, url, data=data) as response:
+
+                        if response.status not in RETRY_STATUS:
+                            response.raise_for_status()
+                            body = await (
+                                response.read() if binary else response.text()
+                            )
+                            return str(response.url), body
+
+                        error = f"HTTP {response.status}"
+
+            except (asyncio.TimeoutError, aiohttp.ClientConnectionError) as err:
+                error = repr(err)
+
+            if retry and attempt < self.max_retries:
+                # A espera acontece fora do slot, sem ocupar o limite de requisições
+                delay = self.backoff * 2 ** attempt * (1 + random.random())
+                logger.debug(f"{error} em {url}, nova tentativa em {delay:.1f}s.")
+                await asyncio.sleep(delay)
+
+        raise ConnectionError(f"Falha ao acessar {url} após o backoff: {error}.")
+
+    async def _load(self, method: str, url: str, data: dict = None, retry=True):
+
+        self.page_url, html = await self._request(method, url, data, retry=retry)
+        self.soup = parse_page(html)
+
+        return self.soup
+
+    async def _follow(self, link):
+
+        method, url, data = link_target(self.soup, link, self.page_url)
+
+        return await self._load(method, url, data)
+
+    async def go(self):
+
+        await self._load("GET", self.url)
+
+        url = frame_url(self.soup, self.page_url)
+        if url is not None:
+            await self._load("GET", url)
+
+    async def grab_captcha(self) -> bytes:
+
+        url = captcha_url(self.soup, self.page_url)
+        if url is None:
+            return None
+
+        _, content = await self._request("GET", url, binary=True)
+
+        return content
+
+    async def ask_new_captcha(self):
+
+        link = self.soup.find("a", id="lkNovoRandom")
+        if link is not None:
+            await self._follow(link)
+        else:
+            await self.go()
+
+    async def log_in(self, CNPJ: str, captcha: str) -> bool:
+        """O POST do login não é repetido: em caso de falha gera o ConnectionError."""
+
+        await self._load(
+            "POST",
+            form_action(self.soup, self.page_url),
+            log_in_data(self.soup, CNPJ, captcha),
+            retry=False,
+        )
+
+        return fund_link(self.soup, CNPJ) is not None
+
+    async def select_fund(self, CNPJ: str):
+
+        await self._follow(fund_link(self.soup, CNPJ))
+
+    async def go_to_tables(self):
+
+        await self._follow(self.soup.find("a", id="Hyperlink2"))
+
+    def months_available(self) -> str:
+
+        return months_available(self.soup)
+
+    async def pick_month(self, month_year: str):
+
+        await self._load(
+            "POST",
+            form_action(self.soup, self.page_url),
+            pick_month_data(self.soup, month_year),
+        )
+
+    def fetch_data(self) -> str:
+
+        return table_html(self.soup)
+
+    async def fetch_months(self, months: list, max_parallel: int = 4) -> list:
+        """Mesmo contrato do CVM_HTTP_Page.fetch_months: postbacks simultâneos a partir da
+        página corrente, resultados na ordem de months."""
+
+        action = form_action(self.soup, self.page_url)
+        parallel = asyncio.Semaphore(max(1, max_parallel))
+
+        async def fetch(month: str) -> str:
+            async with parallel:
+                _, html = await self._request(
+                    "POST", action, pick_month_data(self.soup, month)
+                )
+
+            return table_html(parse_page(html))
+
+        tables = await asyncio.gather(*(fetch(month) for month in months))
+
+        return list(zip(months, tables))
+
+
+async def scrape_fund_async(
+    CVM: Async_CVM_HTTP_Page,
+    CNPJ: str,
+    fund_name: str,
+    solver,
+    executor=None,
+    max_tries: int = 7,
+    n_months=None,
+    last_update: datetime.date = None,
+    month_workers: int = 4,
+) -> Fund_Result:
+    """Mesmo fluxo do scrape_fund_http. O captcha é resolvido no executor (None utiliza o
+    executor padrão do event loop). Se o POST do login falhar, o login recomeça a partir da
+    página inicial, com um novo captcha, e conta como uma tentativa."""
+
+    loop = asyncio.get_running_loop()
+    start = time.perf_counter()
+    await CVM.go()
+
+    for tries in range(1, max_tries + 1):
+
+        interpreted_captcha, _ = await loop.run_in_executor(
+            executor, solver.solve, await CVM.grab_captcha(), fund_name
+        )
+
+        if interpreted_captcha is None:
+            await CVM.ask_new_captcha()
+            continue
+
+        try:
+            logged_in = await CVM.log_in(CNPJ, interpreted_captcha)
+        except ConnectionError as err:
+            logger.warning(f"Falha no login do fundo {fund_name}: {err}")
+            await CVM.go()
+            continue
+
+        if logged_in:
+            break
+    else:
+        logger.warning(
+            f"Não conseguimos logar na tentativa de atualização do fundo: {fund_name}"
+        )
+        return Fund_Result(
+            CNPJ, fund_name, "login_failed", max_tries, [], time.perf_counter() - start
+        )
+
+    logger.info(f"Número de tentativas de log no fundo {fund_name}: {tries}.")
+
+    await CVM.select_fund(CNPJ)
+    await CVM.go_to_tables()
+
+    tables = await CVM.fetch_months(
+        plan_months(CVM.months_available(), last_update, n_months), month_workers
+    )
+
+    return Fund_Result(
+        CNPJ, fund_name, "ok", tries, tables, time.perf_counter() - start
+    )
+
+
+async def run_async(
+    fundos: dict,
+    solver,
+    SQL_DB,
+    max_funds: int = 200,
+    global_limit: int = 100,
+    per_host_limit: int = 20,
+    timeout: int = 30,
+    connector: aiohttp.BaseConnector = None,
+    executor=None,
+    max_retries: int = 5,
+    backoff: float = 1.0,
+    **kwargs,
+) -> list:
+    """Definições:
+     - fundos: dicionário {CNPJ: nome do fundo}, como em fundos.json.
+     - solver: Captcha_Solver, executado no executor.
+     - SQL_DB: Write_to_SQLlite onde as tabelas coletadas serão gravadas, uma de cada vez,
+     numa thread dedicada.
+     - max_funds: número máximo de fundos (sessões) em andamento simultaneamente.
+     - global_limit / per_host_limit: requisições simultâneas no total e por host.
+     - timeout: tempo máximo, em segundos, de cada requisição.
+     - connector: connector do aiohttp (ex.: proxy SOCKS). Se None, cria um TCPConnector.
+     - executor: executor da resolução dos captchas (None: executor padrão do loop).
+     - max_retries / backoff: novas tentativas e espera inicial (segundos) das requisições
+     bloqueadas (403/429/5xx) ou sem resposta.
+     - **kwargs: max_tries, n_months e month_workers (meses coletados simultaneamente por
+     fundo), repassados ao scrape_fund_async.
+
+     Retorna a lista de Fund_Result: primeiro os fundos já atualizados (status "up_to_date"),
+     depois os demais, na ordem em que foram concluídos. Se a gravação falhar, os fundos em
+     andamento são cancelados antes de a exceção ser propagada."""
+
+    limiter = Host_Limiter(global_limit, per_host_limit)
+    funds_in_flight = asyncio.Semaphore(max_funds)
+    client_timeout = aiohttp.ClientTimeout(total=timeout)
+
+    own_connector = connector is None
+    if own_connector:
+        connector = aiohttp.TCPConnector(
+            limit=global_limit, limit_per_host=per_host_limit
+        )
+
+    async def collect(CNPJ: str, fund_name: str, last_update) -> Fund_Result:
+
+        async with funds_in_flight:
+            logger.info(f"Atualizando dados do fundo: {fund_name}.")
+            start = time.perf_counter()
+
+            try:
+                # Cookies próprios por fundo, conexões compartilhadas pelo connector
+                async with aiohttp.ClientSession(
+                    connector=connector, connector_owner=False, timeout=client_timeout
+                ) as session:
+                    CVM = Async_CVM_HTTP_Page(session, limiter, max_retries, backoff)
+                    return await scrape_fund_async(
+                        CVM,
+                        CNPJ,
+                        fund_name,
+                        solver,
+                        executor,
+                        last_update=last_update,
+                        **kwargs,
+                    )
+
+            except Exception as err:
+                logger.exception(
+                    f"Erro ao coletar os dados do fundo {fund_name}: {err}."
+                )
+                return Fund_Result(
+                    CNPJ, fund_name, "error", 0, [], time.perf_counter() - start
+                )
+
+    outcomes, pending = _pending_funds(fundos, SQL_DB)
+
+    tasks = [asyncio.ensure_future(collect(*job)) for job in pending]
+
+    # Uma única thread de gravação: a conexão SQLite nunca é utilizada simultaneamente
+    loop = asyncio.get_running_loop()
+    db_executor = ThreadPoolExecutor(max_workers=1)
+
+    try:
+        for task in asyncio.as_completed(tasks):
+            result = await task
+            outcomes.append(result)
+
+            if result.status != "ok":
+                continue
+
+            await loop.run_in_executor(
+                db_executor, feed_tables, SQL_DB, result.CNPJ, result.tables
+            )
+
+            logger.info(
+                f"Base de dados atualizada com dados do fundo: {result.fund_name} "
+                f"({result.elapsed:.1f}s)."
+            )
+    finally:
+        # Fundos ainda em andamento (interrupção): cancelados antes de fechar o connector
+        for task in tasks:
+            task.cancel()
+        await asyncio.gather(*tasks, return_exceptions=True)
+
+        db_executor.shutdown()
+        if own_connector:
+            await connector.close()
+
+    return outcomes
@@ -0,0 +1,160 @@
+import os
+import sys
+import time
+import random
+import hashlib
+import tempfile
+import threading
+import http.server
+
+sys.path.append(
+    os.path.join(
+        os.path.dirname(os.path.dirname(os.path.abspath(__file__))), "Build Dataset"
+    )
+)
+
+import numpy as np
+from cv2 import cv2
+from Captcha_downloader import download_captchas, existing_pictures
+
+"""Compara o download sequencial (um request por vez, uma conexão) com o modo concorrente do
+Captcha_downloader contra um servidor HTTP local que simula o RandomTxt.aspx: cada requisição
+retorna um PNG sorteado de um conjunto de imagens geradas, após uma latência fixa. Parte das
+respostas se repete, como no site.
+
+Para cada modo reporta a taxa de captchas salvos por segundo e os repetidos descartados, e
+verifica que:
+ - a pasta não tem imagens repetidas e os arquivos são numerados sem lacunas;
+ - um novo download retoma a numeração dos arquivos existentes;
+ - a taxa de requisições respeita o limite do token bucket (-r);
+ - uma rajada de respostas 403 com 32 workers gera uma única rotação de circuito;
+ - um servidor que só retorna captchas repetidos não prende o download num loop infinito.
+
+Não utiliza o tor nem acessa o site da CVM.
+
+Uso: python3 "Benchmark Captcha Downloader.py" [número de captchas] [latência em ms]"""
+
+number = int(sys.argv[1]) if len(sys.argv) > 1 else 200
+latency = float(sys.argv[2]) / 1000 if len(sys.argv) > 2 else 0.02
+
+# Conjunto de imagens servidas: 3 vezes o número de captchas, para que parte se repita
+rng = np.random.default_rng(0)
+pictures = [
+    cv2.imencode(".png", rng.integers(0, 256, (50, 180), dtype=np.uint8))[1].tobytes()
+    for _ in range(3 * number)
+]
+
+
+class Stand_In_Handler(http.server.BaseHTTPRequestHandler):
+    "Simula o RandomTxt.aspx: um PNG aleatório por requisição"
+
+    protocol_version = "HTTP/1.1"
+    requests = []
+    served = pictures
+    blocked_until = 0.0
+
+    def do_GET(self):
+
+        Stand_In_Handler.requests.append(time.perf_counter())
+        time.sleep(latency)
+
+        if time.perf_counter() < Stand_In_Handler.blocked_until:
+            self.send_response(403)
+            self.send_header("Content-Length", "0")
+            self.end_headers()
+            return None
+
+        content = random.choice(Stand_In_Handler.served)
+        self.send_response(200)
+        self.send_header("Content-Type", "image/png")
+        self.send_header("Content-Length", str(len(content)))
+        self.end_headers()
+        self.wfile.write(content)
+
+    def log_message(self, *args):
+        pass
+
+
+def check_folder(path: str, expected: int):
+    "Arquivos numerados de 1 a expected, sem imagens repetidas"
+
+    names = sorted(os.listdir(path))
+    hashes = set()
+    for name in names:
+        with open(os.path.join(path, name), "rb") as f:
+            hashes.add(hashlib.sha1(f.read()).hexdigest())
+
+    assert len(names) == len(hashes) == expected, (len(names), len(hashes), expected)
+    assert existing_pictures(path)[0] == expected
+
+
+server = http.server.ThreadingHTTPServer(("127.0.0.1", 0), Stand_In_Handler)
+threading.Thread(target=server.serve_forever, daemon=True).start()
+url = f"http://127.0.0.1:{server.server_port}/RandomTxt.aspx"
+
+print(f"{number} captchas, latência de {1000 * latency:.0f} ms por requisição.\n")
+
+with open(os.devnull, "w") as log:
+    for workers in (1, 4, 16):
+        with tempfile.TemporaryDirectory() as path:
+            start = time.perf_counter()
+            saved, duplicates = download_captchas(
+                url, number, path, workers=workers, renew=None, log=log
+            )
+            elapsed = time.perf_counter() - start
+
+            check_folder(path, saved)
+            print(
+                f"workers={workers:>2}: {saved / elapsed:8.1f} captchas/s "
+                f"({duplicates} repetidos descartados)"
+            )
+
+            # Retomada: continua a numeração e não repete as imagens já salvas
+            saved_again, _ = download_captchas(
+                url, number // 4, path, workers=workers, renew=None, log=log
+            )
+            check_folder(path, saved + saved_again)
+
+    # Limite de requisições: rajada inicial de `rate` requisições e depois `rate` por segundo
+    rate = 50
+    with tempfile.TemporaryDirectory() as path:
+        Stand_In_Handler.requests.clear()
+        download_captchas(
+            url, 3 * rate, path, workers=16, rate=rate, renew=None, log=log
+        )
+
+        timestamps = Stand_In_Handler.requests
+        achieved = (len(timestamps) - rate) / (timestamps[-1] - timestamps[0])
+        print(
+            f"\nLimite de {rate} requisições/s: {achieved:.1f} requisições/s após a rajada."
+        )
+        assert achieved <= 1.05 * rate
+
+    # Bloqueio de 0,3 s (HTTP 403): uma única rotação, com as demais threads aguardando
+    renewals = []
+    with tempfile.TemporaryDirectory() as path:
+        Stand_In_Handler.blocked_until = time.perf_counter() + 0.3
+        saved, _ = download_captchas(
+            url,
+            number // 2,
+            path,
+            workers=32,
+            renew=lambda: renewals.append(time.perf_counter()),
+            backoff=0.5,
+            log=log,
+        )
+        print(
+            f"Bloqueio de 0,3 s com 32 workers: {len(renewals)} rotações de circuito."
+        )
+        assert saved == number // 2 and len(renewals) == 1, (saved, len(renewals))
+
+    # Servidor que só retorna 5 captchas: interrompe após max_duplicates repetidos seguidos
+    with tempfile.TemporaryDirectory() as path:
+        Stand_In_Handler.served = pictures[:5]
+        saved, duplicates = download_captchas(
+            url, number, path, workers=4, renew=None, max_duplicates=20, log=log
+        )
+        print(f"Somente captchas repetidos: {saved} salvos, {duplicates} descartados.")
+        assert saved == 5, saved
+
+server.shutdown()
@@ -0,0 +1,75 @@
+import os
+import sys
+import time
+import logging
+
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import numpy as np
+import Captcha_Processor
+from Captcha_Processor import digits_extractor_batch
+from Captcha_NumPy_Model import load_numpy_model
+
+"""Compara os modos de seleção de imagem do captcha_interpreter nos captchas de qualidade média:
+
+ - "tesseract": chama o Tesseract (um processo por imagem candidata).
+ - "confidence": escolhe a candidata pela confiança da rede neural, sem sair do processo.
+
+Para cada modo, processa todos os captchas da pasta Build Dataset/Labeled Pictures e reporta
+a latência média por captcha (pré-processamento + inferência) e a taxa de captchas resolvidos,
+isto é, cujo texto interpretado coincide com o nome do arquivo.
+
+Uso: python3 "Benchmark Captcha Selection.py" [número de repetições]"""
+
+logger = logging.getLogger("main")
+
+repeat = int(sys.argv[1]) if len(sys.argv) > 1 else 5
+
+path_to_pictures = os.path.join("Build Dataset", "Labeled Pictures")
+pictures = sorted(
+    entry.path for entry in os.scandir(path_to_pictures) if entry.name.endswith("png")
+)
+
+bites_streams, labels = [], []
+for picture in pictures:
+    with open(picture, "rb") as f:
+        bites_streams.append(f.read())
+    labels.append(os.path.basename(picture).split(".")[0])
+
+model = load_numpy_model("Captcha_model.h5")
+
+# Silenciando os logs por imagem para não distorcer as medições
+logging.getLogger("root").setLevel(logging.WARNING)
+logger.setLevel(logging.INFO)
+
+modes = {
+    "tesseract": {"selection_mode": "tesseract"},
+    "confidence": {
+        "selection_mode": "confidence",
+        "classifier": model,
+        "tesseract_fallback": False,
+    },
+}
+
+if Captcha_Processor.ocr is None:
+    logger.warning("pytesseract indisponível: modo tesseract não será medido.")
+    del modes["tesseract"]
+
+for mode, kwargs in modes.items():
+
+    timings = []
+    for _ in range(repeat):
+        start = time.perf_counter()
+        digits, offsets = digits_extractor_batch(bites_streams, pictures, **kwargs)
+        predictions = model.predict(digits).argmax(axis=1)
+        timings.append(time.perf_counter() - start)
+
+    solved = sum(
+        "".join(str(digit) for digit in predictions[start:stop]) == label
+        for label, start, stop in zip(labels, offsets[:-1], offsets[1:])
+    )
+
+    logger.info(
+        f"Modo {mode}: {1000 * np.median(timings) / len(pictures):.2f} ms por captcha, "
+        f"{solved}/{len(pictures)} captchas resolvidos."
+    )
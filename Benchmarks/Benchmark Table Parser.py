@@ -0,0 +1,100 @@
+import os
+import sys
+import time
+import random
+import logging
+
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from Write_on_DB import Write_to_SQLlite, NEVER_UPDATED
+
+"""Compara os parsers da tabela dgDocDiario do Write_to_SQLlite numa carga histórica:
+
+ - "soup": BeautifulSoup, com a conversão de cada célula pelo _convert_data.
+ - "fast": Table_Parser, com expressões regulares e conversão vetorizada das colunas.
+
+As tabelas são sintéticas, no mesmo formato das páginas da CVM (8 colunas, números no
+formato brasileiro e dias sem dados preenchidos com &nbsp;), uma por mês. Verifica que os
+dois parsers retornam exatamente as mesmas linhas e reporta o tempo de cada um.
+
+Uso: python3 "Benchmark Table Parser.py" [número de meses] [número de repetições]"""
+
+logger = logging.getLogger("main")
+logger.setLevel(logging.INFO)
+
+n_months = int(sys.argv[1]) if len(sys.argv) > 1 else 240
+repeat = int(sys.argv[2]) if len(sys.argv) > 2 else 3
+
+HEADER = (
+    "<tr><td>Dia</td><td>Quota (R$)</td><td>Captação no Dia (R$)</td>"
+    "<td>Resgate no Dia (R$)</td><td>Patrimônio Líquido (R$)</td>"
+    "<td>Total da Carteira (R$)</td><td>Nº. Total de Cotistas</td>"
+    "<td>Data da próxima informação do PL</td></tr>"
+)
+
+
+def brazilian_format(number: float, decimals: int = 2) -> str:
+
+    return (
+        f"{number:,.{decimals}f}".replace(",", "X").replace(".", ",").replace("X", ".")
+    )
+
+
+def synthetic_month(month: int, year: int, rng: random.Random) -> str:
+    """innerHTML de uma tabela dgDocDiario com os dias úteis (aproximados) do mês."""
+
+    rows = [HEADER]
+    quota = 1 + rng.random()
+
+    for day in range(1, 29):
+        # Dias sem informação: somente o dia preenchido
+        if rng.random() < 0.15:
+            rows.append(f"<tr><td>{day:02d}</td>" + "<td>&nbsp;</td>" * 7 + "</tr>")
+            continue
+
+        quota *= 1 + rng.gauss(0, 0.01)
+        cells = [
+            f"{day:02d}",
+            brazilian_format(quota, 9),
+            brazilian_format(rng.random() * 1e6),
+            brazilian_format(rng.random() * 1e6),
+            brazilian_format(1e8 * quota),
+            brazilian_format(1e8 * quota * 1.01),
+            str(rng.randint(100, 5000)),
+            f"{day + 1:02d}/{month:02d}/{year}",
+        ]
+        rows.append("<tr>" + "".join(f"<td>{cell}</td>" for cell in cells) + "</tr>")
+
+    return "\n".join(rows)
+
+
+rng = random.Random(0)
+tables = []
+for index in range(n_months):
+    year, month = 2020 - index // 12, 12 - index % 12
+    tables.append((f"{month:02d}/{year}", synthetic_month(month, year, rng)))
+
+results = {}
+for parser in ("soup", "fast"):
+
+    SQL_DB = Write_to_SQLlite(":memory:", parser=parser)
+    SQL_DB.last_update = NEVER_UPDATED
+
+    best = float("inf")
+    for _ in range(repeat):
+        start = time.perf_counter()
+        rows = [SQL_DB.parse_table(table, month) for month, table in tables]
+        best = min(best, time.perf_counter() - start)
+
+    SQL_DB.close_connection()
+    results[parser] = rows
+
+    logger.info(
+        f"Parser {parser}: {best:.3f}s para {n_months} meses "
+        f"({1000 * best / n_months:.2f} ms por mês, {sum(map(len, rows))} linhas)."
+    )
+
+if results["soup"] != results["fast"]:
+    raise SystemExit("Os parsers retornaram linhas diferentes.")
+
+logger.info("Os dois parsers retornaram exatamente as mesmas linhas.")
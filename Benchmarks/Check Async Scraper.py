@@ -0,0 +1,255 @@
+import os
+import sys
+import time
+import asyncio
+import tempfile
+import threading
+import http.server
+import urllib.parse
+
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from Write_on_DB import Write_to_SQLlite
+from Async_Scraper import Async_CVM_HTTP_Page, run_async
+
+"""Verifica o Async_Scraper.run_async contra um servidor HTTP local que simula as páginas da
+CVM (frame principal, captcha, login, página do fundo, dados diários e postbacks do picklist
+de meses), com latência fixa por requisição. Não acessa o site da CVM.
+
+ - Limite por host: o número de requisições simultâneas no servidor não passa de
+ per_host_limit, com todos os fundos em andamento ao mesmo tempo.
+ - Bloqueio: durante 0,3 s o servidor responde HTTP 403. As requisições são repetidas com
+ backoff (o login recomeça com um novo captcha) e todos os fundos são gravados.
+ - Falha na gravação: a exceção é propagada e os fundos em andamento são cancelados antes
+ do fechamento do connector, sem tarefas pendentes no event loop.
+
+Uso: python3 "Check Async Scraper.py" [número de fundos] [latência em ms]"""
+
+n_funds = int(sys.argv[1]) if len(sys.argv) > 1 else 12
+latency = float(sys.argv[2]) / 1000 if len(sys.argv) > 2 else 0.02
+
+PER_HOST_LIMIT = 3
+CAPTCHA = "12345"
+MONTHS = ["02/2020", "01/2020"]
+FUNDS = {
+    f"{i:02d}.{i:03d}.111/0001-{i:02d}": f"FUNDO {i}" for i in range(1, n_funds + 1)
+}
+
+LOG_IN = """<html><body><form method="post" action="./Busca.aspx">
+<input type="hidden" name="__VIEWSTATE" value="VS1"/><img src="RandomTxt.aspx"/>
+<input name="txtCNPJNome" type="text"/><input name="numRandom" type="text"/>
+<input type="submit" name="btnContinuar" value="Continuar"/></form></body></html>"""
+FUND = """<html><body><a id="Hyperlink2" href="Diario.aspx">diarios</a></body></html>"""
+
+
+def search_result(CNPJ: str) -> str:
+
+    return f"""<html><body><form method="post" action="Res.aspx">
+    <input type="hidden" name="__VIEWSTATE" value="VS2"/>
+    <a href="Fundo.aspx">{CNPJ} - {FUNDS[CNPJ]}</a></form></body></html>"""
+
+
+def daily_data(month: str) -> str:
+
+    options = "".join(
+        f'<option value="{m}"{" selected" if m == month else ""}>{m}</option>'
+        for m in MONTHS
+    )
+    rows = "".join(
+        f"<tr><td>{day:02d}</td><td>1,{day:02d}</td><td>0,00</td><td>0,00</td>"
+        f"<td>1.000,00</td><td>1.000,00</td><td>10</td><td>&nbsp;</td></tr>"
+        for day in range(1, 11)
+    )
+
+    return f"""<html><body><form method="post" action="Diario.aspx">
+    <input type="hidden" name="__VIEWSTATE" value="VS-{month}"/>
+    <input type="hidden" name="__EVENTTARGET" value=""/>
+    <select name="ddComptc" id="ddComptc">{options}</select>
+    <table id="dgDocDiario"><tr><td>Dia</td><td>Quota (R$)</td><td>Captação no Dia (R$)</td>
+    <td>Resgate no Dia (R$)</td><td>Patrimônio Líquido (R$)</td><td>Total da Carteira (R$)</td>
+    <td>Nº. Total de Cotistas</td><td>Data da próxima informação do PL</td></tr>{rows}</table>
+    </form></body></html>"""
+
+
+class Stand_In_Handler(http.server.BaseHTTPRequestHandler):
+    """Simula as páginas da CVM. Conta as requisições simultâneas e responde 403 até
+    blocked_until."""
+
+    protocol_version = "HTTP/1.1"
+    lock = threading.Lock()
+    in_flight = max_in_flight = forbidden = 0
+    blocked_until = 0.0
+
+    def handle_one_request(self):
+
+        try:
+            super().handle_one_request()
+        except ConnectionError:
+            # Cliente cancelado no meio da resposta (falha na gravação)
+            self.close_connection = True
+
+    def parse_request(self) -> bool:
+        "Requisição recebida: conta as requisições simultâneas até o fim da resposta"
+
+        with Stand_In_Handler.lock:
+            Stand_In_Handler.in_flight += 1
+            Stand_In_Handler.max_in_flight = max(
+                Stand_In_Handler.max_in_flight, Stand_In_Handler.in_flight
+            )
+
+        return super().parse_request()
+
+    def end_headers(self):
+
+        super().end_headers()
+        with Stand_In_Handler.lock:
+            Stand_In_Handler.in_flight -= 1
+
+    def blocked(self) -> bool:
+
+        time.sleep(latency)
+        if time.perf_counter() >= Stand_In_Handler.blocked_until:
+            return False
+
+        with Stand_In_Handler.lock:
+            Stand_In_Handler.forbidden += 1
+        self.send_response(403)
+        self.send_header("Content-Length", "0")
+        self.end_headers()
+        return True
+
+    def send(self, body, content_type: str = "text/html"):
+
+        body = body if isinstance(body, bytes) else body.encode()
+        self.send_response(200)
+        self.send_header("Content-Type", content_type)
+        self.send_header("Content-Length", str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def do_GET(self):
+
+        if self.blocked():
+            return None
+
+        if self.path.startswith("/swb/default.asp"):
+            self.send('<frameset><frame name="Main" src="/SWB/Busca.aspx"></frameset>')
+        elif self.path.startswith("/SWB/Busca.aspx"):
+            self.send(LOG_IN)
+        elif self.path.startswith("/SWB/RandomTxt.aspx"):
+            self.send(b"\x89PNG", "image/png")
+        elif self.path.startswith("/SWB/Fundo.aspx"):
+            self.send(FUND)
+        elif self.path.startswith("/SWB/Diario.aspx"):
+            self.send(daily_data(MONTHS[0]))
+        else:
+            self.send_error(404)
+
+    def do_POST(self):
+
+        length = int(self.headers["Content-Length"])
+        data = urllib.parse.parse_qs(self.rfile.read(length).decode())
+
+        if self.blocked():
+            return None
+
+        if self.path.startswith("/SWB/Busca.aspx"):
+            self.send(search_result(data["txtCNPJNome"][0]))
+        else:
+            self.send(daily_data(data["ddComptc"][0]))
+
+    def log_message(self, *args):
+        pass
+
+
+class Fixed_Solver(object):
+    "Solver do captcha simulado"
+
+    def solve(self, bites_stream: bytes, filename: str = None):
+        return CAPTCHA, None
+
+
+class Broken_DB(Write_to_SQLlite):
+    "Base de dados cuja gravação falha"
+
+    def get_last_update(self, CNPJ_fund: str):
+        raise RuntimeError("falha simulada na gravação")
+
+
+def stored_rows(SQL_DB) -> int:
+
+    return sum(
+        SQL_DB.c.execute(f"SELECT COUNT(*) FROM {table};").fetchone()[0]
+        for table in SQL_DB._per_fund_tables()
+    )
+
+
+async def interrupted(SQL_DB) -> set:
+    "Tarefas ainda pendentes no event loop após a falha na gravação"
+
+    errors = []
+    asyncio.get_running_loop().set_exception_handler(
+        lambda loop, context: errors.append(context["message"])
+    )
+
+    try:
+        await run_async(
+            FUNDS, Fixed_Solver(), SQL_DB, per_host_limit=PER_HOST_LIMIT, backoff=0.05
+        )
+    except RuntimeError:
+        pass
+    else:
+        raise AssertionError("A falha na gravação não foi propagada.")
+
+    # Tarefas órfãs só geram erro ao serem coletadas
+    await asyncio.sleep(0.2)
+    assert not errors, errors
+
+    return asyncio.all_tasks() - {asyncio.current_task()}
+
+
+server = http.server.ThreadingHTTPServer(("127.0.0.1", 0), Stand_In_Handler)
+threading.Thread(target=server.serve_forever, daemon=True).start()
+Async_CVM_HTTP_Page.url = (
+    f"http://127.0.0.1:{server.server_port}/swb/default.asp?sg_sistema=fundosreg"
+)
+
+with tempfile.TemporaryDirectory() as directory:
+    for blocked in (0.0, 0.3):
+        Stand_In_Handler.max_in_flight = Stand_In_Handler.forbidden = 0
+        Stand_In_Handler.blocked_until = time.perf_counter() + blocked
+
+        SQL_DB = Write_to_SQLlite(os.path.join(directory, f"async_{blocked}.db"))
+        start = time.perf_counter()
+        outcomes = asyncio.run(
+            run_async(
+                FUNDS,
+                Fixed_Solver(),
+                SQL_DB,
+                per_host_limit=PER_HOST_LIMIT,
+                backoff=0.05,
+            )
+        )
+        elapsed = time.perf_counter() - start
+
+        assert all(result.status == "ok" for result in outcomes), outcomes
+        assert stored_rows(SQL_DB) == 10 * len(MONTHS) * n_funds, stored_rows(SQL_DB)
+        SQL_DB.close_connection()
+
+        print(
+            f"Bloqueio de {blocked:.1f} s: {n_funds} fundos em {elapsed:.2f}s, "
+            f"{Stand_In_Handler.forbidden} respostas 403, "
+            f"{Stand_In_Handler.max_in_flight} requisições simultâneas "
+            f"(limite por host: {PER_HOST_LIMIT})."
+        )
+        assert Stand_In_Handler.max_in_flight <= PER_HOST_LIMIT
+        assert (Stand_In_Handler.forbidden > 0) == (blocked > 0)
+
+    SQL_DB = Broken_DB(os.path.join(directory, "broken.db"))
+    left = asyncio.run(interrupted(SQL_DB))
+    SQL_DB.close_connection()
+
+    print(f"Falha na gravação: {len(left)} tarefas pendentes após a interrupção.")
+    assert not left, left
+
+server.shutdown()
@@ -0,0 +1,156 @@
+import os
+import sys
+import tempfile
+import threading
+import http.server
+import urllib.parse
+
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from Write_on_DB import Write_to_SQLlite
+from CVM_HTTP_Page import CVM_HTTP_Page
+from Fund_Scraper import run_concurrently
+
+"""Verifica o reaproveitamento das conexões do engine "http" do Fund_Scraper.run_concurrently
+entre um fundo e outro: cada fundo tem a sua própria sessão (cookies), mas todas montam o mesmo
+HTTPAdapter (pool de conexões), que só é fechado ao final da coleta.
+
+As páginas da CVM são simuladas por um servidor HTTP local (frame principal, captcha, login,
+página do fundo, dados diários e postbacks do picklist de meses), que conta as conexões TCP
+abertas. Com um único worker, todos os fundos devem utilizar uma mesma conexão. Não acessa o
+site da CVM.
+
+Uso: python3 "Check HTTP Connection Pool.py" [número de fundos]"""
+
+n_funds = int(sys.argv[1]) if len(sys.argv) > 1 else 5
+
+CAPTCHA = "12345"
+MONTHS = ["02/2020", "01/2020"]
+FUNDS = {
+    f"{i:02d}.{i:03d}.111/0001-{i:02d}": f"FUNDO {i}" for i in range(1, n_funds + 1)
+}
+
+LOG_IN = """<html><body><form method="post" action="./Busca.aspx">
+<input type="hidden" name="__VIEWSTATE" value="VS1"/><img src="RandomTxt.aspx"/>
+<input name="txtCNPJNome" type="text"/><input name="numRandom" type="text"/>
+<input type="submit" name="btnContinuar" value="Continuar"/></form></body></html>"""
+FUND = """<html><body><a id="Hyperlink2" href="Diario.aspx">diarios</a></body></html>"""
+
+
+def search_result(CNPJ: str) -> str:
+
+    return f"""<html><body><form method="post" action="Res.aspx">
+    <input type="hidden" name="__VIEWSTATE" value="VS2"/>
+    <a href="Fundo.aspx">{CNPJ} - {FUNDS[CNPJ]}</a></form></body></html>"""
+
+
+def daily_data(month: str) -> str:
+
+    options = "".join(
+        f'<option value="{m}"{" selected" if m == month else ""}>{m}</option>'
+        for m in MONTHS
+    )
+    rows = "".join(
+        f"<tr><td>{day:02d}</td><td>1,{day:02d}</td><td>0,00</td><td>0,00</td>"
+        f"<td>1.000,00</td><td>1.000,00</td><td>10</td><td>&nbsp;</td></tr>"
+        for day in range(1, 11)
+    )
+
+    return f"""<html><body><form method="post" action="Diario.aspx">
+    <input type="hidden" name="__VIEWSTATE" value="VS-{month}"/>
+    <input type="hidden" name="__EVENTTARGET" value=""/>
+    <select name="ddComptc" id="ddComptc">{options}</select>
+    <table id="dgDocDiario"><tr><td>Dia</td><td>Quota (R$)</td><td>Captação no Dia (R$)</td>
+    <td>Resgate no Dia (R$)</td><td>Patrimônio Líquido (R$)</td><td>Total da Carteira (R$)</td>
+    <td>Nº. Total de Cotistas</td><td>Data da próxima informação do PL</td></tr>{rows}</table>
+    </form></body></html>"""
+
+
+class Stand_In_Handler(http.server.BaseHTTPRequestHandler):
+    "Simula as páginas da CVM e conta as conexões (setup é chamado uma vez por conexão)"
+
+    protocol_version = "HTTP/1.1"
+    connections = 0
+    lock = threading.Lock()
+
+    def setup(self):
+
+        super().setup()
+        with Stand_In_Handler.lock:
+            Stand_In_Handler.connections += 1
+
+    def send(self, body, content_type: str = "text/html"):
+
+        body = body if isinstance(body, bytes) else body.encode()
+        self.send_response(200)
+        self.send_header("Content-Type", content_type)
+        self.send_header("Content-Length", str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def do_GET(self):
+
+        if self.path.startswith("/swb/default.asp"):
+            self.send('<frameset><frame name="Main" src="/SWB/Busca.aspx"></frameset>')
+        elif self.path.startswith("/SWB/Busca.aspx"):
+            self.send(LOG_IN)
+        elif self.path.startswith("/SWB/RandomTxt.aspx"):
+            self.send(b"\x89PNG", "image/png")
+        elif self.path.startswith("/SWB/Fundo.aspx"):
+            self.send(FUND)
+        elif self.path.startswith("/SWB/Diario.aspx"):
+            self.send(daily_data(MONTHS[0]))
+        else:
+            self.send_error(404)
+
+    def do_POST(self):
+
+        length = int(self.headers["Content-Length"])
+        data = urllib.parse.parse_qs(self.rfile.read(length).decode())
+
+        if self.path.startswith("/SWB/Busca.aspx"):
+            self.send(search_result(data["txtCNPJNome"][0]))
+        else:
+            self.send(daily_data(data["ddComptc"][0]))
+
+    def log_message(self, *args):
+        pass
+
+
+class Fixed_Solver(object):
+    "Solver do captcha simulado"
+
+    def solve(self, bites_stream: bytes, filename: str = None):
+        return CAPTCHA, None
+
+
+server = http.server.ThreadingHTTPServer(("127.0.0.1", 0), Stand_In_Handler)
+threading.Thread(target=server.serve_forever, daemon=True).start()
+CVM_HTTP_Page.url = (
+    f"http://127.0.0.1:{server.server_port}/swb/default.asp?sg_sistema=fundosreg"
+)
+
+with tempfile.TemporaryDirectory() as directory:
+    for workers, month_workers in ((1, 1), (2, 2)):
+        Stand_In_Handler.connections = 0
+
+        SQL_DB = Write_to_SQLlite(os.path.join(directory, f"pool_{workers}.db"))
+        outcomes = run_concurrently(
+            FUNDS,
+            None,
+            Fixed_Solver(),
+            SQL_DB,
+            workers=workers,
+            engine="http",
+            month_workers=month_workers,
+        )
+        SQL_DB.close_connection()
+
+        assert all(result.status == "ok" for result in outcomes), outcomes
+        print(
+            f"{n_funds} fundos, {workers} workers x {month_workers} meses simultâneos: "
+            f"{Stand_In_Handler.connections} conexões."
+        )
+        assert Stand_In_Handler.connections <= workers * month_workers
+
+server.shutdown()
@@ -0,0 +1,156 @@
+import os
+import sys
+
+path_to_repo = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.append(path_to_repo)
+
+import h5py
+import numpy as np
+from Captcha_NumPy_Model import load_numpy_model
+
+"""Verifica o Captcha_NumPy_Model sem o TensorFlow: compara o predict com os logits de
+referência gravados em Benchmarks/Fixtures/captcha_reference_logits.npz, junto com os
+dígitos (n x 28 x 28 x 1) extraídos dos captchas da pasta Build Dataset/Labeled Pictures.
+
+Os logits de referência são as saídas da última camada densa, antes do softmax. Com a opção
+--regenerate, o arquivo é refeito: os logits são calculados pelo Keras, se o TensorFlow
+estiver instalado, ou por um forward pass direto em float64 (convolução por deslocamentos,
+sem o im2col do Captcha_NumPy_Model), lendo os pesos do Captcha_model.h5. A origem fica
+gravada no campo source do arquivo.
+
+Uso: python3 "Check NumPy Model.py" [--regenerate]"""
+
+path_to_model = os.path.join(path_to_repo, "Captcha_model.h5")
+path_to_reference = os.path.join(
+    os.path.dirname(os.path.abspath(__file__)),
+    "Fixtures",
+    "captcha_reference_logits.npz",
+)
+
+# Diferença máxima aceita entre as probabilidades (float32 x referência)
+TOLERANCE = 1e-5
+
+
+def softmax(x: np.ndarray) -> np.ndarray:
+
+    x = np.exp(x - x.max(axis=1, keepdims=True))
+
+    return x / x.sum(axis=1, keepdims=True)
+
+
+def extract_digits() -> np.ndarray:
+    "Dígitos dos captchas da pasta Labeled Pictures, escolhidos pela confiança da rede"
+
+    from Captcha_Processor import digits_extractor_batch
+
+    path_to_pictures = os.path.join(path_to_repo, "Build Dataset", "Labeled Pictures")
+    pictures = sorted(
+        entry.path
+        for entry in os.scandir(path_to_pictures)
+        if entry.name.endswith("png")
+    )
+
+    bites_streams = []
+    for picture in pictures:
+        with open(picture, "rb") as f:
+            bites_streams.append(f.read())
+
+    digits, _ = digits_extractor_batch(
+        bites_streams,
+        filenames=pictures,
+        selection_mode="confidence",
+        classifier=load_numpy_model(path_to_model),
+    )
+
+    return digits
+
+
+def direct_logits(digits: np.ndarray) -> np.ndarray:
+    """Forward pass direto em float64, camada a camada, a partir dos pesos do .h5 (Dropout
+    não atua na inferência)."""
+
+    with h5py.File(path_to_model, "r") as h5_file:
+        weights = h5_file["model_weights"]
+        layers = [
+            [
+                np.asarray(weights[name][weight_name], dtype=np.float64)
+                for weight_name in weights[name].attrs["weight_names"]
+            ]
+            for name in weights.attrs["layer_names"]
+        ]
+        names = [
+            name.decode() if isinstance(name, bytes) else name
+            for name in weights.attrs["layer_names"]
+        ]
+
+    x = digits.astype(np.float64)
+    dense = [params for name, params in zip(names, layers) if name.startswith("dense")]
+
+    for name, params in zip(names, layers):
+        if name.startswith("conv2d"):
+            kernel, bias = params
+            kh, kw = kernel.shape[:2]
+            h, w = x.shape[1] - kh + 1, x.shape[2] - kw + 1
+
+            # Soma de um produto por posição do kernel
+            out = np.zeros((x.shape[0], h, w, kernel.shape[3]))
+            for i in range(kh):
+                for j in range(kw):
+                    out += x[:, i : i + h, j : j + w, :] @ kernel[i, j]
+            x = np.maximum(out + bias, 0)
+
+        elif name.startswith("max_pooling2d"):
+            h, w = x.shape[1] // 2 * 2, x.shape[2] // 2 * 2
+            x = np.maximum.reduce(
+                [x[:, i:h:2, j:w:2] for i in range(2) for j in range(2)]
+            )
+
+        elif name.startswith("flatten"):
+            x = x.reshape(x.shape[0], -1)
+
+        elif name.startswith("dense"):
+            kernel, bias = params
+            x = x @ kernel + bias
+            if params is not dense[-1]:
+                x = np.maximum(x, 0)
+
+    return x
+
+
+def keras_logits(digits: np.ndarray) -> np.ndarray:
+    "Logits do Keras: saída da penúltima camada multiplicada pelos pesos da última"
+
+    from tensorflow.keras import Model
+    from tensorflow.keras.models import load_model
+
+    model = load_model(path_to_model, compile=False)
+    kernel, bias = model.layers[-1].get_weights()
+    hidden = Model(model.input, model.layers[-2].output).predict(digits)
+
+    return hidden.astype(np.float64) @ kernel + bias
+
+
+if "--regenerate" in sys.argv[1:]:
+    digits = extract_digits()
+    try:
+        logits, source = keras_logits(digits), "keras"
+    except ImportError:
+        logits, source = direct_logits(digits), "direct"
+
+    np.savez_compressed(path_to_reference, digits=digits, logits=logits, source=source)
+    print(f"{len(digits)} dígitos gravados em {path_to_reference} (logits: {source}).")
+
+reference = np.load(path_to_reference)
+expected = softmax(reference["logits"])
+predictions = load_numpy_model(path_to_model).predict(reference["digits"])
+
+mismatches = np.flatnonzero(predictions.argmax(axis=1) != expected.argmax(axis=1))
+max_diff = float(np.abs(predictions - expected).max())
+
+print(
+    f"Paridade NumPy x referência ({reference['source']}): "
+    f"{len(expected) - len(mismatches)}/{len(expected)} dígitos com o mesmo argmax. "
+    f"Maior diferença nas probabilidades: {max_diff:.2e}."
+)
+assert mismatches.size == 0, mismatches.tolist()
+assert max_diff < TOLERANCE, max_diff
@@ -0,0 +1,99 @@
+import os
+import sys
+import tempfile
+
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from Write_on_DB import Write_to_SQLlite
+from Open_Data_Loader import load_daily_reports
+
+"""Verifica a carga dos informes diários pelo Open_Data_Loader nos arquivos da pasta
+Benchmarks/Fixtures, nos dois layouts do Write_to_SQLlite:
+
+ - inf_diario_fi_202401.csv: formato CNPJ_FUNDO.
+ - inf_diario_fi_202402.csv: formato CNPJ_FUNDO_CLASSE, com um fundo de duas subclasses
+ (duas linhas por dia), um dia sem cota e um dia já presente no arquivo anterior.
+
+Verifica que cada fundo tem uma única linha por dia, que o número de linhas reportado pela
+carga é o número de linhas gravadas, que uma nova carga (ou a regravação de um dia já
+existente) não altera nada e que os totais diários mantidos incrementalmente são iguais aos
+recalculados pelo rebuild_aggregates.
+
+Uso: python3 "Check Open Data Loader.py\""""
+
+path_to_fixtures = os.path.join(os.path.dirname(os.path.abspath(__file__)), "Fixtures")
+files = sorted(
+    os.path.join(path_to_fixtures, name)
+    for name in os.listdir(path_to_fixtures)
+    if name.startswith("inf_diario_fi")
+)
+
+# Linhas distintas (fundo, dia) com o valor da cota nos arquivos
+EXPECTED_ROWS = 10
+EXPECTED_TOTALS = {"2024-02-01": (2920.25, 5.0, 2), "2024-02-02": (3435.5, 9.0, 3)}
+
+
+def aggregates(SQL_DB) -> tuple:
+
+    tables = []
+    for table in ("daily_totals", "daily_category_totals"):
+        SQL_DB.c.execute(f"SELECT * FROM {table} ORDER BY 1, 2;")
+        tables.append(
+            [
+                tuple(round(v, 6) if isinstance(v, float) else v for v in row)
+                for row in SQL_DB.c.fetchall()
+            ]
+        )
+
+    return tuple(tables)
+
+
+def stored_rows(SQL_DB) -> int:
+
+    if SQL_DB.layout == "long":
+        tables = ["daily_quota"]
+    else:
+        tables = SQL_DB._per_fund_tables()
+
+    return sum(
+        SQL_DB.c.execute(f"SELECT COUNT(*) FROM {table};").fetchone()[0]
+        for table in tables
+    )
+
+
+with tempfile.TemporaryDirectory() as directory:
+    for layout in ("per_fund", "long"):
+        SQL_DB = Write_to_SQLlite(
+            os.path.join(directory, f"{layout}.db"), layout=layout
+        )
+        SQL_DB.register_funds(
+            {
+                "11.111.111/0001-11": "FUNDO DE INVESTIMENTO RENDA FIXA",
+                "22.222.222/0001-22": "FUNDO DE INVESTIMENTO EM AÇÕES",
+            }
+        )
+
+        inserted = load_daily_reports(files, SQL_DB, chunk_rows=4)
+        assert inserted == stored_rows(SQL_DB) == EXPECTED_ROWS, (
+            inserted,
+            stored_rows(SQL_DB),
+        )
+
+        totals = aggregates(SQL_DB)
+        for row in totals[0]:
+            if str(row[0]) in EXPECTED_TOTALS:
+                assert row[1:] == EXPECTED_TOTALS[str(row[0])], row
+
+        # Nova carga e regravação de um dia já existente: nada muda
+        assert load_daily_reports(files, SQL_DB) == 0
+        SQL_DB.get_last_update("11111111000111")
+        row = (SQL_DB.last_update, 1.13, 0.0, 2.0, 1030.0, 1040.0, 11.0)
+        assert SQL_DB._data_entry_funds({"11111111000111": [row, row]}) == 0
+        assert stored_rows(SQL_DB) == EXPECTED_ROWS
+        assert aggregates(SQL_DB) == totals
+
+        SQL_DB.rebuild_aggregates()
+        assert aggregates(SQL_DB) == totals, (aggregates(SQL_DB), totals)
+
+        SQL_DB.close_connection()
+        print(f"{layout}: {inserted} linhas, totais diários iguais ao rebuild.")
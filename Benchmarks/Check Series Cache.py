@@ -0,0 +1,72 @@
+import os
+import sys
+import datetime
+import tempfile
+
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import numpy as np
+from Write_on_DB import Write_to_SQLlite
+from Read_from_DB import Read_from_SQLlite, Series_Cache, VALUE_COLUMNS, _nbytes
+
+"""Verifica o Series_Cache contra o Read_from_SQLlite numa base de dados sintética com três
+fundos de mesmo tamanho, num cache que comporta somente dois fundos e meio:
+
+ - uma consulta com um fundo em cache e um ausente, em que a inclusão do ausente descarta o
+ fundo em cache (o lote ainda recebe a série dele);
+ - consultas repetidas e recortadas por data, comparadas com a leitura direta da base.
+
+Uso: python3 "Check Series Cache.py\""""
+
+FUNDS = ("11", "22", "33")
+FIRST_DAY = datetime.date(2024, 1, 1)
+
+
+def rows(seed: int) -> list:
+
+    return [
+        (FIRST_DAY + datetime.timedelta(days=day), seed + day / 100, 0.0, 0.0)
+        + (1000.0 * seed, 1000.0 * seed, 10.0)
+        for day in range(30)
+    ]
+
+
+def same_series(found: dict, expected: dict):
+
+    assert found.keys() == expected.keys(), (found.keys(), expected.keys())
+    for CNPJ in expected:
+        for column, array in expected[CNPJ].items():
+            assert np.array_equal(found[CNPJ][column], array), (CNPJ, column)
+
+
+with tempfile.TemporaryDirectory() as directory:
+    data_base_name = os.path.join(directory, "cache.db")
+
+    SQL_DB = Write_to_SQLlite(data_base_name, layout="long")
+    SQL_DB._data_entry_funds({CNPJ: rows(int(CNPJ)) for CNPJ in FUNDS})
+    SQL_DB.close_connection()
+
+    reader = Read_from_SQLlite(data_base_name)
+    fund_bytes = _nbytes(reader.get_series(["11"], columns=VALUE_COLUMNS)["11"])
+    cache = Series_Cache(reader, max_bytes=int(2.5 * fund_bytes))
+
+    # "11" é o menos usado quando "33" é incluído: descartado no próprio lote
+    cache.get_series(["11"])
+    cache.get_series(["22"])
+    same_series(cache.get_series(["11", "33"]), reader.get_series(["11", "33"]))
+
+    for cnpjs, start, end in (
+        (["33", "11", "33"], None, None),
+        (["22", "11"], "2024-01-10", "2024-01-20"),
+        (None, "2024-01-25", None),
+    ):
+        same_series(
+            cache.get_series(cnpjs, start, end, VALUE_COLUMNS),
+            reader.get_series(cnpjs, start, end, VALUE_COLUMNS),
+        )
+
+    info = cache.cache_info()
+    assert info.nbytes <= cache.max_bytes, info
+    print(f"Séries iguais às da base de dados: {info}.")
+
+    reader.close_connection()
@@ -0,0 +1,154 @@
+import os
+import queue
+import threading
+import logging
+import logging.config
+from contextlib import contextmanager
+
+from BasePage import Base_page
+from CVM_WebPage import CVM_Page
+
+# Configura o display e salvamento de logs
+logging.config.fileConfig(
+    os.path.join(os.path.dirname(os.path.abspath(__file__)), "logging.conf"),
+    disable_existing_loggers=False,
+)
+logger = logging.getLogger("webpage")
+
+
+class Browser_Pool(object):
+    """Mantém browsers (webdrivers) abertos e aquecidos para serem reaproveitados entre fundos,
+    evitando o cold start do Chrome e do circuito do Tor a cada fundo.
+
+    - make_driver: função sem argumentos que cria um novo webdriver.
+    - size: número máximo de browsers abertos simultaneamente.
+    - max_uses: após max_uses fundos o browser é fechado e substituído por um novo.
+
+    Entre um fundo e outro a sessão é limpa (cookies apagados e navegação de volta para
+    Base_page.url). Um browser que apresentou erro, ou cuja sessão foi marcada como falha
+    (ex.: login não realizado), é descartado."""
+
+    def __init__(self, make_driver, size: int = 4, max_uses: int = 20):
+
+        self.make_driver = make_driver
+        self.size = size
+        self.max_uses = max_uses
+
+        # LIFO: reaproveita primeiro o browser usado mais recentemente (mais "quente")
+        self._idle = queue.LifoQueue()
+        self._uses = {}
+        self._created = 0
+        self._lock = threading.Lock()
+
+    def _new_driver(self):
+
+        driver = self.make_driver()
+        driver.get(Base_page.url)
+        self._uses[id(driver)] = 0
+
+        return driver
+
+    def warm_up(self, n: int = None):
+        """Abre n browsers (por padrão, size) e já os deixa na página de acesso da CVM."""
+
+        for _ in range(self.size if n is None else n):
+            with self._lock:
+                if self._created >= self.size:
+                    return
+                self._created += 1
+
+            try:
+                self._idle.put(self._new_driver())
+            except Exception:
+                with self._lock:
+                    self._created -= 1
+                raise
+
+    def acquire(self):
+        """Retorna um browser livre, criando um novo se o pool ainda não estiver cheio.
+        Caso contrário, aguarda até que um browser seja devolvido."""
+
+        try:
+            return self._idle.get_nowait()
+        except queue.Empty:
+            pass
+
+        with self._lock:
+            create = self._created < self.size
+            if create:
+                self._created += 1
+
+        if not create:
+            return self._idle.get()
+
+        try:
+            return self._new_driver()
+        except Exception:
+            with self._lock:
+                self._created -= 1
+            raise
+
+    def _discard(self, driver):
+
+        self._uses.pop(id(driver), None)
+        with self._lock:
+            self._created -= 1
+
+        try:
+            driver.quit()
+        except Exception:
+            logger.exception("Erro ao fechar o browser descartado pelo pool.")
+
+    def release(self, driver, error: bool = False):
+        """Devolve o browser ao pool. Descarta-o em caso de erro ou após max_uses usos;
+        do contrário, limpa a sessão para o próximo fundo."""
+
+        self._uses[id(driver)] = self._uses.get(id(driver), 0) + 1
+
+        if error or self._uses[id(driver)] >= self.max_uses:
+            self._discard(driver)
+            return
+
+        try:
+            driver.delete_all_cookies()
+            driver.get(Base_page.url)
+        except Exception:
+            logger.exception("Erro ao limpar a sessão do browser, descartando-o.")
+            self._discard(driver)
+            return
+
+        self._idle.put(driver)
+
+    @contextmanager
+    def session(self):
+        """Empresta um browser do pool já encapsulado num CVM_Page:
+
+        with pool.session() as CVM:
+            ...
+
+        Se o fluxo marcar a página como falha (CVM.failed = True, ex.: login não realizado
+        após max_tries tentativas), o browser é descartado como em caso de exceção: pode
+        estar travado e não deve voltar ao pool."""
+
+        driver = self.acquire()
+        CVM = CVM_Page(driver=driver)
+        CVM.failed = False
+
+        try:
+            yield CVM
+        except Exception:
+            self.release(driver, error=True)
+            raise
+        else:
+            self.release(driver, error=CVM.failed)
+
+    def close(self):
+        """Fecha todos os browsers ociosos do pool."""
+
+        while True:
+            try:
+                driver = self._idle.get_nowait()
+            except queue.Empty:
+                break
+
+            self._discard(driver)
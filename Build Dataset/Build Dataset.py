@@ -1,7 +1,14 @@
 import os
+import json
+import zipfile
+import hashlib
+import inspect
+import collections
+import multiprocessing
 import concurrent.futures
 import logging
 import logging.config
+import logging.handlers
 import sys
 
 sys.path.append(
@@ -12,40 +19,68 @@ import numpy as np
 from cv2 import cv2
 from Captcha_processor import captcha_interpreter, grab_digits, resize_to_fit
 
-"""Constrói o dataset que será empregado no treinamento da rede neural. Utiliza-se de 
-multi-threading para processar diversas imagens de forma concorrente.
+"""Constrói o dataset que será empregado no treinamento da rede neural. Processa diversas
+imagens de forma concorrente, com threads (POOL = "thread") ou processos (POOL = "process").
 
-ATENÇÃO Uso intensivo de memória (devido à construção da lista com arrays contendo cada um dos dígitos)
-caso o número de captchas seja muito grande, pode ser necessário rodar o script em bateladas
+O uso de memória não depende do número de captchas: os dígitos são gravados em shards de
+tamanho fixo à medida que as imagens são processadas, e os arquivos finais são montados a
+partir dos shards, um de cada vez.
+
+O build é incremental: o manifest.json da pasta Dataset Shards guarda, para cada imagem, o
+hash do arquivo, o label e a posição dos seus dígitos (shard, offset e count). Somente as
+imagens novas ou alteradas são processadas, gravadas em novos shards; as demais reutilizam
+os dígitos já gravados. Imagens cujo processamento gerou um erro (ex.: tesseract ausente)
+não entram no manifest e são processadas novamente no próximo build. O manifest também guarda
+a chave de versão do pré-processamento (hash do código do Captcha_processor, das funções de
+extração e da versão do OpenCV): se o código mudar, todas as imagens são processadas
+novamente. O mesmo ocorre com a opção --full, que também descarta os shards antigos:
+
+python3 "Build Dataset.py" [--full]
 
 1) Faz a leitura dos captchas com os dígitos já identificados na pasta Labeled Pictures.
 2) Para cada um dos arquivos da pasta, aplica os filtros e o script de controle de qualidade
-(captcha_interpreter) do módulo Captcha_processor.
-3) Caso a imagem processada tenha apresentado qualidade, isola cada um dos dígitos da imagem 
+(captcha_interpreter) do módulo Captcha_processor. As imagens são enviadas aos workers em
+lotes de CHUNK_SIZE arquivos, no máximo 2 x WORKERS lotes em processamento, e os resultados
+são lidos na ordem dos arquivos (dataset determinístico). Cada lote retorna os arrays uint8
+dos dígitos e dos labels.
+ - No modo "process", os filtros do OpenCV e as chamadas ao Tesseract não disputam o GIL.
+ Os logs dos processos são enviados ao processo principal por uma fila (QueueHandler) e
+ gravados pelos handlers do logging.conf (QueueListener).
+3) Caso a imagem processada tenha apresentado qualidade, isola cada um dos dígitos da imagem
 e redimensiona-os para o shape de array que irá alimentar a rede neural (28,28)
-4) Simultaneamente, salva na pasta Processed Digits os dígitos processados e compõe os arrays
-correspondentes aos dígitos processados e aos labels para estes dígitos.
-5) Ao final, salva o dataset em formato npz (array numpy), sendo um arquivo com cada um dos 
+4) Os dígitos e labels são copiados para um buffer pré-alocado de SHARD_SIZE dígitos (os
+dígitos de uma imagem ficam sempre num mesmo shard). Cada buffer cheio é salvo na pasta
+Dataset Shards (shard_00000.npz, ...), com os arrays pictures (uint8) e labels.
+5) Ao final, salva o dataset em formato npz (array numpy), sendo um arquivo com cada um dos
 dígitos processados (pictures_x_data.npz) e um outro (labels_y_data.npz) com cada um dos labels.
+Os arquivos têm o mesmo formato do np.savez, mas são gravados copiando um shard por vez, na
+ordem dos shards, somente com os dígitos das imagens presentes na pasta.
 
 Os arquivos pictures_x_data.npz e labels_y_data serão importados durante o treinamento da
 rede neural."""
 
-logging.config.fileConfig("logging.conf", disable_existing_loggers=False)
 logger = logging.getLogger("auxiliar")
 
-logger.info("Iniciando o tratamento das imagens.")
-
-path_to_pictures = "Labeled Pictures"
-path_processed_pictures = "Processed Digits"
-
-# Coletando a lista de imagens já identificadas e disponíveis no diretório
-list_of_pictures = (
-    entry.path for entry in os.scandir(path_to_pictures) if entry.name.endswith("png")
+path_to_pictures = os.path.join(
+    os.path.dirname(os.path.abspath(__file__)), "Labeled Pictures"
+)
+path_to_shards = os.path.join(
+    os.path.dirname(os.path.abspath(__file__)), "Dataset Shards"
 )
+path_to_manifest = os.path.join(path_to_shards, "manifest.json")
+
+# "thread" ou "process". Multithreading mostrou performace semelhante ao multiprocessing
+# em CPU com 4 cores; com mais cores, os processos escalam melhor.
+POOL = "process"
 
-if not os.path.isdir(path_processed_pictures):
-    os.mkdir(path_processed_pictures)
+# Número de workers, captchas por lote enviado a um processo e dígitos por shard
+# (28 x 28 bytes por dígito: ~3 MiB por shard)
+WORKERS = os.cpu_count() or 4
+CHUNK_SIZE = 16
+SHARD_SIZE = 4096
+# Número de dígitos das imagens cujo processamento gerou uma exceção (tesseract ausente,
+# erro de leitura...): não entram no manifest e são processadas novamente no próximo build
+FAILED = -1
 
 
 def _digits_extractor(picture: str):
@@ -75,31 +110,338 @@ def _digits_extractor(picture: str):
     return None
 
 
-images, labels = [], []
+def _extract_chunk(pictures: list):
+    """Processa um lote de captchas. Retorna os arrays uint8 dos dígitos (N x 28 x 28) e
+    dos labels (N) de todas as imagens do lote, na ordem dos arquivos, e o número de dígitos
+    de cada imagem: zero se a imagem foi descartada pelo controle de qualidade e FAILED se o
+    processamento gerou uma exceção."""
 
-#Multithreading mostrou performace semelhante ao multiprocessing em CPU com 4 cores
-#Optado pelo multithreading pela facilidade de logar.
-with concurrent.futures.ThreadPoolExecutor() as executor:
-    resultados = (executor.submit(_digits_extractor, pic) for pic in list_of_pictures)
+    digits, labels, counts = [], [], []
 
-    for f in concurrent.futures.as_completed(resultados):
-        
-        #Constrói uma lista com arrays correspondendo ao dígitos e 
-        # uma lista com cada um dos labels
+    for picture in pictures:
         try:
-            imagem, label = f.result()
-
-            images = images + imagem
-            labels = labels + label
+            result = _digits_extractor(picture)
         except Exception:
-            pass
+            logger.exception(f"Erro no processamento da imagem {picture}.")
+            counts.append(FAILED)
+            continue
+
+        if result is not None:
+            digits.extend(result[0])
+            labels.extend(result[1])
+
+        counts.append(0 if result is None else len(result[1]))
+
+    counts = np.array(counts, dtype=np.int8)
+    if not digits:
+        return (
+            np.empty((0, 28, 28), dtype=np.uint8),
+            np.empty(0, dtype=np.uint8),
+            counts,
+        )
+
+    return np.array(digits, dtype=np.uint8), np.array(labels, dtype=np.uint8), counts
+
+
+def preprocessing_version() -> str:
+    """Chave de versão do pré-processamento: hash do código do Captcha_processor, das funções
+    de extração deste script e da versão do OpenCV."""
+
+    version = hashlib.sha1()
+
+    with open(sys.modules[captcha_interpreter.__module__].__file__, "rb") as source:
+        version.update(source.read())
+    for function in (_digits_extractor, _extract_chunk):
+        version.update(inspect.getsource(function).encode())
+    version.update(cv2.__version__.encode())
+
+    return version.hexdigest()
+
+
+def _file_hash(path: str) -> str:
+
+    with open(path, "rb") as picture:
+        return hashlib.sha1(picture.read()).hexdigest()
+
+
+class _Dispatch(logging.Handler):
+    "Entrega cada log recebido dos processos ao logger de origem, no processo principal"
+
+    def emit(self, record):
+
+        name = None if record.name == "root" else record.name
+        logging.getLogger(name).handle(record)
+
+
+def _init_worker(log_queue):
+    """Inicialização de cada processo: todos os logs são enviados ao processo principal pela
+    fila, e o OpenCV usa uma única thread (o paralelismo vem dos processos)."""
+
+    cv2.setNumThreads(1)
+
+    for name in list(logging.root.manager.loggerDict):
+        logging.getLogger(name).handlers.clear()
+        logging.getLogger(name).propagate = True
+
+    logging.root.handlers = [logging.handlers.QueueHandler(log_queue)]
+    logging.root.setLevel(logging.INFO)
+
+
+class Shard_Writer(object):
+    """Grava os dígitos e labels em shards .npz de shard_size dígitos, a partir de um único
+    buffer pré-alocado.
+
+    - first: número do primeiro shard gravado (shards anteriores não são alterados)."""
+
+    def __init__(self, directory: str, first: int = 0, shard_size: int = SHARD_SIZE):
+
+        self.directory = directory
+        self.first = first
+        self.pictures = np.empty((shard_size, 28, 28), dtype=np.uint8)
+        self.labels = np.empty(shard_size, dtype=np.int64)
+        self.count = 0
+        self.shards = []
+
+        if not os.path.isdir(directory):
+            os.mkdir(directory)
+
+    @property
+    def current(self) -> str:
+        "Nome do shard do buffer"
+
+        return f"shard_{self.first + len(self.shards):05d}.npz"
+
+    def add(self, digits: np.ndarray, labels: np.ndarray) -> tuple:
+        """Copia os dígitos de uma imagem para o buffer, sem dividi-los entre dois shards.
+        Retorna a tupla (shard, posição do primeiro dígito no shard)."""
+
+        n = len(labels)
+        if self.count + n > len(self.labels):
+            self.flush()
+
+        shard, offset = self.current, self.count
+        self.pictures[offset : offset + n] = digits
+        self.labels[offset : offset + n] = labels
+        self.count += n
+
+        if self.count == len(self.labels):
+            self.flush()
+
+        return shard, offset
+
+    def flush(self):
+        "Salva os dígitos do buffer num novo shard"
+
+        if self.count == 0:
+            return None
+
+        np.savez(
+            os.path.join(self.directory, self.current),
+            pictures=self.pictures[: self.count],
+            labels=self.labels[: self.count],
+        )
+
+        self.shards.append({"file": self.current, "count": self.count})
+        self.count = 0
+
+
+def save_from_shards(file_name: str, segments: list, key: str):
+    """Grava o array key dos trechos de shards (segments, tuplas (shard, offset, count) em
+    ordem de shard) num único arquivo .npz, no mesmo formato do np.savez (array arr_0),
+    lendo um shard por vez."""
+
+    total = sum(count for _, _, count in segments)
+
+    with np.load(os.path.join(path_to_shards, segments[0][0])) as first:
+        dtype, shape = first[key].dtype, first[key].shape[1:]
+
+    header = {
+        "descr": np.lib.format.dtype_to_descr(dtype),
+        "fortran_order": False,
+        "shape": (total,) + shape,
+    }
+
+    with zipfile.ZipFile(file_name, "w", zipfile.ZIP_STORED, allowZip64=True) as npz:
+        with npz.open("arr_0.npy", "w", force_zip64=True) as npy:
+            np.lib.format.write_array_header_1_0(npy, header)
+
+            loaded_shard, array = None, None
+            for shard, offset, count in segments:
+                if shard != loaded_shard:
+                    with np.load(os.path.join(path_to_shards, shard)) as saved:
+                        loaded_shard, array = shard, saved[key]
+
+                npy.write(
+                    np.ascontiguousarray(
+                        array[offset : offset + count], dtype=dtype
+                    ).tobytes()
+                )
+
+
+def _load_manifest(version: str, full: bool) -> dict:
+    """Manifest do último build. Se full, ou se a versão do pré-processamento mudou, retorna
+    um manifest vazio e apaga os shards antigos."""
+
+    manifest = None
+    if not full and os.path.isfile(path_to_manifest):
+        with open(path_to_manifest) as json_file:
+            manifest = json.load(json_file)
+
+        if manifest["version"] != version:
+            logger.info(
+                "Pré-processamento alterado: todas as imagens serão processadas."
+            )
+            manifest = None
+
+    if manifest is None:
+        if os.path.isdir(path_to_shards):
+            for entry in os.scandir(path_to_shards):
+                if entry.name.startswith("shard_"):
+                    os.remove(entry.path)
+
+        manifest = {"version": version, "shards": [], "images": {}}
+
+    return manifest
+
+
+def _save_manifest(manifest: dict):
+    "Gravado após os shards: um build interrompido é refeito a partir do anterior"
+
+    with open(path_to_manifest + ".tmp", "w") as json_file:
+        json.dump(manifest, json_file, indent=1)
+    os.replace(path_to_manifest + ".tmp", path_to_manifest)
+
+
+def build_dataset(pool: str = POOL, workers: int = WORKERS, full: bool = False):
+    """Processa as imagens novas ou alteradas da pasta Labeled Pictures e atualiza o
+    manifest. Retorna o manifest, com as imagens presentes na pasta."""
+
+    manifest = _load_manifest(preprocessing_version(), full)
+
+    # Imagens já processadas, pelo conteúdo e label (uma imagem renomeada é reutilizada)
+    processed = {
+        (image["sha1"], image["label"]): image for image in manifest["images"].values()
+    }
+
+    # Coletando a lista de imagens já identificadas e disponíveis no diretório
+    images, list_of_pictures = {}, []
+    for entry in sorted(os.scandir(path_to_pictures), key=lambda entry: entry.name):
+        if not entry.name.endswith("png"):
+            continue
+
+        sha1, label = _file_hash(entry.path), entry.name.split(".")[0]
+        if (sha1, label) in processed:
+            images[entry.name] = processed[(sha1, label)]
+        else:
+            images[entry.name] = {"sha1": sha1, "label": label}
+            list_of_pictures.append(entry.path)
+
+    logger.info(
+        f"{len(list_of_pictures)} imagens novas ou alteradas, "
+        f"{len(images) - len(list_of_pictures)} reutilizadas."
+    )
+
+    # Threads processam uma imagem por vez; processos, lotes de CHUNK_SIZE imagens
+    chunk_size = CHUNK_SIZE if pool == "process" else 1
+    chunks = [
+        list_of_pictures[index : index + chunk_size]
+        for index in range(0, len(list_of_pictures), chunk_size)
+    ]
+
+    writer = Shard_Writer(path_to_shards, first=len(manifest["shards"]))
+
+    failed = []
+
+    def _collect(chunk, result):
+        "Copia os dígitos de cada imagem do lote para o shard corrente"
+
+        digits, labels, counts = result
+        starts = np.concatenate([[0], np.cumsum(np.maximum(counts, 0), dtype=np.intp)])
+
+        for picture, start, count in zip(chunk, starts, counts.tolist()):
+            if count == FAILED:
+                del images[os.path.basename(picture)]
+                failed.append(picture)
+                continue
+
+            image = images[os.path.basename(picture)]
+            image.update(shard=None, offset=0, count=count)
+
+            if count:
+                image["shard"], image["offset"] = writer.add(
+                    digits[start : start + count], labels[start : start + count]
+                )
+
+    listener = None
+
+    if pool == "process":
+        log_queue = multiprocessing.Queue()
+        listener = logging.handlers.QueueListener(log_queue, _Dispatch())
+        listener.start()
+
+        executor = concurrent.futures.ProcessPoolExecutor(
+            workers, initializer=_init_worker, initargs=(log_queue,)
+        )
+    else:
+        executor = concurrent.futures.ThreadPoolExecutor(workers)
+
+    try:
+        with executor:
+            pending = collections.deque()
+
+            for chunk in chunks:
+                pending.append((chunk, executor.submit(_extract_chunk, chunk)))
+
+                # Limita os lotes em processamento, lendo os resultados na ordem dos arquivos
+                if len(pending) >= 2 * workers:
+                    chunk, future = pending.popleft()
+                    _collect(chunk, future.result())
+
+            while pending:
+                chunk, future = pending.popleft()
+                _collect(chunk, future.result())
+    finally:
+        if listener is not None:
+            listener.stop()
+
+    writer.flush()
+
+    if failed:
+        logger.warning(
+            f"{len(failed)} imagens com erro de processamento: serão processadas novamente "
+            "no próximo build."
+        )
+
+    manifest["shards"] += writer.shards
+    manifest["images"] = images
+    _save_manifest(manifest)
+
+    return manifest
+
+
+if __name__ == "__main__":
+
+    logging.config.fileConfig("logging.conf", disable_existing_loggers=False)
+
+    logger.info(f"Iniciando o tratamento das imagens ({POOL}, {WORKERS} workers).")
+
+    manifest = build_dataset(full="--full" in sys.argv)
+
+    # Dígitos das imagens presentes na pasta, na ordem dos shards
+    segments = sorted(
+        (image["shard"], image["offset"], image["count"])
+        for image in manifest["images"].values()
+        if image["count"]
+    )
 
-# Convertendo as imagens e labels para array numpy
-images = np.array(images)
-labels = np.array(labels)
+    if not segments:
+        raise SystemExit("Nenhum captcha pôde ser processado.")
 
-# Salvando as imagens e labels em arquivo npz para posterior uso na rede neural
-np.savez("pictures_x_data", images)
-np.savez("labels_y_data", labels)
+    # Salvando as imagens e labels em arquivo npz para posterior uso na rede neural
+    save_from_shards("pictures_x_data.npz", segments, "pictures")
+    save_from_shards("labels_y_data.npz", segments, "labels")
 
-logger.info("Tratamento das imagens concluído.")
+    logger.info(
+        f"Tratamento das imagens concluído: {sum(count for _, _, count in segments)} "
+        f"dígitos de {len(manifest['images'])} imagens."
+    )
@@ -2,13 +2,21 @@ import os
 import sys
 import re
 import time
+import hashlib
+import threading
 import subprocess
+import concurrent.futures
 
 import requests
-from stem import Signal
-from stem.control import Controller
+import requests.adapters
 
-args = ["-h", "-n", "-s"]
+try:
+    from stem import Signal
+    from stem.control import Controller
+except ImportError:
+    Controller = None
+
+args = ["-h", "-n", "-s", "-c", "-r"]
 error_msg = """\nVocê utilizou opções indisponíveis ou na sequência incorreta!\n """
 
 number_of_files = None
@@ -19,8 +27,10 @@ def program_overview():
     -h -> Overview sobre o funcionamento.
     -n:number -> número de captchas que serão salvos na pasta (number > 0).
     -s:folder_name -> Salva as imagens na pasta folder_name. Cria a pasta caso não exita.
+    -c:workers -> Modo concorrente: número de downloads simultâneos (workers > 0).
+    -r:rate -> Modo concorrente: máximo de requisições por segundo (padrão: sem limite).
     
-    Exemplo das 3 possibilidades de execução no terminal: 
+    Exemplo das 4 possibilidades de execução no terminal: 
      1) python3 {__file__} -h 
      [para ajuda]
      
@@ -28,7 +38,10 @@ def program_overview():
      [Coleta 1000 captchas e salva na pasta Pictures]
 
      3) python3 {__file__} -n:10
-     [Coleta 10 captchas e salva no subdiretório (default) 'Dataset Pictures'] """
+     [Coleta 10 captchas e salva no subdiretório (default) 'Dataset Pictures']
+
+     4) python3 {__file__} -n:1000 -s:Pictures -c:8 -r:4
+     [Coleta 1000 captchas com 8 downloads simultâneos, no máximo 4 requisições por segundo] """
 
     print(error_msg)
     print(options)
@@ -57,13 +70,22 @@ def helper():
 
     Caso não seja fornecido local específico para salvar os arquivos, cria o subdiretório Dataset Pictures.
     Realiza o log dos eventos do download no arquivo log_download_captchas.txt e mesmo diretório em que o
-    script está salvo.\n"""
+    script está salvo.
+
+    Modo concorrente (opções -c e -r): uma única sessão HTTP, com pool de conexões, é compartilhada
+    por -c:workers downloads simultâneos, limitados a -r:rate requisições por segundo (token bucket).
+    O download é retomado a partir dos arquivos da pasta: a numeração continua do maior Picture_i.png
+    existente e imagens repetidas (mesmo hash de conteúdo) são descartadas. São coletados -n:number
+    captchas novos.\n"""
 
     print(ajuda)
     raise SystemExit
 
 
 def renew_tor_ip():
+    if Controller is None:
+        raise ImportError("O pacote stem é necessário para a rotação de proxy do tor.")
+
     with Controller.from_port(port=9051) as controller:
         controller.authenticate(password="jarvis")
         controller.signal(Signal.NEWNYM)
@@ -77,9 +99,9 @@ def tor_check():
     return checker.returncode
 
 
-def progress_bar(n, elapsed_time):
+def progress_bar(n, elapsed_time, total=None):
 
-    total = int(number_of_files)
+    total = int(total or number_of_files)
     width = 50
     percent = n / total
     left = int(width * percent)
@@ -99,88 +121,338 @@ def progress_bar(n, elapsed_time):
     )
 
 
-try:
-    pattern = re.compile(r"-n:(\d+)")
-    candidates = pattern.search(sys.argv[1])
-
-    if candidates:
-        number_of_files = candidates.group().split(":")[1]
-
-except IndexError:
-    program_overview()
-
-
-try:
-    pattern_dir = re.compile(r"-s:(\w+)")
-    candidates_dir = pattern_dir.search(sys.argv[2])
-
-    if candidates_dir:
-        destin_dir = candidates_dir.group().split(":")[1]
-    else:
-        destin_dir = "Dataset Pictures"
-
-except IndexError:
-    destin_dir = "Dataset Pictures"
+class Token_Bucket(object):
+    """Limita a taxa de requisições: até rate requisições por segundo, com rajadas de no
+    máximo capacity requisições. Compartilhado entre as threads."""
+
+    def __init__(self, rate: float, capacity: float = None):
+
+        self.rate = rate
+        self.capacity = capacity or max(1.0, rate)
+        self.tokens = self.capacity
+        self.timestamp = time.monotonic()
+        self.lock = threading.Lock()
+
+    def acquire(self):
+        "Bloqueia até que uma requisição seja permitida"
+
+        while True:
+            with self.lock:
+                now = time.monotonic()
+                self.tokens = min(
+                    self.capacity, self.tokens + (now - self.timestamp) * self.rate
+                )
+                self.timestamp = now
+
+                if self.tokens >= 1:
+                    self.tokens -= 1
+                    return None
+
+                wait = (1 - self.tokens) / self.rate
+
+            time.sleep(wait)
+
+
+def pooled_session(pool_size: int, proxies: dict = None) -> requests.Session:
+    "Sessão com pool de pool_size conexões reaproveitadas entre os requests"
+
+    session = requests.Session()
+    adapter = requests.adapters.HTTPAdapter(pool_connections=1, pool_maxsize=pool_size)
+    session.mount("http://", adapter)
+    session.mount("https://", adapter)
+
+    if proxies:
+        session.proxies.update(proxies)
+
+    return session
+
+
+def existing_pictures(path: str) -> tuple:
+    """Maior índice dos arquivos Picture_i.png da pasta e o conjunto dos hashes (sha1) do
+    conteúdo das imagens já salvas."""
+
+    pattern = re.compile(r"Picture_(\d+)\.png$")
+    last_index, hashes = 0, set()
+
+    for entry in os.scandir(path):
+        picture = pattern.match(entry.name)
+        if picture is None:
+            continue
+
+        last_index = max(last_index, int(picture.group(1)))
+        with open(entry.path, "rb") as f:
+            hashes.add(hashlib.sha1(f.read()).hexdigest())
+
+    return last_index, hashes
+
+
+def download_captchas(
+    url: str,
+    number: int,
+    path: str,
+    workers: int = 8,
+    rate: float = None,
+    proxies: dict = None,
+    renew=renew_tor_ip,
+    backoff: float = 10,
+    max_errors: int = 20,
+    max_duplicates: int = 100,
+    log=None,
+    progress=None,
+) -> tuple:
+    """Definição:
+     - url: endereço que retorna um captcha por requisição.
+     - number: número de captchas novos a serem salvos em path.
+     - workers: downloads simultâneos (threads e conexões do pool).
+     - rate: máximo de requisições por segundo. Se None, sem limite.
+     - proxies: proxies da sessão (tor).
+     - renew: chamada após um erro (rotação de proxy); backoff: espera após o erro, em s.
+     - max_errors: número máximo de rotações antes de interromper o download.
+     - max_duplicates: número máximo de captchas repetidos consecutivos antes de interromper
+     o download.
+     - log: arquivo de log dos eventos; progress: função progress_bar (opcional).
+
+     Os erros das requisições feitas com um mesmo circuito contam como uma única falha: a
+     primeira thread a falhar pausa todas as demais, faz a rotação e aguarda o backoff; as
+     requisições que falharem nesse meio tempo apenas aguardam o novo circuito.
+
+     Os arquivos são numerados a partir do maior Picture_i.png de path e as imagens com
+     hash já existente na pasta são descartadas. Retorna a tupla (captchas salvos,
+     duplicados descartados)."""
+
+    last_index, hashes = existing_pictures(path)
+    bucket = Token_Bucket(rate) if rate else None
+    lock = threading.Lock()
+    state = {
+        "index": last_index,
+        "saved": 0,
+        "duplicates": 0,
+        "consecutive_duplicates": 0,
+        "errors": 0,
+        "circuit": 0,
+        "renewing": False,
+    }
+    start = time.perf_counter()
+
+    # Liberado enquanto não há rotação em andamento: as threads aguardam antes de cada request
+    circuit_ready = threading.Event()
+    circuit_ready.set()
+
+    def _finished() -> bool:
+
+        return (
+            state["saved"] >= number
+            or state["errors"] > max_errors
+            or state["consecutive_duplicates"] > max_duplicates
+        )
 
+    def _renew_circuit():
+        "Executada por uma única thread por falha, com as demais pausadas"
 
-if len(sys.argv) == 2 and sys.argv[1] == args[0]:
-    helper()
+        try:
+            if renew is not None:
+                renew()
+        except Exception as renew_error:
+            print("Erro na rotação de proxy: ", renew_error, file=log)
 
-elif number_of_files:
-    url = "https://cvmweb.cvm.gov.br/SWB/Sistemas/SCW/CPublica/RandomTxt.aspx"
-    proxies = {"http": "socks5h://127.0.0.1:9050", "https": "socks5h://127.0.0.1:9050"}
+        time.sleep(backoff)
 
-    if tor_check():
-        print(
-            "\nO TOR não está ouvindo nas portas 9050 e 9051. Favor instanciar o TOR.",
-            flush=True,
-        )
-        raise SystemExit
+        with lock:
+            state["circuit"] += 1
+            state["renewing"] = False
+        circuit_ready.set()
 
-    if not os.path.isdir(destin_dir):
-        os.mkdir(destin_dir)
+    def _worker(session):
 
-    path = os.path.join(os.getcwd(), destin_dir)
+        while True:
+            circuit_ready.wait()
 
-    loop_breaker = 0
-    with open("log_download_captchas.txt", "w") as file_object:
-        print("Log de Eventos salvo em arquivo. Evolução do download abaixo:\n")
-        for i in range(1, int(number_of_files) + 1):
+            with lock:
+                if _finished():
+                    return None
+                circuit = state["circuit"]
 
-            if loop_breaker > 20:
-                print("Número máximo de rotações de iP excedido.", file=file_object)
-                break
+            if bucket is not None:
+                bucket.acquire()
 
             try:
-                start = time.perf_counter()
-                site = requests.get(url, timeout=6, proxies=proxies)
-                file_name = os.path.join(path, f"Picture_{i}.png")
+                site = session.get(url, timeout=6)
 
-                if site.status_code == 200:
+                if site.status_code != 200:
+                    raise requests.HTTPError(
+                        f"Erro na requisição do site. Status code: {site.status_code}"
+                    )
 
-                    with open(file_name, "wb") as f:
-                        f.write(site.content)
+            except Exception as other_error:
+                # Somente a primeira falha do circuito corrente faz a rotação
+                with lock:
+                    renewer = state["circuit"] == circuit and not state["renewing"]
+                    if renewer:
+                        state["renewing"] = True
+                        state["errors"] += 1
+                        circuit_ready.clear()
+
+                if renewer:
+                    print("Ocorreu o seguinte erro: ", other_error, file=log)
+                    _renew_circuit()
+                continue
+
+            digest = hashlib.sha1(site.content).hexdigest()
+            with lock:
+                if state["saved"] >= number:
+                    return None
+
+                if digest in hashes:
+                    state["duplicates"] += 1
+                    state["consecutive_duplicates"] += 1
+                    print(f"Captcha repetido descartado ({digest}).", file=log)
+                    continue
+
+                hashes.add(digest)
+                state["consecutive_duplicates"] = 0
+                state["index"] += 1
+                state["saved"] += 1
+                index, saved = state["index"], state["saved"]
+
+            file_name = os.path.join(path, f"Picture_{index}.png")
+            with open(file_name, "wb") as f:
+                f.write(site.content)
+            print(f"Realizado o download: {file_name} com sucesso.", file=log)
+
+            if progress is not None:
+                progress(saved, (time.perf_counter() - start) / saved, total=number)
+
+    with pooled_session(workers, proxies) as session:
+        with concurrent.futures.ThreadPoolExecutor(workers) as executor:
+            for future in [executor.submit(_worker, session) for _ in range(workers)]:
+                future.result()
+
+    if state["errors"] > max_errors:
+        print("Número máximo de rotações de iP excedido.", file=log)
+    if state["consecutive_duplicates"] > max_duplicates:
+        print("Número máximo de captchas repetidos consecutivos excedido.", file=log)
+
+    return state["saved"], state["duplicates"]
+
+
+if __name__ == "__main__":
+
+    try:
+        pattern = re.compile(r"-n:(\d+)")
+        candidates = pattern.search(sys.argv[1])
+
+        if candidates:
+            number_of_files = candidates.group().split(":")[1]
+
+    except IndexError:
+        program_overview()
+
+    try:
+        pattern_dir = re.compile(r"-s:(\w+)")
+        candidates_dir = pattern_dir.search(sys.argv[2])
+
+        if candidates_dir:
+            destin_dir = candidates_dir.group().split(":")[1]
+        else:
+            destin_dir = "Dataset Pictures"
+
+    except IndexError:
+        destin_dir = "Dataset Pictures"
+
+    # Opções do modo concorrente, em qualquer posição após -n
+    workers, rate = None, None
+    for option in sys.argv[2:]:
+        candidates_workers = re.fullmatch(r"-c:(\d+)", option)
+        candidates_rate = re.fullmatch(r"-r:(\d+(?:\.\d+)?)", option)
+
+        if candidates_workers and int(candidates_workers.group(1)) > 0:
+            workers = int(candidates_workers.group(1))
+        elif candidates_rate and float(candidates_rate.group(1)) > 0:
+            rate = float(candidates_rate.group(1))
+        elif option.startswith(("-c", "-r")):
+            program_overview()
+
+    if len(sys.argv) == 2 and sys.argv[1] == args[0]:
+        helper()
+
+    elif number_of_files:
+        url = "https://cvmweb.cvm.gov.br/SWB/Sistemas/SCW/CPublica/RandomTxt.aspx"
+        proxies = {
+            "http": "socks5h://127.0.0.1:9050",
+            "https": "socks5h://127.0.0.1:9050",
+        }
+
+        if tor_check():
+            print(
+                "\nO TOR não está ouvindo nas portas 9050 e 9051. Favor instanciar o TOR.",
+                flush=True,
+            )
+            raise SystemExit
+
+        if not os.path.isdir(destin_dir):
+            os.mkdir(destin_dir)
+
+        path = os.path.join(os.getcwd(), destin_dir)
+
+        loop_breaker = 0
+        with open("log_download_captchas.txt", "w") as file_object:
+            print("Log de Eventos salvo em arquivo. Evolução do download abaixo:\n")
+
+            if workers or rate:
+                saved, duplicates = download_captchas(
+                    url,
+                    int(number_of_files),
+                    path,
+                    workers=workers or 8,
+                    rate=rate,
+                    proxies=proxies,
+                    log=file_object,
+                    progress=progress_bar,
+                )
+                print(f"\n{saved} captchas salvos, {duplicates} repetidos descartados.")
+
+            else:
+                for i in range(1, int(number_of_files) + 1):
+
+                    if loop_breaker > 20:
                         print(
-                            f"Realizado o download: {file_name} com sucesso.",
+                            "Número máximo de rotações de iP excedido.",
                             file=file_object,
                         )
+                        break
+
+                    try:
+                        start = time.perf_counter()
+                        site = requests.get(url, timeout=6, proxies=proxies)
+                        file_name = os.path.join(path, f"Picture_{i}.png")
+
+                        if site.status_code == 200:
+
+                            with open(file_name, "wb") as f:
+                                f.write(site.content)
+                                print(
+                                    f"Realizado o download: {file_name} com sucesso.",
+                                    file=file_object,
+                                )
+
+                            progress_bar(i, elapsed_time=(time.perf_counter() - start))
+
+                        else:
+                            print(
+                                f"Erro na requisição do site. Status code: {site.status_code}",
+                                file=file_object,
+                            )
+                            renew_tor_ip()
+                            time.sleep(10)
+                            loop_breaker += 1
+
+                    except Exception as other_error:
+                        print(
+                            "Ocorreu o seguinte erro: ", other_error, file=file_object
+                        )
+                        renew_tor_ip()
+                        time.sleep(10)
+                        loop_breaker += 1
 
-                    progress_bar(i, elapsed_time=(time.perf_counter() - start))
-
-                else:
-                    print(
-                        f"Erro na requisição do site. Status code: {site.status_code}",
-                        file=file_object,
-                    )
-                    renew_tor_ip()
-                    time.sleep(10)
-                    loop_breaker += 1
-
-            except Exception as other_error:
-                print("Ocorreu o seguinte erro: ", other_error, file=file_object)
-                renew_tor_ip()
-                time.sleep(10)
-                loop_breaker += 1
-
-else:
-    program_overview()
+    else:
+        program_overview()
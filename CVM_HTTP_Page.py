@@ -0,0 +1,326 @@
+import os
+import re
+import logging
+import logging.config
+from urllib.parse import urljoin
+from concurrent.futures import ThreadPoolExecutor
+
+import requests
+from requests.adapters import HTTPAdapter
+from bs4 import BeautifulSoup
+
+from BasePage import Base_page
+
+# Configura o display e salvamento de logs
+logging.config.fileConfig(
+    os.path.join(os.path.dirname(os.path.abspath(__file__)), "logging.conf"),
+    disable_existing_loggers=False,
+)
+logger = logging.getLogger("webpage")
+
+# Links do ASP.NET no formato javascript:__doPostBack('alvo','argumento')
+_POSTBACK = re.compile(r"__doPostBack\('([^']*)','([^']*)'\)")
+
+
+def parse_page(html: str):
+
+    return BeautifulSoup(html, "lxml")
+
+
+def form_data(soup, submit: str = None) -> dict:
+    """Coleta os campos do formulário da página, inclusive os ocultos (__VIEWSTATE,
+    __EVENTVALIDATION, ...). Botões só são enviados se forem o submit."""
+
+    form = soup.find("form")
+    data = {}
+
+    for field in form.find_all("input"):
+        name = field.get("name")
+        field_type = field.get("type", "text").lower()
+
+        if name is None or field_type in ("image", "reset", "button", "file"):
+            continue
+        if field_type == "submit" and name != submit:
+            continue
+        if field_type in ("checkbox", "radio") and not field.has_attr("checked"):
+            continue
+
+        data[name] = field.get("value", "")
+
+    for select in form.find_all("select"):
+        option = select.find("option", selected=True) or select.find("option")
+        if select.get("name") and option is not None:
+            data[select["name"]] = option.get("value", option.text)
+
+    return data
+
+
+def form_action(soup, page_url: str) -> str:
+
+    form = soup.find("form")
+
+    return urljoin(page_url, form.get("action") or page_url)
+
+
+def postback_data(soup, event_target: str, event_argument: str = "", **fields):
+    """Campos enviados pelo __doPostBack do ASP.NET."""
+
+    data = form_data(soup)
+    data.update(fields)
+    data["__EVENTTARGET"] = event_target
+    data["__EVENTARGUMENT"] = event_argument
+
+    return data
+
+
+def link_target(soup, link, page_url: str):
+    """Destino de um link <a>: ("GET", url) para hrefs comuns ou ("POST", url, dados)
+    para links __doPostBack."""
+
+    href = link.get("href", "")
+    postback = _POSTBACK.search(href)
+
+    if postback:
+        return (
+            "POST",
+            form_action(soup, page_url),
+            postback_data(soup, *postback.groups()),
+        )
+
+    return ("GET", urljoin(page_url, href), None)
+
+
+def frame_url(soup, page_url: str) -> str:
+    """Url do frame principal (name="Main") da página de acesso."""
+
+    frame = soup.find(["frame", "iframe"], attrs={"name": "Main"})
+    if frame is None:
+        logger.error("Frame não existe na página principal da CVM")
+        return None
+
+    return urljoin(page_url, frame["src"])
+
+
+def captcha_url(soup, page_url: str) -> str:
+
+    img = soup.find("img")
+    if img is None:
+        logger.error("Captcha não disponível")
+        return None
+
+    return urljoin(page_url, img["src"])
+
+
+def log_in_data(soup, CNPJ: str, captcha: str) -> dict:
+
+    data = form_data(soup, submit="btnContinuar")
+    data["txtCNPJNome"] = CNPJ
+    data["numRandom"] = captcha
+
+    return data
+
+
+def fund_link(soup, CNPJ: str):
+
+    return soup.find("a", string=lambda text: text and CNPJ in text)
+
+
+def months_available(soup) -> str:
+    """Meses do picklist ddComptc, um por linha (mesmo formato do texto do elemento
+    no browser)."""
+
+    select = soup.find("select", id="ddComptc")
+    if select is None:
+        logger.error("Os picklist de meses não estava disponível.")
+        return ""
+
+    return "\n".join(option.text.strip() for option in select.find_all("option"))
+
+
+def pick_month_data(soup, month_year: str) -> dict:
+    """Campos do postback que seleciona o mês no picklist ddComptc."""
+
+    select = soup.find("select", id="ddComptc")
+    option = select.find(
+        "option", string=lambda text: text and text.strip() == month_year
+    )
+
+    name = select.get("name", "ddComptc")
+
+    return postback_data(soup, name, **{name: option.get("value", month_year)})
+
+
+def table_html(soup) -> str:
+    """innerHTML da tabela dgDocDiario, como o BaseElements.fetch_data."""
+
+    table = soup.find("table", id="dgDocDiario")
+    if table is None:
+        logger.error("Houve mudança no código fonte do site - tabela de dados mensais")
+        return None
+
+    return "".join(str(element) for element in table.contents)
+
+
+def make_adapter(pool_maxsize: int = 10, max_retries: int = 2) -> HTTPAdapter:
+    """Cria um HTTPAdapter (pool de conexões) que pode ser compartilhado entre várias
+    instâncias de CVM_HTTP_Page, cada uma com seus próprios cookies. O adapter compartilhado
+    não é fechado pelas páginas: feche-o (adapter.close()) ao final da coleta."""
+
+    return HTTPAdapter(
+        pool_connections=pool_maxsize,
+        pool_maxsize=pool_maxsize,
+        max_retries=max_retries,
+    )
+
+
+class CVM_HTTP_Page(object):
+    """Alternativa ao CVM_Page sem browser: reproduz, com requests, os mesmos passos
+    (frame principal, captcha, login com CNPJ e numRandom, Hyperlink2, ddComptc e a tabela
+    dgDocDiario), enviando os formulários ASP.NET com o __VIEWSTATE de cada página.
+
+    - adapter: HTTPAdapter compartilhado (ver make_adapter), mantido aberto pelo close(). Se
+    None, cria um novo, fechado junto com a sessão.
+    - proxies: proxies no formato do requests, ex.: {"https": "socks5h://127.0.0.1:9050"}.
+
+    Pode ser usada como context manager, fechando a sessão ao final."""
+
+    url = Base_page.url
+
+    def __init__(self, adapter: HTTPAdapter = None, proxies=None, timeout: int = 30):
+
+        self.session = requests.Session()
+        self.shared_adapter = adapter is not None
+        adapter = adapter if adapter is not None else make_adapter()
+        self.session.mount("https://", adapter)
+        self.session.mount("http://", adapter)
+
+        if proxies:
+            self.session.proxies.update(proxies)
+
+        self.timeout = timeout
+
+        # Página corrente: url e html parseado
+        self.page_url = None
+        self.soup = None
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
+
+    def _load(self, response: requests.Response):
+
+        response.raise_for_status()
+
+        self.page_url = response.url
+        self.soup = parse_page(response.text)
+
+        return self.soup
+
+    def _get(self, url: str):
+
+        return self._load(self.session.get(url, timeout=self.timeout))
+
+    def _post(self, url: str, data: dict):
+
+        return self._load(self.session.post(url, data=data, timeout=self.timeout))
+
+    def _follow(self, link):
+        """Segue um link <a>, seja ele um href comum ou um __doPostBack."""
+
+        method, url, data = link_target(self.soup, link, self.page_url)
+
+        return self._post(url, data) if method == "POST" else self._get(url)
+
+    def go(self):
+        """Carrega a página de acesso e, em seguida, o frame principal (name="Main")."""
+
+        self._get(self.url)
+
+        url = frame_url(self.soup, self.page_url)
+        if url is not None:
+            self._get(url)
+
+    def grab_captcha(self) -> bytes:
+        """Baixa, na mesma sessão, a imagem do captcha exibida na página de acesso."""
+
+        url = captcha_url(self.soup, self.page_url)
+        if url is None:
+            return None
+
+        response = self.session.get(url, timeout=self.timeout)
+        response.raise_for_status()
+
+        return response.content
+
+    def ask_new_captcha(self):
+
+        link = self.soup.find("a", id="lkNovoRandom")
+        if link is not None:
+            self._follow(link)
+        else:
+            self.go()
+
+    def log_in(self, CNPJ: str, captcha: str) -> bool:
+        """Envia o CNPJ e o captcha interpretado. Retorna True caso o fundo esteja presente
+        na página de resposta."""
+
+        self._post(
+            form_action(self.soup, self.page_url), log_in_data(self.soup, CNPJ, captcha)
+        )
+
+        return fund_link(self.soup, CNPJ) is not None
+
+    def select_fund(self, CNPJ: str):
+
+        self._follow(fund_link(self.soup, CNPJ))
+
+    def go_to_tables(self):
+
+        self._follow(self.soup.find("a", id="Hyperlink2"))
+
+    def months_available(self) -> str:
+
+        return months_available(self.soup)
+
+    def pick_month(self, month_year: str):
+        """Seleciona o mês no picklist ddComptc, disparando o postback da página."""
+
+        self._post(
+            form_action(self.soup, self.page_url),
+            pick_month_data(self.soup, month_year),
+        )
+
+    def fetch_data(self) -> str:
+
+        return table_html(self.soup)
+
+    def fetch_months(self, months: list, max_parallel: int = 4) -> list:
+        """Coleta as tabelas de vários meses com postbacks simultâneos, todos a partir da
+        página de dados diários corrente (mesmos cookies e __VIEWSTATE). A página corrente
+        não é alterada. Retorna a lista de tuplas (mês, tabela html) na ordem de months."""
+
+        action = form_action(self.soup, self.page_url)
+        forms = [pick_month_data(self.soup, month) for month in months]
+
+        def fetch(data: dict) -> str:
+            response = self.session.post(action, data=data, timeout=self.timeout)
+            response.raise_for_status()
+
+            return table_html(parse_page(response.text))
+
+        if max_parallel <= 1 or len(forms) <= 1:
+            return list(zip(months, map(fetch, forms)))
+
+        with ThreadPoolExecutor(max_workers=min(max_parallel, len(forms))) as executor:
+            return list(zip(months, executor.map(fetch, forms)))
+
+    def close(self):
+        """Fecha a sessão. O adapter compartilhado é desmontado antes, para que as conexões
+        do pool continuem disponíveis para as demais páginas."""
+
+        if self.shared_adapter:
+            self.session.adapters.clear()
+
+        self.session.close()
@@ -0,0 +1,275 @@
+"""Motor de inferência em NumPy para a rede neural salva em Captcha_model.h5.
+
+Dispensa o TensorFlow: os pesos das camadas convolucionais e densas são lidos
+diretamente do arquivo .h5 (via h5py) e o forward pass é executado com NumPy vetorizado.
+
+ 1) load_numpy_model: lê a arquitetura (model_config) e os pesos do arquivo .h5 e
+ retorna um Numpy_Captcha_Model.
+
+ 2) Numpy_Captcha_Model.predict: mesmo contrato do model.predict do Keras, recebe os dígitos
+ no shape (n x 28 x 28 x 1) e retorna as probabilidades (softmax) no shape (n x 10).
+
+As convoluções são feitas por im2col: as janelas de cada dígito são extraídas com
+sliding_window_view e a convolução vira uma única multiplicação de matrizes para todos os
+dígitos do lote.
+
+Executado como script, verifica a paridade (argmax) com o model.predict do Keras sobre os
+captchas da pasta Build Dataset/Labeled Pictures, caso o TensorFlow esteja instalado. Os
+dígitos são escolhidos pela confiança da própria rede (selection_mode="confidence"), sem o
+Tesseract. Sem o TensorFlow, a paridade é verificada pelo script Benchmarks/Check NumPy
+Model.py, contra logits de referência gravados."""
+
+import os
+import json
+import logging
+import logging.config
+
+import h5py
+import numpy as np
+from numpy.lib.stride_tricks import sliding_window_view
+
+# Configura o display e salvamento de logs
+logging.config.fileConfig(
+    os.path.join(os.path.dirname(os.path.abspath(__file__)), "logging.conf"),
+    disable_existing_loggers=False,
+)
+logger = logging.getLogger("main")
+
+
+def _relu(x: np.ndarray) -> np.ndarray:
+
+    return np.maximum(x, 0, out=x)
+
+
+def _softmax(x: np.ndarray) -> np.ndarray:
+
+    # Subtraindo o máximo de cada linha para estabilidade numérica
+    x = np.exp(x - x.max(axis=-1, keepdims=True))
+
+    return x / x.sum(axis=-1, keepdims=True)
+
+
+_ACTIVATIONS = {"relu": _relu, "softmax": _softmax, "linear": lambda x: x}
+
+
+def _im2col(x: np.ndarray, kernel_size: tuple) -> np.ndarray:
+    """Transforma o lote (n, h, w, c) na matriz de janelas (n * h' * w', kh * kw * c),
+    na mesma ordem (kh, kw, c) em que o Keras armazena o kernel."""
+
+    kh, kw = kernel_size
+    n, h, w, c = x.shape
+
+    # sliding_window_view retorna (n, h', w', c, kh, kw), ainda sem cópia
+    windows = sliding_window_view(x, (kh, kw), axis=(1, 2))
+
+    return windows.transpose(0, 1, 2, 4, 5, 3).reshape(
+        n * (h - kh + 1) * (w - kw + 1), kh * kw * c
+    )
+
+
+def _conv2d(x: np.ndarray, kernel: np.ndarray, bias: np.ndarray) -> np.ndarray:
+    """Convolução 2D com padding 'valid' e stride 1 (channels_last)."""
+
+    kh, kw, c, filters = kernel.shape
+    n, h, w, _ = x.shape
+
+    out = _im2col(x, (kh, kw)) @ kernel.reshape(kh * kw * c, filters)
+    out += bias
+
+    return out.reshape(n, h - kh + 1, w - kw + 1, filters)
+
+
+def _max_pool(x: np.ndarray, pool_size: tuple) -> np.ndarray:
+    """Max pooling com stride igual ao pool_size e padding 'valid'."""
+
+    ph, pw = pool_size
+    n, h, w, c = x.shape
+
+    # Descartando as bordas que não completam uma janela, como no Keras
+    x = x[:, : h // ph * ph, : w // pw * pw]
+
+    return x.reshape(n, h // ph, ph, w // pw, pw, c).max(axis=(2, 4))
+
+
+class Numpy_Captcha_Model(object):
+    """Executa o forward pass da rede neural sequencial (Conv2D, MaxPooling2D, Dropout,
+    Flatten e Dense) com NumPy. Cada camada é uma tupla (tipo, parâmetros)."""
+
+    def __init__(self, layers: list):
+
+        self.layers = layers
+
+    def predict(self, x: np.ndarray) -> np.ndarray:
+        """Recebe os dígitos no shape (n x 28 x 28 x 1) e retorna as probabilidades de
+        cada classe no shape (n x 10)."""
+
+        x = np.asarray(x, dtype=np.float32)
+
+        for kind, params in self.layers:
+
+            if kind == "conv":
+                x = _ACTIVATIONS[params["activation"]](
+                    _conv2d(x, params["kernel"], params["bias"])
+                )
+
+            elif kind == "pool":
+                x = _max_pool(x, params["pool_size"])
+
+            elif kind == "flatten":
+                # channels_last: achata na ordem (h, w, c), igual ao Flatten do Keras
+                x = x.reshape(x.shape[0], -1)
+
+            elif kind == "dense":
+                x = _ACTIVATIONS[params["activation"]](
+                    x @ params["kernel"] + params["bias"]
+                )
+
+        return x
+
+
+def _layer_weights(model_weights, name: str) -> dict:
+    """Lê o kernel e o bias de uma camada no grupo model_weights do arquivo .h5."""
+
+    group = model_weights[name]
+    weights = {}
+
+    for weight_name in group.attrs["weight_names"]:
+        weight_name = (
+            weight_name.decode() if isinstance(weight_name, bytes) else weight_name
+        )
+        key = weight_name.split("/")[-1].split(":")[0]
+        weights[key] = np.asarray(group[weight_name], dtype=np.float32)
+
+    return weights
+
+
+def load_numpy_model(file_name: str = "Captcha_model.h5") -> Numpy_Captcha_Model:
+    """Lê a arquitetura e os pesos do modelo Keras salvo em .h5 e retorna o modelo
+    equivalente em NumPy."""
+
+    with h5py.File(file_name, "r") as h5_file:
+
+        model_config = h5_file.attrs["model_config"]
+        if isinstance(model_config, bytes):
+            model_config = model_config.decode()
+
+        config = json.loads(model_config)["config"]
+
+        # Versões mais antigas do Keras salvam a lista de camadas diretamente em config
+        layers_config = config["layers"] if isinstance(config, dict) else config
+
+        layers = []
+        for layer in layers_config:
+            class_name, layer_config = layer["class_name"], layer["config"]
+
+            if class_name == "Conv2D":
+                if layer_config["padding"] != "valid" or tuple(
+                    layer_config["strides"]
+                ) != (1, 1):
+                    raise ValueError(
+                        f"Conv2D com padding/stride não suportado: {layer_config['name']}."
+                    )
+
+                weights = _layer_weights(h5_file["model_weights"], layer_config["name"])
+                layers.append(
+                    (
+                        "conv",
+                        {
+                            "kernel": weights["kernel"],
+                            "bias": weights["bias"],
+                            "activation": layer_config["activation"],
+                        },
+                    )
+                )
+
+            elif class_name in ("MaxPooling2D", "MaxPool2D"):
+                if layer_config["padding"] != "valid" or tuple(
+                    layer_config["strides"]
+                ) != tuple(layer_config["pool_size"]):
+                    raise ValueError(
+                        f"MaxPooling2D com padding/stride não suportado: {layer_config['name']}."
+                    )
+
+                layers.append(("pool", {"pool_size": tuple(layer_config["pool_size"])}))
+
+            elif class_name == "Flatten":
+                layers.append(("flatten", {}))
+
+            elif class_name == "Dense":
+                weights = _layer_weights(h5_file["model_weights"], layer_config["name"])
+                layers.append(
+                    (
+                        "dense",
+                        {
+                            "kernel": weights["kernel"],
+                            "bias": weights["bias"],
+                            "activation": layer_config["activation"],
+                        },
+                    )
+                )
+
+            # Dropout não tem efeito na inferência
+            elif class_name != "Dropout":
+                raise ValueError(
+                    f"Camada não suportada pelo motor NumPy: {class_name}."
+                )
+
+    logger.info(f"Modelo {file_name} carregado no motor de inferência NumPy.")
+
+    return Numpy_Captcha_Model(layers)
+
+
+if __name__ == "__main__":
+
+    from Captcha_Processor import digits_extractor_batch
+
+    path_to_pictures = os.path.join("Build Dataset", "Labeled Pictures")
+    pictures = sorted(
+        entry.path
+        for entry in os.scandir(path_to_pictures)
+        if entry.name.endswith("png")
+    )
+
+    bites_streams = []
+    for picture in pictures:
+        with open(picture, "rb") as f:
+            bites_streams.append(f.read())
+
+    numpy_model = load_numpy_model("Captcha_model.h5")
+    digits, offsets = digits_extractor_batch(
+        bites_streams,
+        filenames=pictures,
+        selection_mode="confidence",
+        classifier=numpy_model,
+    )
+    numpy_predictions = numpy_model.predict(digits)
+
+    try:
+        from tensorflow.keras.models import load_model
+    except ImportError:
+        logger.warning(
+            "TensorFlow indisponível: paridade com o Keras não verificada "
+            '(utilize o script "Benchmarks/Check NumPy Model.py").'
+        )
+    else:
+        keras_predictions = load_model("Captcha_model.h5", compile=False).predict(
+            digits
+        )
+        mismatches = np.flatnonzero(
+            numpy_predictions.argmax(axis=1) != keras_predictions.argmax(axis=1)
+        )
+        max_diff = float(np.abs(numpy_predictions - keras_predictions).max(initial=0))
+
+        logger.info(
+            f"Paridade NumPy x Keras: {len(digits) - len(mismatches)}/{len(digits)} "
+            f"dígitos com o mesmo argmax. Maior diferença nas probabilidades: {max_diff:.2e}."
+        )
+
+        if mismatches.size:
+            raise SystemExit(f"Dígitos divergentes: {mismatches.tolist()}")
+
+    for picture, start, stop in zip(pictures, offsets[:-1], offsets[1:]):
+        interpreted_captcha = "".join(
+            str(result) for result in numpy_predictions[start:stop].argmax(axis=1)
+        )
+        logger.info(f"Imagem {picture}: interpretada como {interpreted_captcha}.")
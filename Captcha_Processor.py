@@ -15,7 +15,8 @@ consultar o arquivo logging.conf
 
  4) captcha_interpreter: processa os captchas baseado no número de pixels obtidos
  após a filtragem por Median Blur. A depender da qualidade da imagem processada,
- utiliza a engine Tesseract para decidir sobre qual imagem utilizar.
+ decide sobre qual imagem utilizar com a engine Tesseract (selection_mode="tesseract") ou,
+ sem sair do processo, com a confiança da rede neural (selection_mode="confidence").
 
  5) _trim_digits: função auxiliar para realizar o corte em dígitos que 
  eventualmente tenham ficados "siameses".
@@ -25,22 +26,36 @@ consultar o arquivo logging.conf
  
  7) resize_to_fit: Padroniza os dígitos processados em arrays de (n x n).
  
- 8) Funciona como wrapper para todas as funções acima. """
+ 8) digits_extractor: Funciona como wrapper para todas as funções acima.
+
+ 9) digits_extractor_batch: Versão em lote do digits_extractor. Processa diversos captchas
+ numa única chamada e empilha todos os dígitos num único tensor pré-alocado. """
 
 import os
 import logging
 import logging.config
 
-import pytesseract as ocr
 from cv2 import cv2
 import numpy as np
 
+# O Tesseract é opcional quando a seleção é feita pela confiança da rede neural
+try:
+    import pytesseract as ocr
+except ImportError:
+    ocr = None
+
 os.chdir(os.path.dirname(__file__))
 
 # Configura o display e salvamento de logs
 logging.config.fileConfig("logging.conf")
 logger = logging.getLogger("root")
 
+# Quantidade plausível de dígitos num captcha da CVM
+MIN_DIGITS, MAX_DIGITS = 2, 6
+
+# Abaixo desta confiança, o modo "confidence" recorre ao Tesseract (se disponível)
+MIN_CONFIDENCE = 0.5
+
 
 def _BIN_and_OTSU(img: object):
 
@@ -58,6 +73,15 @@ def _BIN_and_OTSU(img: object):
     return img_th2
 
 
+def _decode_captcha(captcha_bytes) -> object:
+    """Decodifica o captcha (stream de bytes) para uma imagem em escala de cinza.
+    np.frombuffer cria apenas uma view sobre o buffer, sem cópia intermediária."""
+
+    return cv2.imdecode(
+        np.frombuffer(captcha_bytes, dtype=np.uint8), cv2.IMREAD_GRAYSCALE
+    )
+
+
 def _dilate(img: object):
 
     kernel = np.ones((2, 2), np.uint8)
@@ -101,21 +125,36 @@ def _captcha_filter(img: object, filter_mode=None):
         return (bin_otsu_img, _count_black_pixels(bin_otsu_img))
 
 
-def captcha_interpreter(file_name=None, **kwargs):
+def captcha_interpreter(
+    file_name=None,
+    selection_mode="tesseract",
+    classifier=None,
+    tesseract_fallback=True,
+    **kwargs,
+):
     """**kwargs = captcha_bytes, fund_name são argumentos opcionais
     Função trabalha em dois modos:
     
     1) Lendo os arquivos a partir de um diretório indicado, neste caso,
     file_name = full_path_to_the_file
 
-    2) Recebendo o stream de bytes com o nome "captcha_bytes" e convertendo-o para figura. """
+    2) Recebendo o stream de bytes com o nome "captcha_bytes" e convertendo-o para figura.
+
+    Nas imagens de qualidade média, a escolha entre Median Blur e Bin + OTSU depende do
+    selection_mode:
+     - "tesseract": imagem em que o Tesseract identificou mais dígitos.
+     - "confidence": imagem com maior confiança do classifier (objeto com .predict, como a
+     rede neural). Se a confiança for baixa e tesseract_fallback=True, recorre ao Tesseract."""
+
+    if selection_mode == "confidence" and classifier is None:
+        raise ValueError('selection_mode="confidence" exige um classifier.')
 
     if kwargs is not None and file_name is None:
 
         logger.info(f"Processando o streaming de bites.")
         try:
             _captcha = kwargs.get("captcha_bytes")
-            picture = cv2.imdecode(np.asarray(bytearray(_captcha), dtype="uint8"), 0)
+            picture = _decode_captcha(_captcha)
             file_name = f'Captcha_{kwargs.get("fund_name")}'
         except Exception as err:
             logger.exception(f"Ocorreu o seguinte erro: {err}.")
@@ -164,47 +203,18 @@ def captcha_interpreter(file_name=None, **kwargs):
         TH_bin_result, _ = _captcha_filter(picture, filter_mode="Binary + OTSU")
 
         images = [median_blur_result, TH_bin_result]
-        candidates = [
-            ocr.image_to_string(
-                image, config="--psm 10 --oem 3 -c tessedit_char_whitelist=0123456789"
-            )
-            for image in images
-        ]
 
-        # Se não houver interpretação em nenhum dos casos, utilizar TH-BIN
-        if all(i == "" for i in candidates):
-            logger.debug(
-                f"Imagem {file_name}: Tesseract não identificou dígitos na imagem processada. Retornado Bin+OTSU."
-            )
-            return TH_bin_result
+        if selection_mode == "confidence":
+            image, confidence = _select_by_confidence(images, classifier, file_name)
+
+            if confidence >= MIN_CONFIDENCE or ocr is None or not tesseract_fallback:
+                return image if image is not None else TH_bin_result
 
-        # Se uma das imagens não possuir interpretação, retorne esta imagem
-        elif "" in candidates:
             logger.debug(
-                f"Imagem {file_name}: Tesseract identificou pelo menos um dígito."
+                f"Imagem {file_name}: Confiança baixa ({confidence:.2f}), recorrendo ao Tesseract."
             )
-            return [
-                image for candidate, image in zip(candidates, images) if candidate != ""
-            ][0]
-
-        else:
 
-            # Se as duas tiverem o mesmo número de caracteres, me retorne a com maior densidade de pixels
-            if max(candidates, key=len) == min(candidates, key=len):
-                logger.debug(
-                    f"Imagem {file_name}: utilizado BIN + OTSU por apresentar maior densidade de pixels."
-                )
-                return TH_bin_result
-            # Se as duas possuirem interpretação retorne a que tiver mais caracteres
-            else:
-                logger.debug(
-                    f"Imagem {file_name}: Retornada a opção na qual o Tesseract identificou mais caracteres."
-                )
-                return [
-                    image
-                    for candidate, image in zip(candidates, images)
-                    if candidate == max(candidates, key=len)
-                ][0]
+        return _select_by_tesseract(images, file_name)
 
     # Se median blur detectou mais de 5% de pixels, retorne medium blur
     else:
@@ -214,6 +224,100 @@ def captcha_interpreter(file_name=None, **kwargs):
         return median_blur_result
 
 
+def _select_by_tesseract(images: list, file_name: str):
+    """Escolhe, entre as imagens [Median Blur, Bin + OTSU], aquela em que o Tesseract
+    identificou mais dígitos. Cada chamada ao Tesseract abre um novo processo."""
+
+    if ocr is None:
+        raise ImportError(
+            'pytesseract não está instalado, utilize selection_mode="confidence".'
+        )
+
+    candidates = [
+        ocr.image_to_string(
+            image, config="--psm 10 --oem 3 -c tessedit_char_whitelist=0123456789"
+        )
+        for image in images
+    ]
+
+    # Se não houver interpretação em nenhum dos casos, utilizar TH-BIN
+    if all(i == "" for i in candidates):
+        logger.debug(
+            f"Imagem {file_name}: Tesseract não identificou dígitos na imagem processada. Retornado Bin+OTSU."
+        )
+        return images[1]
+
+    # Se uma das imagens não possuir interpretação, retorne esta imagem
+    elif "" in candidates:
+        logger.debug(f"Imagem {file_name}: Tesseract identificou pelo menos um dígito.")
+        return [
+            image for candidate, image in zip(candidates, images) if candidate != ""
+        ][0]
+
+    else:
+
+        # Se as duas tiverem o mesmo número de caracteres, me retorne a com maior densidade de pixels
+        if max(candidates, key=len) == min(candidates, key=len):
+            logger.debug(
+                f"Imagem {file_name}: utilizado BIN + OTSU por apresentar maior densidade de pixels."
+            )
+            return images[1]
+        # Se as duas possuirem interpretação retorne a que tiver mais caracteres
+        else:
+            logger.debug(
+                f"Imagem {file_name}: Retornada a opção na qual o Tesseract identificou mais caracteres."
+            )
+            return [
+                image
+                for candidate, image in zip(candidates, images)
+                if candidate == max(candidates, key=len)
+            ][0]
+
+
+def _normalize_digits(processed_digits: list) -> np.ndarray:
+    """Ajusta os dígitos no shape (n x 28 x 28 x 1) em float32 que alimenta a rede neural."""
+
+    digits = np.empty((len(processed_digits), 28, 28, 1), dtype=np.float32)
+
+    for crop, out in zip(processed_digits, digits):
+        np.divide(resize_to_fit(crop, 28), 255, out=out[..., 0], casting="same_kind")
+
+    return digits
+
+
+def _select_by_confidence(images: list, classifier, file_name: str):
+    """Escolhe, entre as imagens candidatas, aquela cujos dígitos a rede neural interpreta
+    com maior confiança, sem chamar o Tesseract.
+
+    - Cada candidata é segmentada com grab_digits.
+    - Score: média geométrica da maior probabilidade (softmax) de cada dígito, zerada caso a
+    quantidade de dígitos não seja plausível (fora de MIN_DIGITS a MAX_DIGITS).
+
+    Retorna a tupla (imagem escolhida, score), ou (None, 0.0) caso nenhuma seja plausível."""
+
+    best_image, best_score = None, 0.0
+
+    for image in images:
+        processed_digits = grab_digits(image, file_name)
+
+        if not MIN_DIGITS <= len(processed_digits) <= MAX_DIGITS:
+            continue
+
+        confidences = classifier.predict(_normalize_digits(processed_digits)).max(
+            axis=1
+        )
+        score = float(np.exp(np.log(np.maximum(confidences, 1e-12)).mean()))
+
+        if score > best_score:
+            best_image, best_score = image, score
+
+    logger.debug(
+        f"Imagem {file_name}: Seleção por confiança com score {best_score:.2f}."
+    )
+
+    return best_image, best_score
+
+
 def _trim_digits(element, average: int, picture: object):
 
     x, y, w, h = element
@@ -316,39 +420,65 @@ def resize_to_fit(img: object, new_size: int) -> object:
     return new_img
 
 
-def digits_extractor(bites_stream, filename):
+def digits_extractor_batch(
+    bites_streams, filenames=None, max_digits: int = MAX_DIGITS, **kwargs
+):
+    """Definições:
+     - bites_streams: sequência de captchas em bites.
+     - filenames: sequência opcional com o nome associado a cada captcha (usado nos logs).
+     - max_digits: captchas com mais dígitos que isso são descartados.
+     - **kwargs: repassados ao captcha_interpreter (selection_mode, classifier, ...).
+
+     Processa vários captchas de uma só vez. Os dígitos de todos os captchas são normalizados
+     e gravados diretamente num único tensor pré-alocado de shape (N x 28 x 28 x 1) em float32.
+
+     Retorna a tupla (digits, offsets), onde os dígitos do i-ésimo captcha estão em
+     digits[offsets[i]:offsets[i + 1]]. Captchas que não puderam ser processados ficam com
+     uma fatia vazia (offsets[i] == offsets[i + 1])."""
+
+    bites_streams = list(bites_streams)
+
+    if filenames is None:
+        filenames = [f"Captcha_{i}" for i in range(len(bites_streams))]
+
+    crops = []
+    offsets = np.zeros(len(bites_streams) + 1, dtype=np.intp)
+
+    for i, (bites_stream, filename) in enumerate(zip(bites_streams, filenames)):
+
+        processed_picture = captcha_interpreter(
+            captcha_bytes=bites_stream, fund_name=filename, **kwargs
+        )
+
+        # Caso o algorítimo tenha processado a figura, separe-a em dígitos individuais.
+        if processed_picture.size != 0:
+            processed_digits = grab_digits(processed_picture, file_name=filename)
+
+            if processed_digits and len(processed_digits) <= max_digits:
+                crops.extend(processed_digits)
+
+        offsets[i + 1] = len(crops)
+
+    # Um único buffer para todos os dígitos, no shape que alimentará a rede neural já treinada
+    return _normalize_digits(crops), offsets
+
+
+def digits_extractor(bites_stream, filename, **kwargs):
     """Definições:
      - bites_steam: captcha em bites.
      - filename: no geral, o nome do fundo.
      
      A função recebe o captcha em bites, aplica os filtros, realiza a individualização dos dígitos
      e e ajusta no formato necessário para alimentar a rede neural. Retorna um np.array com os dígitos
-     que compõem o captcha e que servirá de input para rede neural. """
+     que compõem o captcha e que servirá de input para rede neural.
 
-    # Recebe o stream de bytes que representa o captcha e realiza o processamento
-    processed_picture = captcha_interpreter(
-        captcha_bytes=bites_stream, fund_name=filename
-    )
-
-    # Caso o algorítimo tenha processado a figura:
-    if processed_picture.size != 0:
+     **kwargs são repassados ao captcha_interpreter (selection_mode, classifier, ...). """
 
-        # Separe o captcha em dígitos individuais.
-        processed_digits = grab_digits(processed_picture, file_name=filename)
+    digits, offsets = digits_extractor_batch([bites_stream], [filename], **kwargs)
 
-        if processed_digits and len(processed_digits) < 7:
-
-            # Processa para salvar no shape (nx28x28x1) que alimentará a rede neural já treinada
-            digits_to_save = []
-            for digit in processed_digits:
-
-                digit = resize_to_fit(digit, 28)
-                digit = digit / 255
-                digit = digit.astype("float32")
-                digit = digit.reshape(28, 28, 1)
-                digits_to_save.append(digit)
-
-            return np.array(digits_to_save)
+    # Caso o algorítimo tenha processado a figura:
+    if offsets[-1] > 0:
+        return digits
 
     logger.info("Necessário pedir outro captcha")
     return None
@@ -0,0 +1,396 @@
+"""Versão quantizada em int8 (post-training quantization) da rede neural de Captcha_model.h5.
+
+Construída sobre o motor NumPy do módulo Captcha_NumPy_Model:
+
+ 1) quantize_model: quantiza os kernels das camadas Conv2D e Dense em int8 (escala
+ simétrica por canal de saída) e calibra a escala das ativações de entrada de cada
+ camada com os dígitos do dataset (pictures_x_data.npz gerado pelo Build Dataset.py).
+
+ 2) Int8_Captcha_Model.predict: mesmo contrato do model.predict. Os kernels ficam em
+ memória em int8 (1/4 da memória dos parâmetros em float32). As entradas de cada camada são
+ quantizadas para a grade int8 e multiplicadas, com o BLAS, por blocos de DEQUANT_ROWS
+ linhas do kernel convertidos para float32 a cada chamada: a memória temporária fica
+ limitada a um bloco, e não ao kernel inteiro. O produto é re-escalado ao final por canal
+ (w_scale x x_scale). A conversão dos blocos e a quantização das entradas tornam a
+ inferência um pouco mais lenta que a do float32: o ganho é de memória por worker.
+
+ 3) save / load_int8_model: persistem o modelo quantizado em .npz, para que os workers
+ não precisem do dataset de calibração.
+
+Executado como script, calibra o modelo, salva-o em Captcha_model_int8.npz e gera o relatório
+"Rede Neural/Quantization Report.md" comparando acurácia por dígito, acurácia por captcha,
+latência e memória (parâmetros residentes e pico do predict) contra o modelo em float32:
+
+    python3 Captcha_Quantized_Model.py [pictures_x_data.npz] [labels_y_data.npz]"""
+
+import os
+import sys
+import json
+import time
+import tracemalloc
+import logging
+import logging.config
+
+import numpy as np
+
+from Captcha_NumPy_Model import (
+    Numpy_Captcha_Model,
+    load_numpy_model,
+    _ACTIVATIONS,
+    _im2col,
+    _max_pool,
+)
+
+# Configura o display e salvamento de logs
+logging.config.fileConfig(
+    os.path.join(os.path.dirname(os.path.abspath(__file__)), "logging.conf"),
+    disable_existing_loggers=False,
+)
+logger = logging.getLogger("main")
+
+# Percentil das ativações usado na calibração, descarta outliers extremos
+CALIBRATION_PERCENTILE = 99.99
+
+# Linhas do kernel int8 convertidas para float32 por vez no predict
+DEQUANT_ROWS = 512
+
+
+def _quantize(x: np.ndarray, scale) -> np.ndarray:
+
+    return np.clip(np.rint(x / scale), -127, 127).astype(np.int8)
+
+
+def _quantize_float(x: np.ndarray, scale) -> np.ndarray:
+    "Mesmos valores do _quantize (x / scale), mantidos em float32 para o produto com o BLAS"
+
+    x = x / scale
+    np.rint(x, out=x)
+
+    return np.clip(x, -127, 127, out=x)
+
+
+def _int8_matmul(x_q: np.ndarray, kernel: np.ndarray, scale: np.ndarray) -> np.ndarray:
+    """Produto da entrada quantizada (k colunas, float32) pelo kernel int8 (k x n), com
+    DEQUANT_ROWS linhas do kernel desquantizadas por vez, re-escalado por scale (n)."""
+
+    out = x_q[:, :DEQUANT_ROWS] @ kernel[:DEQUANT_ROWS].astype(np.float32)
+
+    for start in range(DEQUANT_ROWS, kernel.shape[0], DEQUANT_ROWS):
+        stop = start + DEQUANT_ROWS
+        out += x_q[:, start:stop] @ kernel[start:stop].astype(np.float32)
+
+    out *= scale
+
+    return out
+
+
+class Int8_Captcha_Model(object):
+    """Forward pass com kernels em int8. Cada camada Conv2D / Dense guarda o kernel
+    quantizado, a escala por canal de saída (w_scale) e a escala da sua entrada (x_scale).
+
+    O predict usa o kernel int8 no formato 2D do im2col (reshape, sem cópia) e a escala
+    combinada w_scale x x_scale de cada camada, calculados no __init__."""
+
+    def __init__(self, layers: list):
+
+        self.layers = layers
+        self._kernels = [
+            (
+                params["kernel"].reshape(-1, params["kernel"].shape[-1]),
+                (params["w_scale"] * params["x_scale"]).astype(np.float32),
+            )
+            if kind in ("conv", "dense")
+            else None
+            for kind, params in layers
+        ]
+
+    @property
+    def nbytes(self) -> int:
+        """Memória ocupada pelos parâmetros do modelo (kernels em int8)."""
+
+        return sum(
+            value.nbytes
+            for _, params in self.layers
+            for value in params.values()
+            if isinstance(value, np.ndarray)
+        )
+
+    def predict(self, x: np.ndarray) -> np.ndarray:
+
+        x = np.asarray(x, dtype=np.float32)
+
+        for (kind, params), quantized in zip(self.layers, self._kernels):
+
+            if kind in ("conv", "dense"):
+                # Reatribuindo x: cada passo libera a matriz anterior (pico de memória)
+                x = _quantize_float(x, params["x_scale"])
+
+                if kind == "conv":
+                    kh, kw, _, filters = params["kernel"].shape
+                    n, h, w, _ = x.shape
+                    x = _im2col(x, (kh, kw))
+
+                x = _int8_matmul(x, *quantized)
+                x += params["bias"]
+
+                if kind == "conv":
+                    x = x.reshape(n, h - kh + 1, w - kw + 1, filters)
+
+                x = _ACTIVATIONS[params["activation"]](x)
+
+            elif kind == "pool":
+                x = _max_pool(x, params["pool_size"])
+
+            elif kind == "flatten":
+                x = x.reshape(x.shape[0], -1)
+
+        return x
+
+    def save(self, file_name: str = "Captcha_model_int8.npz"):
+
+        arrays = {}
+        kinds = []
+        for i, (kind, params) in enumerate(self.layers):
+            kinds.append((kind, params.get("activation"), params.get("pool_size")))
+
+            for key, value in params.items():
+                if isinstance(value, np.ndarray):
+                    arrays[f"{i}_{key}"] = value
+
+        np.savez(file_name, layers=json.dumps(kinds), **arrays)
+        logger.info(f"Modelo quantizado salvo em {file_name}.")
+
+
+def load_int8_model(file_name: str = "Captcha_model_int8.npz") -> Int8_Captcha_Model:
+
+    with np.load(file_name) as saved:
+        layers = []
+
+        for i, (kind, activation, pool_size) in enumerate(
+            json.loads(str(saved["layers"]))
+        ):
+            params = {
+                key.split("_", 1)[1]: saved[key]
+                for key in saved.files
+                if key.startswith(f"{i}_")
+            }
+
+            if activation is not None:
+                params["activation"] = activation
+            if pool_size is not None:
+                params["pool_size"] = tuple(pool_size)
+
+            layers.append((kind, params))
+
+    return Int8_Captcha_Model(layers)
+
+
+def load_calibration_digits(file_name: str) -> np.ndarray:
+    """Lê os dígitos salvos pelo Build Dataset.py (uint8, 0 - 255) e aplica a mesma
+    normalização usada na inferência: shape (n x 28 x 28 x 1) em float32 no intervalo [0, 1]."""
+
+    if file_name.endswith(".npz"):
+        with np.load(file_name) as saved:
+            digits = saved[saved.files[0]]
+    else:
+        digits = np.load(file_name, mmap_mode="r")
+
+    return (np.asarray(digits, dtype=np.float32) / 255).reshape(-1, 28, 28, 1)
+
+
+def quantize_model(
+    model: Numpy_Captcha_Model, calibration_x: np.ndarray
+) -> Int8_Captcha_Model:
+    """Quantiza os kernels por canal de saída e calibra a escala da entrada de cada
+    camada Conv2D / Dense propagando os dígitos de calibração pelo modelo em float32."""
+
+    # Propagação em blocos para limitar a memória do im2col
+    chunks = np.array_split(
+        np.asarray(calibration_x, dtype=np.float32),
+        max(1, -(-len(calibration_x) // 256)),
+    )
+    layers = []
+
+    for kind, params in model.layers:
+
+        if kind in ("conv", "dense"):
+            kernel = params["kernel"]
+            reduce_axes = tuple(range(kernel.ndim - 1))
+
+            w_scale = np.abs(kernel).max(axis=reduce_axes) / 127
+            w_scale[w_scale == 0] = 1
+
+            activations = np.abs(np.concatenate([chunk.ravel() for chunk in chunks]))
+            x_scale = (
+                max(np.percentile(activations, CALIBRATION_PERCENTILE), 1e-8) / 127
+            )
+
+            layers.append(
+                (
+                    kind,
+                    {
+                        "kernel": _quantize(kernel, w_scale),
+                        "w_scale": w_scale.astype(np.float32),
+                        "x_scale": np.asarray(x_scale, dtype=np.float32),
+                        "bias": params["bias"],
+                        "activation": params["activation"],
+                    },
+                )
+            )
+        else:
+            layers.append((kind, params))
+
+        # Propagando os dados de calibração pela camada em float32
+        layer = Numpy_Captcha_Model([(kind, params)])
+        chunks = [layer.predict(chunk) for chunk in chunks]
+
+    return Int8_Captcha_Model(layers)
+
+
+def _latency(model, digits: np.ndarray, repeat: int = 200) -> float:
+    """Mediana, em ms, do tempo de inferência de um lote."""
+
+    model.predict(digits)
+
+    timings = []
+    for _ in range(repeat):
+        start = time.perf_counter()
+        model.predict(digits)
+        timings.append(time.perf_counter() - start)
+
+    return 1000 * float(np.median(timings))
+
+
+def _peak_memory(model, digits: np.ndarray) -> int:
+    """Pico, em bytes, da memória alocada durante o predict de um lote (tracemalloc), sem
+    contar os parâmetros do modelo."""
+
+    model.predict(digits)
+
+    tracemalloc.start()
+    try:
+        model.predict(digits)
+        return tracemalloc.get_traced_memory()[1]
+    finally:
+        tracemalloc.stop()
+
+
+def _captcha_accuracy(model, digits: np.ndarray, offsets: np.ndarray, labels: list):
+    """Fração dos captchas com todos os dígitos interpretados corretamente."""
+
+    predictions = model.predict(digits).argmax(axis=1)
+
+    solved = sum(
+        "".join(str(digit) for digit in predictions[start:stop]) == label
+        for label, start, stop in zip(labels, offsets[:-1], offsets[1:])
+    )
+
+    return solved / len(labels)
+
+
+if __name__ == "__main__":
+
+    pictures_file = sys.argv[1] if len(sys.argv) > 1 else "pictures_x_data.npz"
+    labels_file = sys.argv[2] if len(sys.argv) > 2 else "labels_y_data.npz"
+
+    digits = load_calibration_digits(pictures_file)
+    with np.load(labels_file) as saved:
+        digit_labels = saved[saved.files[0]]
+
+    # Importado após a leitura do dataset, pois muda o diretório para o dos módulos
+    from Captcha_Processor import digits_extractor_batch
+
+    # Separando os dígitos usados na calibração daqueles usados na avaliação
+    rng = np.random.default_rng(42)
+    order = rng.permutation(len(digits))
+    n_calibration = min(2000, len(digits) // 5)
+    calibration, evaluation = order[:n_calibration], order[n_calibration:]
+
+    float_model = load_numpy_model("Captcha_model.h5")
+    int8_model = quantize_model(float_model, digits[calibration])
+    int8_model.save("Captcha_model_int8.npz")
+
+    # Captchas identificados manualmente, o label é o nome do arquivo
+    path_to_pictures = os.path.join("Build Dataset", "Labeled Pictures")
+    pictures = sorted(
+        entry.path
+        for entry in os.scandir(path_to_pictures)
+        if entry.name.endswith("png")
+    )
+    bites_streams, captcha_labels = [], []
+    for picture in pictures:
+        with open(picture, "rb") as f:
+            bites_streams.append(f.read())
+        captcha_labels.append(os.path.basename(picture).split(".")[0])
+
+    captcha_digits, offsets = digits_extractor_batch(
+        bites_streams,
+        filenames=pictures,
+        selection_mode="confidence",
+        classifier=float_model,
+    )
+
+    # Latência e memória não dependem do conteúdo: lotes de 6 e 512 dígitos de avaliação
+    small_batch = np.resize(digits[evaluation], (6, 28, 28, 1))
+    large_batch = np.resize(digits[evaluation], (512, 28, 28, 1))
+
+    float_nbytes = sum(
+        value.nbytes
+        for _, params in float_model.layers
+        for value in params.values()
+        if isinstance(value, np.ndarray)
+    )
+
+    rows = []
+    for name, model, nbytes in (
+        ("float32", float_model, float_nbytes),
+        ("int8", int8_model, int8_model.nbytes),
+    ):
+        predictions = model.predict(digits[evaluation]).argmax(axis=1)
+        digit_accuracy = float(np.mean(predictions == digit_labels[evaluation]))
+        peak = _peak_memory(model, small_batch)
+
+        rows.append(
+            f"| {name} | {100 * digit_accuracy:.2f}% "
+            f"| {100 * _captcha_accuracy(model, captcha_digits, offsets, captcha_labels):.2f}% "
+            f"| {_latency(model, small_batch):.3f} "
+            f"| {_latency(model, large_batch, repeat=20):.2f} "
+            f"| {nbytes / 1024:.1f} "
+            f"| {peak / 1024:.1f} | {(nbytes + peak) / 1024:.1f} |"
+        )
+
+    report = "\n".join(
+        [
+            "# Quantização int8 x float32",
+            "",
+            f"Amostra pequena: {len(digits)} dígitos em {pictures_file}. As acurácias "
+            "indicam somente se a quantização altera as predições, não a acurácia real do "
+            "modelo.",
+            "",
+            f"- Calibração: {n_calibration} dígitos de {pictures_file}.",
+            f"- Avaliação por dígito: {len(evaluation)} dígitos restantes de {pictures_file}.",
+            f"- Avaliação por captcha: {len(pictures)} captchas de {path_to_pictures} "
+            '(dígitos escolhidos com selection_mode="confidence"), os mesmos captchas que '
+            "originaram o dataset.",
+            "- Latência: mediana do predict de lotes de 6 e 512 dígitos.",
+            "- Memória: parâmetros residentes no modelo e pico das alocações do predict de "
+            "6 dígitos (tracemalloc, um captcha), além da soma dos dois por worker.",
+            "",
+            "| Modelo | Acurácia por dígito | Acurácia por captcha | Latência 6 dígitos (ms) "
+            "| Latência 512 dígitos (ms) | Parâmetros (KiB) | Pico do predict (KiB) "
+            "| Total (KiB) |",
+            "|---|---|---|---|---|---|---|---|",
+            *rows,
+            "",
+            f"No int8 os kernels ficam em memória em int8 e são convertidos para float32 em "
+            f"blocos de {DEQUANT_ROWS} linhas a cada predict: a memória temporária fica "
+            "limitada a um bloco, e a conversão dos blocos e a quantização das entradas "
+            "acrescentam latência em relação ao float32.",
+            "",
+        ]
+    )
+
+    with open(os.path.join("Rede Neural", "Quantization Report.md"), "w") as f:
+        f.write(report)
+
+    logger.info(f"Relatório de quantização:\n{report}")
@@ -0,0 +1,145 @@
+"""Resolve captchas com baixa latência, sem o custo por chamada do model.predict do Keras.
+
+A classe Captcha_Solver:
+
+ 1) Carrega a rede neural uma única vez, num dos motores disponíveis:
+  - "numpy": motor NumPy do módulo Captcha_NumPy_Model (padrão, dispensa o TensorFlow);
+  - "int8": modelo quantizado salvo pelo Captcha_Quantized_Model (Captcha_model_int8.npz);
+  - "keras": modelo Keras compilado com tf.function para um único shape de entrada.
+
+ 2) Mantém um buffer de shape fixo (max_digits x 28 x 28 x 1). Os dígitos de cada captcha
+ são copiados para o buffer e o restante é zerado, de modo que a função compilada sempre
+ recebe o mesmo shape (sem retracing no TensorFlow).
+
+ 3) Executa um warm up na criação, para que o primeiro captcha não pague a inicialização.
+
+ 4) Retorna o texto interpretado e a confiança (softmax) de cada dígito.
+
+O buffer é protegido por um lock, de modo que um único solver pode ser compartilhado entre
+os workers que rodam em threads."""
+
+import os
+import threading
+import logging
+import logging.config
+
+import numpy as np
+
+from Captcha_Processor import digits_extractor, MAX_DIGITS
+
+# Configura o display e salvamento de logs
+logging.config.fileConfig(
+    os.path.join(os.path.dirname(os.path.abspath(__file__)), "logging.conf"),
+    disable_existing_loggers=False,
+)
+logger = logging.getLogger("main")
+
+# Arquivo do modelo de cada motor, quando model_file não é fornecido
+MODEL_FILES = {
+    "numpy": "Captcha_model.h5",
+    "int8": "Captcha_model_int8.npz",
+    "keras": "Captcha_model.h5",
+}
+
+
+class Captcha_Solver(object):
+    """Carrega a rede neural uma única vez e resolve captchas com um shape de entrada fixo.
+
+    - model_file: arquivo do modelo. Se None, utiliza o arquivo do motor em MODEL_FILES
+    (.h5 para "numpy" e "keras", .npz para "int8")."""
+
+    def __init__(
+        self,
+        model_file: str = None,
+        engine: str = "numpy",
+        max_digits: int = MAX_DIGITS,
+    ):
+
+        if model_file is None:
+            model_file = MODEL_FILES.get(engine)
+
+        self.engine = engine
+        self.max_digits = max_digits
+        self._batch = np.zeros((max_digits, 28, 28, 1), dtype=np.float32)
+        self._lock = threading.Lock()
+
+        if engine == "numpy":
+            from Captcha_NumPy_Model import load_numpy_model
+
+            self._predict = load_numpy_model(model_file).predict
+
+        elif engine == "int8":
+            from Captcha_Quantized_Model import load_int8_model
+
+            self._predict = load_int8_model(model_file).predict
+
+        elif engine == "keras":
+            import tensorflow as tf
+
+            logging.getLogger("tensorflow").setLevel(logging.ERROR)
+            keras_model = tf.keras.models.load_model(model_file, compile=False)
+
+            # Um único grafo, traçado para o shape fixo do buffer
+            compiled = tf.function(
+                keras_model,
+                input_signature=[tf.TensorSpec(self._batch.shape, tf.float32)],
+            )
+            self._predict = lambda x: compiled(x).numpy()
+
+        else:
+            raise ValueError(f"Motor de inferência desconhecido: {engine}.")
+
+        # Warm up: a primeira chamada paga a alocação / compilação
+        self._predict(self._batch)
+
+        logger.info(f"Captcha solver pronto ({engine}, {max_digits} dígitos por lote).")
+
+    def predict(self, digits: np.ndarray) -> np.ndarray:
+        """Mesmo contrato do model.predict: recebe (n x 28 x 28 x 1) e retorna as
+        probabilidades (n x 10), processando os dígitos em blocos de max_digits."""
+
+        probabilities = np.empty((len(digits), 10), dtype=np.float32)
+
+        for start in range(0, len(digits), self.max_digits):
+            chunk = digits[start : start + self.max_digits]
+
+            with self._lock:
+                self._batch[: len(chunk)] = chunk
+                self._batch[len(chunk) :] = 0
+
+                probabilities[start : start + len(chunk)] = self._predict(self._batch)[
+                    : len(chunk)
+                ]
+
+        return probabilities
+
+    def predict_digits(self, digits: np.ndarray):
+        """Interpreta os dígitos de um captcha. Retorna a tupla (texto, confiança por dígito)."""
+
+        probabilities = self.predict(digits)
+
+        interpreted_captcha = "".join(
+            str(digit) for digit in probabilities.argmax(axis=1)
+        )
+
+        return interpreted_captcha, probabilities.max(axis=1)
+
+    def solve(self, bites_stream, filename: str):
+        """Processa o captcha em bites e o interpreta. As imagens de qualidade média são
+        escolhidas pela confiança do próprio solver.
+
+        Retorna a tupla (texto, confiança por dígito), ou (None, None) caso seja necessário
+        pedir outro captcha."""
+
+        digits = digits_extractor(
+            bites_stream,
+            filename,
+            max_digits=self.max_digits,
+            selection_mode="confidence",
+            classifier=self,
+        )
+
+        if digits is None:
+            return None, None
+
+        return self.predict_digits(digits)
@@ -0,0 +1,403 @@
+"""Exportação da base de dados dos fundos para formatos colunares, lidos sem consultas SQL.
+
+ - "npy": uma matriz datas x fundos por coluna (Quota.npy, Captação_dia.npy, ..., float64
+ com NaN nos dias sem dado) e as datas das linhas em Data.npy (datetime64[D]). As matrizes
+ são abertas com np.load(arquivo, mmap_mode="r"), ver load_matrix.
+
+ - "parquet" / "arrow" (pyarrow, opcional): tabela longa (cnpj, Data, colunas), com uma
+ parte (part-00000.parquet, ...) por exportação, lidas em conjunto como um pyarrow.dataset,
+ ver load_dataset.
+
+O manifest.json do diretório guarda o formato, as colunas, o intervalo, os fundos (na ordem
+das colunas das matrizes) e o último dia exportado de cada fundo. Columnar_Export.append
+exporta somente os dias gravados desde a última exportação: no formato npy, as datas novas
+são acrescentadas ao final dos arquivos (somente o cabeçalho .npy é reescrito) e os dias de
+datas já exportadas são gravados no lugar. Fundos novos, ou uma data anterior à última linha
+das matrizes, exigem a exportação completa das matrizes, feita automaticamente. A exportação
+completa grava as matrizes em arquivos temporários, que só substituem as anteriores
+(os.replace) ao final: as matrizes abertas por load_matrix não são alteradas."""
+
+import os
+import json
+import struct
+import datetime
+import logging
+import logging.config
+
+import numpy as np
+
+from Read_from_DB import Read_from_SQLlite, VALUE_COLUMNS
+
+# O pyarrow é opcional, somente para os formatos parquet e arrow
+try:
+    import pyarrow as pa
+    import pyarrow.dataset
+    import pyarrow.ipc
+    import pyarrow.parquet
+except ImportError:
+    pa = None
+
+# Configura o display e salvamento de logs
+logging.config.fileConfig(
+    os.path.join(os.path.dirname(os.path.abspath(__file__)), "logging.conf"),
+    disable_existing_loggers=False,
+)
+logger = logging.getLogger("database")
+
+FORMATS = ("npy", "parquet", "arrow")
+MANIFEST = "manifest.json"
+
+# Cabeçalho dos arquivos .npy com tamanho fixo: o shape cresce sem mover os dados
+_HEADER_SIZE = 256
+
+
+def _npy_header(shape: tuple, dtype) -> bytes:
+    "Cabeçalho .npy (versão 1.0) com exatamente _HEADER_SIZE bytes"
+
+    header = repr(
+        {
+            "descr": np.lib.format.dtype_to_descr(np.dtype(dtype)),
+            "fortran_order": False,
+            "shape": tuple(shape),
+        }
+    )
+    header = header.ljust(_HEADER_SIZE - 11) + "\n"
+
+    return (
+        np.lib.format.MAGIC_PREFIX
+        + b"\x01\x00"
+        + struct.pack("<H", len(header))
+        + header.encode("latin1")
+    )
+
+
+def _resize_npy(path: str, old_rows: int, shape: tuple, dtype, fill) -> np.memmap:
+    """Cria (old_rows=0) ou acrescenta linhas ao arquivo .npy, preenchidas com fill, e
+    retorna o memmap do arquivo inteiro. As old_rows primeiras linhas não são alteradas."""
+
+    row_bytes = np.dtype(dtype).itemsize * int(np.prod(shape[1:], dtype=np.int64))
+
+    with open(path, "r+b" if old_rows else "wb") as npy_file:
+        npy_file.truncate(_HEADER_SIZE + shape[0] * row_bytes)
+        npy_file.write(_npy_header(shape, dtype))
+
+    matrix = np.lib.format.open_memmap(path, mode="r+")
+    matrix[old_rows:] = fill
+
+    return matrix
+
+
+def load_matrix(directory: str, column: str = "Quota", mmap_mode: str = "r"):
+    """Definição: abre a matriz de uma exportação no formato npy, sem copiá-la para a
+    memória (mmap_mode="r").
+
+    Retorna a tupla (datas datetime64[D], CNPJs, matriz datas x fundos)."""
+
+    manifest = _read_manifest(directory)
+    if manifest["format"] != "npy":
+        raise ValueError(f"A exportação em {directory} não está no formato npy.")
+
+    dates = np.load(os.path.join(directory, "Data.npy"), mmap_mode=mmap_mode)
+    matrix = np.load(os.path.join(directory, f"{column}.npy"), mmap_mode=mmap_mode)
+
+    return dates, manifest["funds"], matrix
+
+
+def _read_manifest(directory: str) -> dict:
+
+    with open(os.path.join(directory, MANIFEST)) as json_file:
+        return json.load(json_file)
+
+
+def load_dataset(directory: str):
+    """Definição: partes de uma exportação parquet ou arrow como um pyarrow.dataset, lido sob
+    demanda (ex.: load_dataset(d).to_table(filter=pyarrow.dataset.field("cnpj") == ...))."""
+
+    if pa is None:
+        raise ImportError("pyarrow não está instalado.")
+
+    manifest = _read_manifest(directory)
+    if manifest["format"] == "npy":
+        raise ValueError(f"A exportação em {directory} está no formato npy.")
+
+    return pa.dataset.dataset(
+        [os.path.join(directory, name) for name in manifest["parts"]],
+        format="parquet" if manifest["format"] == "parquet" else "ipc",
+    )
+
+
+class Columnar_Export(object):
+    """Exporta a base de dados de um Write_to_SQLlite (qualquer layout) para o diretório.
+
+    - data_base_name: base de dados, lida pelo Read_from_SQLlite (somente leitura).
+    - directory: diretório da exportação, com o manifest.json.
+    - chunk: número de fundos lidos por vez."""
+
+    def __init__(self, data_base_name: str, directory: str, chunk: int = 400):
+
+        self.directory = directory
+        self.chunk = chunk
+        self.reader = Read_from_SQLlite(data_base_name)
+
+        os.makedirs(directory, exist_ok=True)
+
+    def _path(self, name: str) -> str:
+
+        return os.path.join(self.directory, name)
+
+    def _write_manifest(self, manifest: dict):
+        """Gravado por último: uma exportação interrompida é refeita a partir do anterior
+        (as linhas já registradas no manifest não são alteradas por uma exportação
+        incremental, e a completa só substitui os arquivos ao final)"""
+
+        manifest["exported_at"] = datetime.datetime.now().isoformat(timespec="seconds")
+
+        with open(self._path(MANIFEST + ".tmp"), "w") as json_file:
+            json.dump(manifest, json_file, indent=2, ensure_ascii=False)
+        os.replace(self._path(MANIFEST + ".tmp"), self._path(MANIFEST))
+
+    def _iter_new(self, cnpjs: list, exported: dict, start, end, columns):
+        """Séries dos fundos em lotes de self.chunk, somente com os dias posteriores ao
+        último dia exportado de cada fundo (exported, {CNPJ: 'yyyy-mm-dd'})."""
+
+        for index in range(0, len(cnpjs), self.chunk):
+            batch = cnpjs[index : index + self.chunk]
+
+            # Leitura a partir do fundo menos atualizado do lote
+            last_dates = [exported.get(CNPJ) for CNPJ in batch]
+            batch_start = start
+            if all(last_dates):
+                first = np.datetime64(min(last_dates), "D") + 1
+                batch_start = max(first, np.datetime64(start, "D")) if start else first
+
+            series = self.reader.get_series(batch, batch_start, end, columns)
+
+            for CNPJ in batch:
+                if exported.get(CNPJ):
+                    new = series[CNPJ]["Data"] > np.datetime64(exported[CNPJ], "D")
+                    series[CNPJ] = {
+                        key: array[new] for key, array in series[CNPJ].items()
+                    }
+
+            yield series
+
+    def export(self, fmt: str = "npy", start=None, end=None, columns=VALUE_COLUMNS):
+        """Definições: exportação completa, substituindo a exportação do diretório.
+
+        - fmt: "npy", "parquet" ou "arrow".
+        - start / end: intervalo de datas (datetime.date ou 'yyyy-mm-dd'), inclusive.
+        - columns: colunas de VALUE_COLUMNS exportadas.
+
+        Retorna o manifest da exportação."""
+
+        if fmt not in FORMATS:
+            raise ValueError(f"Formato desconhecido: {fmt}.")
+        if fmt != "npy" and pa is None:
+            raise ImportError('pyarrow não está instalado, utilize fmt="npy".')
+
+        # Partes de uma exportação anterior
+        for name in os.listdir(self.directory):
+            if name.startswith("part-"):
+                os.remove(self._path(name))
+
+        manifest = {
+            "format": fmt,
+            "columns": list(columns),
+            "start": None if start is None else str(start),
+            "end": None if end is None else str(end),
+            "funds": self.reader.funds(),
+            "fund_dates": {},
+            "rows": 0,
+            "parts": [],
+        }
+
+        return self._export_new(manifest)
+
+    def append(self, end=None):
+        """Exporta os dias gravados desde a última exportação do diretório (até end, se
+        fornecido). Retorna o manifest atualizado."""
+
+        manifest = _read_manifest(self.directory)
+        if end is not None:
+            manifest["end"] = str(end)
+
+        if manifest["format"] == "npy":
+            new_funds = set(self.reader.funds()) - set(manifest["funds"])
+            if new_funds:
+                logger.info(
+                    f"{len(new_funds)} fundos novos: exportação completa das matrizes."
+                )
+                return self.export(
+                    "npy", manifest["start"], manifest["end"], manifest["columns"]
+                )
+        else:
+            manifest["funds"] = sorted(
+                set(manifest["funds"]) | set(self.reader.funds())
+            )
+
+        return self._export_new(manifest)
+
+    def _export_new(self, manifest: dict) -> dict:
+
+        if manifest["format"] == "npy":
+            exported = self._export_npy(manifest)
+        else:
+            exported = self._export_part(manifest)
+
+        if exported is None:
+            return self.export(
+                "npy", manifest["start"], manifest["end"], manifest["columns"]
+            )
+
+        self._write_manifest(manifest)
+        logger.info(
+            f"Exportação {manifest['format']} em {self.directory}: {exported} dias de fundos."
+        )
+
+        return manifest
+
+    def _export_npy(self, manifest: dict) -> int:
+        """Grava os dias novos nas matrizes. Retorna o número de valores de Quota gravados,
+        ou None se a exportação completa for necessária."""
+
+        cnpjs, exported = manifest["funds"], manifest["fund_dates"]
+        columns, start, end = manifest["columns"], manifest["start"], manifest["end"]
+        old_rows = manifest["rows"]
+
+        # Primeira leitura: as datas novas (linhas acrescentadas às matrizes)
+        new_dates = [np.array([], dtype="datetime64[D]")]
+        for series in self._iter_new(cnpjs, exported, start, end, ()):
+            new_dates.extend(fund["Data"] for fund in series.values())
+        new_dates = np.unique(np.concatenate(new_dates))
+
+        old_dates = np.array([], dtype="datetime64[D]")
+        if old_rows:
+            old_dates = np.load(self._path("Data.npy"), mmap_mode="r")[:old_rows]
+            new_dates = np.setdiff1d(new_dates, old_dates)
+
+            if new_dates.size and new_dates[0] < old_dates[-1]:
+                logger.info("Data anterior à última linha: exportação completa.")
+                return None
+
+        dates = np.concatenate([old_dates, new_dates])
+        last_date = str(dates[-1]) if dates.size else None
+
+        # Exportação completa em arquivos temporários, sem truncar as matrizes atuais
+        suffix = "" if old_rows else ".tmp"
+        names = ["Data.npy"] + [f"{column}.npy" for column in columns]
+
+        shape = (dates.size, len(cnpjs))
+        date_file = _resize_npy(
+            self._path("Data.npy" + suffix),
+            old_rows,
+            shape[:1],
+            "M8[D]",
+            np.datetime64("NaT"),
+        )
+        date_file[old_rows:] = new_dates
+        date_file.flush()
+        matrices = {
+            column: _resize_npy(
+                self._path(f"{column}.npy" + suffix),
+                old_rows,
+                shape,
+                np.float64,
+                np.nan,
+            )
+            for column in columns
+        }
+
+        # Segunda leitura: os valores, até a última data das matrizes
+        exported_values = 0
+        for index, series in enumerate(
+            self._iter_new(cnpjs, exported, start, last_date, columns)
+        ):
+            for j, CNPJ in enumerate(series, start=index * self.chunk):
+                fund = series[CNPJ]
+                rows = np.searchsorted(dates, fund["Data"])
+
+                # Dias gravados entre as duas leituras, em datas fora das matrizes
+                found = (rows < dates.size) & (
+                    dates[np.minimum(rows, dates.size - 1)] == fund["Data"]
+                )
+                for column in columns:
+                    matrices[column][rows[found], j] = fund[column][found]
+
+                if found.any():
+                    exported[CNPJ] = str(fund["Data"][found][-1])
+                    exported_values += int(found.sum())
+
+        for matrix in matrices.values():
+            matrix.flush()
+        del date_file, matrices
+
+        if suffix:
+            for name in names:
+                os.replace(self._path(name + suffix), self._path(name))
+
+        manifest["rows"] = int(dates.size)
+        manifest["last_date"] = last_date
+
+        return exported_values
+
+    def _export_part(self, manifest: dict) -> int:
+        "Grava os dias novos numa nova parte parquet / arrow. Retorna o número de linhas."
+
+        if pa is None:
+            raise ImportError("pyarrow não está instalado.")
+
+        cnpjs, exported = manifest["funds"], manifest["fund_dates"]
+        columns = manifest["columns"]
+
+        schema = pa.schema(
+            [("cnpj", pa.string()), ("Data", pa.date32())]
+            + [(column, pa.float64()) for column in columns]
+        )
+        name = f"part-{len(manifest['parts']):05d}.{manifest['format']}"
+
+        if manifest["format"] == "parquet":
+            writer = pa.parquet.ParquetWriter(self._path(name), schema)
+        else:
+            writer = pa.ipc.new_file(self._path(name), schema)
+
+        rows = 0
+        try:
+            for series in self._iter_new(
+                cnpjs, exported, manifest["start"], manifest["end"], columns
+            ):
+                funds = [CNPJ for CNPJ in series if series[CNPJ]["Data"].size]
+                if not funds:
+                    continue
+
+                lengths = [series[CNPJ]["Data"].size for CNPJ in funds]
+                arrays = [
+                    pa.array(np.repeat(funds, lengths), pa.string()),
+                    pa.array(np.concatenate([series[CNPJ]["Data"] for CNPJ in funds])),
+                ] + [
+                    # NaN (dias sem o dado) vira nulo
+                    pa.array(
+                        np.concatenate([series[CNPJ][column] for CNPJ in funds]),
+                        from_pandas=True,
+                    )
+                    for column in columns
+                ]
+                writer.write_table(pa.Table.from_arrays(arrays, schema=schema))
+
+                for CNPJ in funds:
+                    exported[CNPJ] = str(series[CNPJ]["Data"][-1])
+                rows += sum(lengths)
+        finally:
+            writer.close()
+
+        if rows:
+            manifest["parts"].append(name)
+        else:
+            os.remove(self._path(name))
+
+        manifest["last_date"] = max(exported.values(), default=None)
+
+        return rows
+
+    def close_connection(self):
+
+        self.reader.close_connection()
@@ -0,0 +1,375 @@
+"""Indicadores dos fundos, calculados para todos os fundos de uma vez (matriz data x fundo).
+
+ 1) to_matrix: alinha as séries do Read_from_SQLlite.get_series numa matriz (datas x fundos),
+ com NaN nos dias sem dado do fundo.
+
+ 2) daily_returns, monthly_returns, rolling_volatility, drawdown e net_flows: operações
+ vetorizadas sobre as matrizes, sem laços por fundo.
+
+ 3) Fund_Analytics: materializa os indicadores nas tabelas analytics_daily (retorno diário,
+ volatilidade móvel anualizada, drawdown e captação líquida) e analytics_monthly (retorno e
+ captação líquida do mês). A tabela analytics_state guarda, por fundo, a última data
+ processada, o pico da cota e o drawdown máximo, de modo que update() processa somente os
+ dias gravados após a última execução (com uma janela anterior para a volatilidade e o
+ retorno do mês).
+
+Uso: python3 Fund_Analytics.py [base de dados] [--rebuild]"""
+
+import os
+import sys
+import math
+import sqlite3
+import datetime
+import logging
+import logging.config
+
+import numpy as np
+
+from Read_from_DB import Read_from_SQLlite
+
+# Configura o display e salvamento de logs
+logging.config.fileConfig(
+    os.path.join(os.path.dirname(os.path.abspath(__file__)), "logging.conf"),
+    disable_existing_loggers=False,
+)
+logger = logging.getLogger("database")
+
+
+def to_matrix(series: dict, column: str, dates: np.ndarray = None):
+    """Definições:
+     - series: resultado do get_series, {CNPJ: {"Data": ..., coluna: ...}}.
+     - column: coluna que será alinhada.
+     - dates: datas (linhas) da matriz. Se None, a união das datas de todos os fundos.
+
+     Retorna a tupla (datas, CNPJs, matriz float64 no shape datas x fundos)."""
+
+    cnpjs = list(series)
+
+    if dates is None:
+        dates = np.unique(
+            np.concatenate(
+                [fund["Data"] for fund in series.values()]
+                + [np.array([], dtype="datetime64[D]")]
+            )
+        )
+
+    matrix = np.full((dates.size, len(cnpjs)), np.nan)
+    for j, CNPJ in enumerate(cnpjs):
+        rows = np.searchsorted(dates, series[CNPJ]["Data"])
+        matrix[rows, j] = series[CNPJ][column]
+
+    return dates, cnpjs, matrix
+
+
+def _ffill(matrix: np.ndarray) -> np.ndarray:
+    "Repete o último valor disponível de cada coluna nas linhas seguintes com NaN"
+
+    rows = np.where(np.isnan(matrix), 0, np.arange(matrix.shape[0])[:, None])
+    np.maximum.accumulate(rows, axis=0, out=rows)
+
+    return matrix[rows, np.arange(matrix.shape[1])]
+
+
+def daily_returns(quota: np.ndarray) -> np.ndarray:
+    """Retorno de cada dia com cota em relação à cota disponível anterior (NaN nos dias sem
+    cota e no primeiro dia de cada fundo)."""
+
+    previous = np.vstack([np.full((1, quota.shape[1]), np.nan), _ffill(quota)[:-1]])
+
+    return quota / previous - 1
+
+
+def monthly_returns(dates: np.ndarray, quota: np.ndarray):
+    """Retorno de cada mês: última cota do mês sobre a última cota do mês anterior.
+    Retorna a tupla (meses datetime64[M], matriz meses x fundos). O primeiro mês da matriz
+    não tem mês anterior e fica NaN."""
+
+    months = dates.astype("datetime64[M]")
+    last_rows = np.flatnonzero(np.append(months[1:] != months[:-1], True))
+
+    month_end = _ffill(quota)[last_rows]
+    returns = np.vstack(
+        [np.full((1, quota.shape[1]), np.nan), month_end[1:] / month_end[:-1] - 1]
+    )
+
+    # Meses sem nenhuma cota do fundo
+    has_quota = np.add.reduceat(~np.isnan(quota), _month_starts(months), axis=0) > 0
+    returns[~has_quota] = np.nan
+
+    return months[last_rows], returns
+
+
+def _month_starts(months: np.ndarray) -> np.ndarray:
+
+    return np.flatnonzero(np.insert(months[1:] != months[:-1], 0, True))
+
+
+def rolling_volatility(
+    returns: np.ndarray, window: int = 21, periods: int = 252, min_periods: int = None
+) -> np.ndarray:
+    """Desvio padrão (ddof=1) dos últimos window retornos de cada fundo, anualizado por
+    sqrt(periods). A janela conta somente os dias com retorno do próprio fundo; com menos de
+    min_periods retornos (por padrão, metade da janela) o resultado é NaN."""
+
+    min_periods = max(2, window // 2 if min_periods is None else min_periods)
+
+    # Retornos de cada fundo no topo da coluna, na ordem original, e NaN abaixo
+    valid = ~np.isnan(returns)
+    order = np.argsort(~valid, axis=0, kind="stable")
+    values = np.take_along_axis(np.where(valid, returns, 0.0), order, axis=0)
+    filled = np.take_along_axis(valid, order, axis=0).astype(np.float64)
+
+    # Soma da janela terminada na linha i: total[i + 1] - total[i + 1 - window]
+    lower = np.maximum(np.arange(returns.shape[0]) + 1 - window, 0)
+
+    def window_sum(x):
+        total = np.cumsum(np.vstack([np.zeros((1, x.shape[1])), x]), axis=0)
+        return total[1:] - total[lower]
+
+    count = window_sum(filled)
+    total = window_sum(values)
+    squares = window_sum(values ** 2)
+
+    with np.errstate(invalid="ignore", divide="ignore"):
+        variance = (squares - total ** 2 / count) / (count - 1)
+
+    variance = np.where(
+        (count >= min_periods) & (filled > 0), np.maximum(variance, 0), np.nan
+    )
+
+    volatility = np.empty_like(variance)
+    np.put_along_axis(volatility, order, np.sqrt(variance * periods), axis=0)
+
+    return volatility
+
+
+def drawdown(quota: np.ndarray, peak: np.ndarray = None):
+    """Queda da cota em relação ao maior valor anterior. peak: pico anterior à primeira linha
+    (uma linha por fundo), para continuar um cálculo incremental.
+    Retorna a tupla (drawdown, pico acumulado em cada linha)."""
+
+    filled = _ffill(quota)
+    if peak is None:
+        peak = np.full(quota.shape[1], np.nan)
+
+    peaks = np.fmax.accumulate(np.vstack([peak, filled]), axis=0)[1:]
+
+    return quota / peaks - 1, peaks
+
+
+def net_flows(inflows: np.ndarray, outflows: np.ndarray) -> np.ndarray:
+    """Captação líquida (captação - resgate). NaN somente se ambos estiverem em branco."""
+
+    missing = np.isnan(inflows) & np.isnan(outflows)
+
+    return np.where(missing, np.nan, np.nan_to_num(inflows) - np.nan_to_num(outflows))
+
+
+def _nullable(values: np.ndarray) -> list:
+    "NaN -> None (NULL no SQLite)"
+
+    return np.where(np.isnan(values), None, values).tolist()
+
+
+class Fund_Analytics(object):
+    """Mantém os indicadores materializados de todos os fundos da base de dados.
+
+    - data_base_name: base de dados do Write_to_SQLlite (qualquer layout).
+    - window: janela da volatilidade móvel, em número de retornos diários do fundo.
+    - periods: dias por ano na anualização da volatilidade.
+    - chunk: número de fundos processados por vez (uma matriz e uma transação por lote)."""
+
+    def __init__(
+        self, data_base_name: str, window: int = 21, periods: int = 252, chunk=500
+    ):
+
+        self.window = window
+        self.periods = periods
+        self.chunk = chunk
+
+        self.reader = Read_from_SQLlite(data_base_name)
+        self.conn = sqlite3.connect(
+            data_base_name, detect_types=sqlite3.PARSE_DECLTYPES
+        )
+        self.c = self.conn.cursor()
+
+        self.c.execute(
+            """CREATE TABLE IF NOT EXISTS analytics_daily(cnpj TEXT, Data DATE, daily_return REAL,
+            volatility REAL, drawdown REAL, net_flow REAL, PRIMARY KEY (cnpj, Data)) WITHOUT ROWID"""
+        )
+        self.c.execute(
+            """CREATE TABLE IF NOT EXISTS analytics_monthly(cnpj TEXT, month TEXT, monthly_return REAL,
+            net_flow REAL, PRIMARY KEY (cnpj, month)) WITHOUT ROWID"""
+        )
+        self.c.execute(
+            """CREATE TABLE IF NOT EXISTS analytics_state(cnpj TEXT PRIMARY KEY, last_date DATE,
+            peak_quota REAL, max_drawdown REAL) WITHOUT ROWID"""
+        )
+
+    def _lookback(self, last_date: datetime.date) -> datetime.date:
+        """Início da leitura de um fundo já processado: janela da volatilidade (em dias
+        corridos) e o mês anterior completo, para o retorno do mês de last_date."""
+
+        window_days = math.ceil(self.window * 7 / 5) + 10
+        previous_month = (
+            last_date.replace(day=1) - datetime.timedelta(days=1)
+        ).replace(day=1)
+
+        return min(previous_month, last_date - datetime.timedelta(days=window_days))
+
+    def update(self) -> int:
+        """Processa os dias gravados após a última execução de cada fundo. Retorna o número
+        de fundos atualizados."""
+
+        self.c.execute("SELECT cnpj, last_date FROM fund_watermarks;")
+        watermarks = dict(self.c.fetchall())
+
+        self.c.execute(
+            "SELECT cnpj, last_date, peak_quota, max_drawdown FROM analytics_state;"
+        )
+        states = {CNPJ: state for CNPJ, *state in self.c.fetchall()}
+
+        # Fundos novos (histórico completo) e fundos com dias ainda não processados
+        new_funds = sorted(CNPJ for CNPJ in watermarks if CNPJ not in states)
+        stale_funds = sorted(
+            CNPJ
+            for CNPJ, last_date in watermarks.items()
+            if CNPJ in states and last_date > states[CNPJ][0]
+        )
+
+        for funds in (new_funds, stale_funds):
+            for index in range(0, len(funds), self.chunk):
+                self._update_funds(funds[index : index + self.chunk], states)
+
+        updated = len(new_funds) + len(stale_funds)
+        logger.info(f"Indicadores atualizados para {updated} fundos.")
+
+        return updated
+
+    def _update_funds(self, cnpjs: list, states: dict):
+
+        # Fundos novos precisam de todo o histórico
+        start = None
+        if all(CNPJ in states for CNPJ in cnpjs):
+            start = self._lookback(min(states[CNPJ][0] for CNPJ in cnpjs))
+
+        series = self.reader.get_series(
+            cnpjs, start=start, columns=("Quota", "Captação_dia", "Resgate_dia")
+        )
+        dates, cnpjs, quota = to_matrix(series, "Quota")
+        if not dates.size:
+            return None
+
+        _, _, inflows = to_matrix(series, "Captação_dia", dates)
+        _, _, outflows = to_matrix(series, "Resgate_dia", dates)
+
+        # Última data, pico da cota e drawdown máximo do histórico já processado
+        previous = [states.get(CNPJ, (None, np.nan, np.nan)) for CNPJ in cnpjs]
+        last_dates = [state[0] for state in previous]
+        peak = np.array([state[1] for state in previous], dtype=np.float64)
+        max_dd = np.array([state[2] for state in previous], dtype=np.float64)
+
+        returns = daily_returns(quota)
+        volatility = rolling_volatility(returns, self.window, self.periods)
+        drawdowns, peaks = drawdown(quota, peak)
+        flows = net_flows(inflows, outflows)
+
+        # Somente os dias posteriores à última execução de cada fundo
+        processed = np.array(
+            [
+                np.datetime64(last_date, "D")
+                if last_date is not None
+                else np.datetime64("NaT")
+                for last_date in last_dates
+            ],
+            dtype="datetime64[D]",
+        )
+        new_rows = ~np.isnan(quota) & ~(dates[:, None] <= processed[None, :])
+
+        rows, funds = np.nonzero(new_rows)
+        daily = zip(
+            np.array(cnpjs, dtype=object)[funds].tolist(),
+            dates[rows].tolist(),
+            *(
+                _nullable(matrix[rows, funds])
+                for matrix in (returns, volatility, drawdowns, flows)
+            ),
+        )
+
+        # Meses a partir do mês da última execução (o próprio mês pode ter mudado)
+        months, monthly = monthly_returns(dates, quota)
+        starts = _month_starts(dates.astype("datetime64[M]"))
+        has_quota = np.add.reduceat(~np.isnan(quota), starts, axis=0) > 0
+        monthly_flows = np.add.reduceat(np.nan_to_num(flows), starts, axis=0)
+        new_months = has_quota & ~(
+            months[:, None] < processed[None, :].astype("datetime64[M]")
+        )
+
+        rows, funds = np.nonzero(new_months)
+        month_rows = zip(
+            np.array(cnpjs, dtype=object)[funds].tolist(),
+            months[rows].astype(str).tolist(),
+            _nullable(monthly[rows, funds]),
+            monthly_flows[rows, funds].tolist(),
+        )
+
+        # Estado final de cada fundo
+        has_new = new_rows.any(axis=0)
+        last_rows = dates.size - 1 - np.argmax(~np.isnan(quota[::-1]), axis=0)
+        max_dd = np.fmin(
+            max_dd, np.fmin.reduce(np.where(new_rows, drawdowns, np.nan), axis=0)
+        )
+        state_rows = [
+            (CNPJ, dates[last_rows[j]].tolist(), float(peaks[-1, j]), float(max_dd[j]))
+            for j, CNPJ in enumerate(cnpjs)
+            if has_new[j]
+        ]
+
+        with self.conn:
+            self.c.executemany(
+                "INSERT OR REPLACE INTO analytics_daily VALUES (?, ?, ?, ?, ?, ?);",
+                daily,
+            )
+            self.c.executemany(
+                "INSERT OR REPLACE INTO analytics_monthly VALUES (?, ?, ?, ?);",
+                month_rows,
+            )
+            self.c.executemany(
+                "INSERT OR REPLACE INTO analytics_state VALUES (?, ?, ?, ?);",
+                state_rows,
+            )
+
+        for CNPJ, last_date, peak_quota, max_drawdown in state_rows:
+            states[CNPJ] = (last_date, peak_quota, max_drawdown)
+
+    def rebuild(self) -> int:
+        "Apaga os indicadores materializados e os recalcula a partir de todo o histórico"
+
+        with self.conn:
+            for table in ("analytics_daily", "analytics_monthly", "analytics_state"):
+                self.c.execute(f"DELETE FROM {table};")
+
+        return self.update()
+
+    def close_connection(self):
+
+        self.reader.close_connection()
+        self.c.close()
+        self.conn.close()
+
+
+if __name__ == "__main__":
+
+    data_base_name = next(
+        (arg for arg in sys.argv[1:] if arg != "--rebuild"),
+        "Fundos de Investimento2.db",
+    )
+
+    analytics = Fund_Analytics(data_base_name)
+    try:
+        if "--rebuild" in sys.argv:
+            analytics.rebuild()
+        else:
+            analytics.update()
+    finally:
+        analytics.close_connection()
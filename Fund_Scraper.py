@@ -0,0 +1,407 @@
+"""Fluxo de coleta dos dados de um fundo no site da CVM e execução concorrente desse fluxo.
+
+ 1) log_in: resolve o captcha e loga na página com o CNPJ do fundo (até max_tries tentativas).
+
+ 2) fetch_tables: navega até a seção de dados diários e coleta a tabela html dos meses
+ planejados por plan_months: todos os meses para um fundo novo ou, para os demais, somente
+ os meses que podem conter dias posteriores ao último dado gravado.
+
+ 3) scrape_fund: wrapper das duas funções acima para um fundo. scrape_fund_http faz o mesmo
+ sem browser, com o CVM_HTTP_Page, e coleta os meses com postbacks simultâneos na mesma
+ sessão logada.
+
+ 4) feed_tables: grava as tabelas de um fundo em ordem cronológica, parando no primeiro mês
+ que não pôde ser gravado: a data do último dado gravado nunca salta um mês faltante, que
+ volta ao plano na próxima execução.
+
+ 5) run_concurrently: descarta os fundos já atualizados (data do último dado gravado igual
+ ou posterior ao dia útil anterior) e distribui os demais entre workers (threads). Cada
+ worker consome os CNPJs de uma fila compartilhada e utiliza um browser do Browser_Pool, que
+ mantém os browsers abertos entre um fundo e outro (ou uma sessão HTTP, no engine "http"). As
+ tabelas coletadas são gravadas no banco de dados pela thread principal, já que a conexão
+ SQLite não deve ser compartilhada entre threads."""
+
+import os
+import time
+import datetime
+import queue
+import threading
+import logging
+import logging.config
+from collections import namedtuple
+
+from CVM_WebPage import CVM_Page
+from Browser_Pool import Browser_Pool
+from CVM_HTTP_Page import CVM_HTTP_Page, make_adapter
+
+# Configura o display e salvamento de logs
+logging.config.fileConfig(
+    os.path.join(os.path.dirname(os.path.abspath(__file__)), "logging.conf"),
+    disable_existing_loggers=False,
+)
+logger = logging.getLogger("main")
+
+# Resultado da coleta de cada fundo. status: "ok", "login_failed", "error" ou "up_to_date"
+Fund_Result = namedtuple(
+    "Fund_Result", ["CNPJ", "fund_name", "status", "tries", "tables", "elapsed"]
+)
+
+
+def log_in(CVM: CVM_Page, CNPJ: str, fund_name: str, solver, max_tries: int = 7):
+    """Tenta logar na página do fundo. Retorna o número de tentativas ou None caso não
+    tenha conseguido logar em max_tries tentativas."""
+
+    # Browsers devolvidos pelo Browser_Pool já estão na página de acesso
+    if CVM.driver.current_url != CVM.url:
+        CVM.go()
+
+    CVM.find_frame.go_to_frame()
+
+    for tries in range(1, max_tries + 1):
+
+        interpreted_captcha, confidences = solver.solve(
+            bites_stream=CVM.find_captcha.grab_captcha(), filename=fund_name
+        )
+
+        if interpreted_captcha is None:
+            CVM.ask_new_captcha.click()
+            continue
+
+        logger.debug(f"Captcha interpretado: {interpreted_captcha} ({confidences}).")
+
+        CVM.CNPJ.input_text(text=CNPJ)
+        CVM.captcha_field.input_text(text=interpreted_captcha)
+        CVM.log_in_btn.click()
+
+        # Verificando se tive sucesso em logar:
+        if CVM.select_fund(fund_id=CNPJ).is_present():
+            return tries
+
+    return None
+
+
+def fetch_tables(
+    CVM: CVM_Page, CNPJ: str, n_months: int = None, last_update: datetime.date = None
+) -> list:
+    """Com a página já logada, coleta as tabelas dos meses planejados por plan_months.
+    Retorna uma lista de tuplas (mês no formato mm/yyyy, tabela html)."""
+
+    # Clicando no fundo de interesse:
+    CVM.select_fund(fund_id=CNPJ).click()
+
+    # Indo para a tabela de interesse:
+    CVM.go_to_tables.click()
+
+    # Obtendo os meses disponíveis para aquele dado fundo:
+    all_months = CVM.select_months.months_available()
+
+    tables = []
+    for month in plan_months(all_months, last_update, n_months):
+        CVM.select_months.pick_month(month_year=month)
+        tables.append((month, CVM.table.fetch_data()))
+
+    return tables
+
+
+def scrape_fund(
+    CVM: CVM_Page,
+    CNPJ: str,
+    fund_name: str,
+    solver,
+    max_tries: int = 7,
+    n_months=None,
+    last_update: datetime.date = None,
+) -> Fund_Result:
+
+    start = time.perf_counter()
+    tries = log_in(CVM, CNPJ, fund_name, solver, max_tries)
+
+    if tries is None:
+        logger.warning(
+            f"Não conseguimos logar na tentativa de atualização do fundo: {fund_name}"
+        )
+        # O Browser_Pool descarta o browser, que pode estar travado
+        CVM.failed = True
+        return Fund_Result(
+            CNPJ, fund_name, "login_failed", max_tries, [], time.perf_counter() - start
+        )
+
+    logger.info(f"Número de tentativas de log no fundo {fund_name}: {tries}.")
+
+    tables = fetch_tables(CVM, CNPJ, n_months, last_update)
+
+    return Fund_Result(
+        CNPJ, fund_name, "ok", tries, tables, time.perf_counter() - start
+    )
+
+
+def plan_months(
+    all_months: str, last_update: datetime.date = None, n_months: int = None
+) -> list:
+    """Meses do picklist (formato mm/yyyy, um por linha) que devem ser coletados:
+
+     - last_update None (fundo sem dados na base): todos os meses, histórico completo.
+     - demais fundos: meses a partir do mês de last_update, exceto esse próprio mês caso
+     last_update já seja o seu último dia útil (mês completo).
+     - n_months: limita o plano aos n_months meses mais recentes.
+
+    Retorna os meses na ordem do picklist (mais recente primeiro)."""
+
+    months = [month.strip() for month in all_months.split("\n") if month.strip() != ""]
+
+    if last_update is not None:
+        first_month = (last_update.year, last_update.month)
+        if last_update >= _last_business_day(*first_month):
+            first_month = (
+                (last_update.year + 1, 1)
+                if last_update.month == 12
+                else (last_update.year, last_update.month + 1)
+            )
+
+        months = [
+            month for month in months if (int(month[3:]), int(month[:2])) >= first_month
+        ]
+
+    return months[0:n_months]
+
+
+def feed_tables(SQL_DB, CNPJ: str, tables: list) -> int:
+    """Grava as tabelas (mês no formato mm/yyyy, tabela html) do fundo do mais antigo para o
+    mais recente. No primeiro mês que falhar (tabela indisponível ou erro de gravação), os
+    meses seguintes não são gravados, para que a data do último dado gravado não avance além
+    dele. Retorna o número de meses gravados."""
+
+    SQL_DB.get_last_update(CNPJ_fund=CNPJ)
+
+    tables = sorted(tables, key=lambda item: (int(item[0][3:]), int(item[0][:2])))
+    for fed, (month, table_data) in enumerate(tables):
+        if not SQL_DB.feed_SQL_DB(table_data, month):
+            logger.error(
+                f"Fundo {CNPJ}: meses a partir de {month} não gravados "
+                f"({len(tables) - fed} meses); serão coletados na próxima execução."
+            )
+            return fed
+
+    return len(tables)
+
+
+def _last_business_day(year: int, month: int) -> datetime.date:
+
+    next_month = datetime.date(year + month // 12, month % 12 + 1, 1)
+
+    return previous_business_day(next_month)
+
+
+def previous_business_day(today: datetime.date = None) -> datetime.date:
+    """Dia útil anterior a today: data mais recente que pode estar disponível no site da
+    CVM. Considera apenas os fins de semana (sem calendário de feriados)."""
+
+    day = (today or datetime.date.today()) - datetime.timedelta(days=1)
+
+    while day.weekday() >= 5:
+        day -= datetime.timedelta(days=1)
+
+    return day
+
+
+def scrape_fund_http(
+    CVM: CVM_HTTP_Page,
+    CNPJ: str,
+    fund_name: str,
+    solver,
+    max_tries: int = 7,
+    n_months=None,
+    last_update: datetime.date = None,
+    month_workers: int = 4,
+) -> Fund_Result:
+    """Mesmo fluxo do scrape_fund, mas sem browser: formulários enviados via HTTP. Os meses
+    são coletados com até month_workers postbacks simultâneos."""
+
+    start = time.perf_counter()
+    CVM.go()
+
+    for tries in range(1, max_tries + 1):
+
+        interpreted_captcha, _ = solver.solve(
+            bites_stream=CVM.grab_captcha(), filename=fund_name
+        )
+
+        if interpreted_captcha is None:
+            CVM.ask_new_captcha()
+            continue
+
+        if CVM.log_in(CNPJ, interpreted_captcha):
+            break
+    else:
+        logger.warning(
+            f"Não conseguimos logar na tentativa de atualização do fundo: {fund_name}"
+        )
+        return Fund_Result(
+            CNPJ, fund_name, "login_failed", max_tries, [], time.perf_counter() - start
+        )
+
+    logger.info(f"Número de tentativas de log no fundo {fund_name}: {tries}.")
+
+    CVM.select_fund(CNPJ)
+    CVM.go_to_tables()
+
+    tables = CVM.fetch_months(
+        plan_months(CVM.months_available(), last_update, n_months), month_workers
+    )
+
+    return Fund_Result(
+        CNPJ, fund_name, "ok", tries, tables, time.perf_counter() - start
+    )
+
+
+def _worker(jobs: queue.Queue, results: queue.Queue, session, scrape, solver, **kwargs):
+    """Consome os fundos da fila até esvaziá-la. session() retorna um context manager
+    com a página (CVM_Page do pool de browsers ou CVM_HTTP_Page) usada por scrape.
+    Cada item da fila é a tupla (CNPJ, nome do fundo, data do último dado gravado)."""
+
+    while True:
+        try:
+            CNPJ, fund_name, last_update = jobs.get_nowait()
+        except queue.Empty:
+            return
+
+        logger.info(f"Atualizando dados do fundo: {fund_name}.")
+        start = time.perf_counter()
+
+        try:
+            with session() as CVM:
+                result = scrape(
+                    CVM, CNPJ, fund_name, solver, last_update=last_update, **kwargs
+                )
+        except Exception as err:
+            logger.exception(f"Erro ao coletar os dados do fundo {fund_name}: {err}.")
+            result = Fund_Result(
+                CNPJ, fund_name, "error", 0, [], time.perf_counter() - start
+            )
+
+        results.put(result)
+
+
+def _pending_funds(fundos: dict, SQL_DB, today: datetime.date = None):
+    """Separa os fundos já atualizados, a partir das datas carregadas em SQL_DB.watermarks.
+    Retorna a lista de Fund_Result "up_to_date" e a lista (CNPJ, nome, última data) dos
+    demais."""
+
+    current_date = previous_business_day(today)
+
+    up_to_date, pending = [], []
+    for CNPJ, fund_name in fundos.items():
+        last_update = SQL_DB.last_update_of(CNPJ)
+
+        if last_update >= current_date:
+            up_to_date.append(Fund_Result(CNPJ, fund_name, "up_to_date", 0, [], 0.0))
+        else:
+            pending.append((CNPJ, fund_name, last_update))
+
+    if up_to_date:
+        logger.info(
+            f"{len(up_to_date)} fundos já estão atualizados até {current_date}."
+        )
+
+    return up_to_date, pending
+
+
+def run_concurrently(
+    fundos: dict,
+    make_driver,
+    solver,
+    SQL_DB,
+    workers: int = 4,
+    max_uses: int = 20,
+    engine: str = "selenium",
+    proxies: dict = None,
+    month_workers: int = 4,
+    **kwargs,
+) -> list:
+    """Definições:
+     - fundos: dicionário {CNPJ: nome do fundo}, como em fundos.json.
+     - make_driver: função sem argumentos que cria um novo webdriver.
+     - solver: Captcha_Solver compartilhado entre os workers.
+     - SQL_DB: Write_to_SQLlite onde as tabelas coletadas serão gravadas.
+     - workers: número de browsers abertos simultaneamente.
+     - max_uses: número de fundos coletados por um mesmo browser antes de substituí-lo.
+     - engine: "selenium" (browsers) ou "http" (CVM_HTTP_Page, dispensa o make_driver).
+     - proxies: proxies do requests, utilizados apenas no engine "http".
+     - month_workers: meses coletados simultaneamente por fundo, apenas no engine "http".
+     - **kwargs: max_tries e n_months, repassados ao scrape_fund.
+
+     Retorna a lista de Fund_Result: primeiro os fundos já atualizados (status "up_to_date",
+     sem abrir nenhuma sessão), depois os demais, na ordem em que foram concluídos."""
+
+    outcomes, pending = _pending_funds(fundos, SQL_DB)
+
+    jobs = queue.Queue()
+    for job in pending:
+        jobs.put(job)
+
+    workers = max(1, min(workers, len(pending)))
+    pool = adapter = None
+    threads = []
+
+    # Browsers e conexões são fechados mesmo que a gravação no banco de dados falhe
+    try:
+        if engine == "http":
+            # Pool de conexões compartilhado; cada fundo tem a sua própria sessão (cookies)
+            adapter = make_adapter(pool_maxsize=workers * max(1, month_workers))
+            scrape = scrape_fund_http
+            kwargs["month_workers"] = month_workers
+
+            def session():
+                return CVM_HTTP_Page(adapter=adapter, proxies=proxies)
+
+        else:
+            pool = Browser_Pool(make_driver, size=workers, max_uses=max_uses)
+            session, scrape = pool.session, scrape_fund
+
+        results = queue.Queue()
+        threads = [
+            threading.Thread(
+                target=_worker,
+                args=(jobs, results, session, scrape, solver),
+                kwargs=kwargs,
+                name=f"worker_{i}",
+                daemon=True,
+            )
+            for i in range(workers)
+        ]
+
+        for thread in threads:
+            thread.start()
+
+        while len(outcomes) < len(fundos):
+            result = results.get()
+            outcomes.append(result)
+
+            if result.status != "ok":
+                continue
+
+            # Conectando-se a tabela daquele referido fundo e gravando os meses coletados:
+            feed_tables(SQL_DB, result.CNPJ, result.tables)
+
+            logger.info(
+                f"Base de dados atualizada com dados do fundo: {result.fund_name} "
+                f"({result.elapsed:.1f}s)."
+            )
+
+    finally:
+        # Em caso de erro, os workers terminam o fundo corrente e não iniciam outros
+        while True:
+            try:
+                jobs.get_nowait()
+            except queue.Empty:
+                break
+
+        for thread in threads:
+            thread.join()
+
+        if pool is not None:
+            pool.close()
+        if adapter is not None:
+            adapter.close()
+
+    return outcomes
@@ -0,0 +1,180 @@
+"""Rotinas de manutenção da base de dados SQLlite dos fundos, executadas via terminal.
+
+ - migrate: copia as tabelas table_CNPJ (layout "per_fund") para a tabela única daily_quota
+ (layout "long"). Pode ser executado mais de uma vez, dias já migrados são ignorados.
+
+   python "Maintain DataBase.py" migrate --db "Fundos de Investimento2.db"
+   python "Maintain DataBase.py" migrate --db novo.db --source antigo.db
+
+ - analytics: atualiza os indicadores materializados (retornos, volatilidade, drawdown e
+ captação líquida) com os dias gravados desde a última execução, ou os recalcula do zero.
+
+   python "Maintain DataBase.py" analytics --db "Fundos de Investimento2.db" [--rebuild]
+
+ - aggregates: recalcula os totais diários (daily_totals e daily_category_totals) a partir
+ dos dados gravados, após registrar a categoria dos fundos de --funds ainda sem categoria.
+ Utilizado para reparos ou após alterar manualmente a tabela fund_categories.
+
+   python "Maintain DataBase.py" aggregates --db "Fundos de Investimento2.db" --layout long
+
+ - load: carrega os informes diários (inf_diario_fi_AAAAMM.csv ou .zip) do portal de dados
+ abertos da CVM, somente dos fundos de --funds ou, com --all, de todos os fundos.
+
+   python "Maintain DataBase.py" load --db "Fundos de Investimento2.db" dados/inf_diario_fi_*.zip
+
+ - export: exporta a base de dados para o diretório em formato colunar (npy, parquet ou
+ arrow), ou, com --append, somente os dias gravados desde a última exportação.
+
+   python "Maintain DataBase.py" export exportacao --format npy [--start 2015-01-01]
+   python "Maintain DataBase.py" export exportacao --append"""
+
+import os
+import json
+import argparse
+import logging
+import logging.config
+
+# Mudando para o diretório dos módulos
+os.chdir(os.path.dirname(os.path.abspath(__file__)))
+
+from Write_on_DB import Write_to_SQLlite
+from Fund_Analytics import Fund_Analytics
+from Open_Data_Loader import load_daily_reports
+from Export_DB import Columnar_Export, FORMATS
+
+# Configura o display e salvamento de logs
+logging.config.fileConfig("logging.conf", disable_existing_loggers=False)
+logger = logging.getLogger("database")
+
+
+def migrate(args):
+
+    SQL_DB = Write_to_SQLlite(args.db, tuning=True, layout="long")
+    try:
+        SQL_DB.migrate_to_long_format(source_name=args.source)
+    finally:
+        SQL_DB.close_connection()
+
+
+def analytics(args):
+
+    analytics = Fund_Analytics(args.db)
+    try:
+        if args.rebuild:
+            analytics.rebuild()
+        else:
+            analytics.update()
+    finally:
+        analytics.close_connection()
+
+
+def aggregates(args):
+
+    SQL_DB = Write_to_SQLlite(args.db, layout=args.layout)
+    try:
+        with open(args.funds) as json_file:
+            SQL_DB.register_funds(json.load(json_file))
+        SQL_DB.rebuild_aggregates()
+    finally:
+        SQL_DB.close_connection()
+
+
+def load(args):
+
+    with open(args.funds) as json_file:
+        fundos = json.load(json_file)
+
+    SQL_DB = Write_to_SQLlite(args.db, tuning=True, layout=args.layout)
+    try:
+        SQL_DB.register_funds(fundos)
+        load_daily_reports(
+            args.files,
+            SQL_DB,
+            cnpjs=None if args.all else fundos,
+            chunk_rows=args.chunk_rows,
+        )
+    finally:
+        SQL_DB.close_connection()
+
+
+def export(args):
+
+    exporter = Columnar_Export(args.db, args.directory)
+    try:
+        if args.append:
+            exporter.append(end=args.end)
+        else:
+            exporter.export(args.format, start=args.start, end=args.end)
+    finally:
+        exporter.close_connection()
+
+
+parser = argparse.ArgumentParser(description=__doc__.split("\n")[0])
+commands = parser.add_subparsers(dest="command", required=True)
+
+migrate_parser = commands.add_parser(
+    "migrate", help="Migra as tabelas table_CNPJ para a tabela daily_quota."
+)
+migrate_parser.add_argument("--db", default="Fundos de Investimento2.db")
+migrate_parser.add_argument(
+    "--source",
+    default=None,
+    help="Base de dados com as tabelas table_CNPJ (padrão: a própria --db).",
+)
+migrate_parser.set_defaults(run=migrate)
+
+analytics_parser = commands.add_parser(
+    "analytics", help="Atualiza os indicadores das tabelas analytics_*."
+)
+analytics_parser.add_argument("--db", default="Fundos de Investimento2.db")
+analytics_parser.add_argument(
+    "--rebuild",
+    action="store_true",
+    help="Recalcula os indicadores de todo o histórico.",
+)
+analytics_parser.set_defaults(run=analytics)
+
+aggregates_parser = commands.add_parser(
+    "aggregates", help="Recalcula as tabelas de totais diários."
+)
+aggregates_parser.add_argument("--db", default="Fundos de Investimento2.db")
+aggregates_parser.add_argument(
+    "--layout", choices=("per_fund", "long"), default="per_fund"
+)
+aggregates_parser.add_argument(
+    "--funds", default="fundos.json", help="Fundos e nomes, para as categorias."
+)
+aggregates_parser.set_defaults(run=aggregates)
+
+load_parser = commands.add_parser(
+    "load", help="Carrega os informes diários (inf_diario_fi) da CVM."
+)
+load_parser.add_argument("files", nargs="+", help="Arquivos .csv ou .zip.")
+load_parser.add_argument("--db", default="Fundos de Investimento2.db")
+load_parser.add_argument("--layout", choices=("per_fund", "long"), default="per_fund")
+load_parser.add_argument(
+    "--funds", default="fundos.json", help="Fundos de interesse e seus nomes."
+)
+load_parser.add_argument(
+    "--all", action="store_true", help="Carrega todos os fundos dos arquivos."
+)
+load_parser.add_argument("--chunk-rows", type=int, default=100_000)
+load_parser.set_defaults(run=load)
+
+export_parser = commands.add_parser(
+    "export", help="Exporta a base de dados em formato colunar."
+)
+export_parser.add_argument("directory", help="Diretório da exportação.")
+export_parser.add_argument("--db", default="Fundos de Investimento2.db")
+export_parser.add_argument("--format", choices=FORMATS, default="npy")
+export_parser.add_argument("--start", default=None, help="Data inicial (yyyy-mm-dd).")
+export_parser.add_argument("--end", default=None, help="Data final (yyyy-mm-dd).")
+export_parser.add_argument(
+    "--append", action="store_true", help="Somente os dias desde a última exportação."
+)
+export_parser.set_defaults(run=export)
+
+if __name__ == "__main__":
+
+    args = parser.parse_args()
+    args.run(args)
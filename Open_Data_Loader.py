@@ -0,0 +1,208 @@
+"""Carga dos informes diários dos fundos publicados no portal de dados abertos da CVM
+(arquivos inf_diario_fi_AAAAMM.csv, ou .zip com os csv), sem captcha e sem browser.
+
+ 1) iter_chunks: lê os arquivos do disco em blocos de chunk_rows linhas (memória constante),
+ identificando as colunas pelo cabeçalho: CNPJ_FUNDO (ou CNPJ_FUNDO_CLASSE), DT_COMPTC,
+ VL_QUOTA, CAPTC_DIA, RESG_DIA, VL_PATRIM_LIQ, VL_TOTAL e NR_COTST.
+
+ 2) parse_chunk: filtra os CNPJs de interesse e converte as colunas de uma vez com NumPy,
+ no mesmo formato das linhas do Table_Parser (células vazias gravadas como ''), com uma única
+ linha por fundo e dia (no formato CNPJ_FUNDO_CLASSE há uma linha por subclasse).
+
+ 3) load_daily_reports: grava as linhas com o Write_to_SQLlite, uma transação por bloco,
+ atualizando as datas de atualização, os totais diários e o cache.
+
+Assim como na coleta pelo site, somente os dias posteriores ao último dado gravado de cada
+fundo são inseridos: os arquivos são processados em ordem cronológica (pelo nome)."""
+
+import io
+import os
+import csv
+import zipfile
+import logging
+import logging.config
+
+import numpy as np
+
+# Configura o display e salvamento de logs
+logging.config.fileConfig(
+    os.path.join(os.path.dirname(os.path.abspath(__file__)), "logging.conf"),
+    disable_existing_loggers=False,
+)
+logger = logging.getLogger("database")
+
+# Colunas do informe diário na ordem das colunas das tabelas do Write_to_SQLlite
+COLUMNS = (
+    "DT_COMPTC",
+    "VL_QUOTA",
+    "CAPTC_DIA",
+    "RESG_DIA",
+    "VL_PATRIM_LIQ",
+    "VL_TOTAL",
+    "NR_COTST",
+)
+CNPJ_COLUMNS = ("CNPJ_FUNDO", "CNPJ_FUNDO_CLASSE")
+
+ENCODING = "latin-1"
+
+
+def _digits(cnpjs: np.ndarray) -> np.ndarray:
+    "CNPJs somente com os dígitos (00.000.000/0000-00 -> 00000000000000)"
+
+    for separator in (".", "/", "-"):
+        cnpjs = np.char.replace(cnpjs, separator, "")
+
+    return cnpjs
+
+
+def _open_csv_files(path: str):
+    """Arquivos csv (texto) de path: o próprio arquivo ou cada csv de um .zip."""
+
+    if not zipfile.is_zipfile(path):
+        with open(path, encoding=ENCODING, newline="") as csv_file:
+            yield csv_file
+        return None
+
+    with zipfile.ZipFile(path) as zip_file:
+        for name in sorted(zip_file.namelist()):
+            if name.lower().endswith(".csv"):
+                with zip_file.open(name) as member:
+                    yield io.TextIOWrapper(member, encoding=ENCODING, newline="")
+
+
+def _header_positions(header: list, path: str) -> list:
+    "Posição das colunas CNPJ e COLUMNS no cabeçalho do arquivo"
+
+    header = [column.strip().lstrip("\ufeff") for column in header]
+
+    cnpj = next((column for column in CNPJ_COLUMNS if column in header), None)
+    missing = [column for column in (cnpj,) + COLUMNS if column not in header]
+    if missing:
+        raise ValueError(f"Colunas ausentes no arquivo {path}: {missing}.")
+
+    return [header.index(column) for column in (cnpj,) + COLUMNS]
+
+
+def iter_chunks(path: str, chunk_rows: int = 100_000):
+    """Blocos de até chunk_rows linhas do arquivo, cada um como uma lista de colunas
+    (CNPJ e COLUMNS, nesta ordem), com as células em string."""
+
+    for csv_file in _open_csv_files(path):
+        reader = csv.reader(csv_file, delimiter=";")
+
+        header = next(reader, None)
+        if header is None:
+            continue
+        positions = _header_positions(header, path)
+
+        chunk = []
+        for line in reader:
+            if not line:
+                continue
+            chunk.append([line[position] for position in positions])
+
+            if len(chunk) == chunk_rows:
+                yield [list(column) for column in zip(*chunk)]
+                chunk = []
+
+        if chunk:
+            yield [list(column) for column in zip(*chunk)]
+
+
+def _to_floats(cells: np.ndarray) -> list:
+    """Converte a coluna para float. Células vazias ou que não sejam números permanecem
+    como string, como no Write_to_SQLlite._convert_data."""
+
+    cells = np.char.strip(cells)
+    filled = cells != ""
+
+    values = cells.astype(object)
+    try:
+        values[filled] = cells[filled].astype(np.float64).tolist()
+    except ValueError:
+        # Alguma célula não numérica: conversão célula a célula
+        for index in np.flatnonzero(filled):
+            try:
+                values[index] = float(cells[index])
+            except ValueError:
+                values[index] = str(cells[index])
+
+    return values.tolist()
+
+
+def parse_chunk(chunk: list, cnpjs: set = None) -> dict:
+    """Definição:
+     - chunk: bloco retornado pelo iter_chunks.
+     - cnpjs: CNPJs (somente dígitos) de interesse. Se None, todos os fundos do arquivo.
+
+     Retorna {CNPJ: lista de tuplas (data, Quota, Captação_dia, Resgate_dia,
+     Patrimônio_Líquido, Total_da_Carteira, No_de_Cotistas)}, em ordem de data, somente com
+     os dias que têm o valor da cota e uma única linha por dia: a primeira do arquivo (no
+     formato CNPJ_FUNDO_CLASSE há uma linha por subclasse, ID_SUBCLASSE)."""
+
+    fund_cnpjs = _digits(np.array(chunk[0]))
+    columns = [np.array(column) for column in chunk[1:]]
+
+    keep = np.char.strip(columns[1]) != ""
+    if cnpjs is not None:
+        keep &= np.isin(fund_cnpjs, list(cnpjs))
+    if not keep.any():
+        return {}
+
+    fund_cnpjs = fund_cnpjs[keep]
+    dates = np.array(np.char.strip(columns[0][keep]), dtype="datetime64[D]")
+
+    # Ordena por fundo e data (ordenação estável), para separar as linhas de cada fundo e
+    # descartar as linhas repetidas de um mesmo dia
+    order = np.lexsort((dates, fund_cnpjs))
+    fund_cnpjs, dates = fund_cnpjs[order], dates[order]
+
+    first = np.insert(
+        (fund_cnpjs[1:] != fund_cnpjs[:-1]) | (dates[1:] != dates[:-1]), 0, True
+    )
+    order, fund_cnpjs, dates = order[first], fund_cnpjs[first], dates[first]
+    values = [_to_floats(column[keep][order]) for column in columns[1:]]
+
+    rows = list(zip(dates.tolist(), *values))
+    starts = np.flatnonzero(np.insert(fund_cnpjs[1:] != fund_cnpjs[:-1], 0, True))
+    ends = np.append(starts[1:], fund_cnpjs.size)
+
+    return {str(fund_cnpjs[start]): rows[start:end] for start, end in zip(starts, ends)}
+
+
+def load_daily_reports(
+    paths: list, SQL_DB, cnpjs=None, chunk_rows: int = 100_000
+) -> int:
+    """Definição:
+     - paths: arquivos inf_diario_fi (.csv ou .zip), processados em ordem de nome.
+     - SQL_DB: Write_to_SQLlite de destino (qualquer layout).
+     - cnpjs: CNPJs de interesse, em qualquer formato. Se None, todos os fundos.
+     - chunk_rows: linhas lidas e convertidas por vez.
+
+     Retorna o número de linhas inseridas."""
+
+    if cnpjs is not None:
+        cnpjs = {"".join([i for i in CNPJ if i.isdigit()]) for CNPJ in cnpjs}
+
+    inserted = 0
+    for path in sorted(paths, key=os.path.basename):
+        file_rows = 0
+
+        for chunk in iter_chunks(path, chunk_rows):
+            new_rows = {}
+            for CNPJ, rows in parse_chunk(chunk, cnpjs).items():
+                SQL_DB.get_last_update(CNPJ)
+
+                # Somente os dias inéditos, como na coleta pelo site
+                rows = [row for row in rows if row[0] > SQL_DB.last_update]
+                if rows:
+                    new_rows[CNPJ] = rows
+
+            file_rows += SQL_DB._data_entry_funds(new_rows)
+
+        inserted += file_rows
+        logger.info(f"Arquivo {path} carregado: {file_rows} linhas inseridas.")
+
+    logger.info(f"Carga concluída: {len(paths)} arquivos, {inserted} linhas inseridas.")
+
+    return inserted
@@ -0,0 +1,404 @@
+"""Leitura das séries históricas dos fundos gravadas pelo Write_on_DB, em arrays NumPy.
+
+ 1) Read_from_SQLlite: abre a base de dados somente para leitura e identifica o layout
+ ("per_fund", uma tabela por fundo, ou "long", tabela única daily_quota).
+
+ 2) get_series: lê vários fundos numa única consulta. As linhas do cursor são gravadas
+ diretamente num array estruturado (np.fromiter), sem montar a lista de tuplas do fetchall.
+ Datas viram datetime64[D] (convertidas pelo SQLite em dias desde 1970) e valores float64,
+ com NaN nos dias sem o dado (gravados como '').
+
+ 3) Series_Cache: cache LRU, limitado em bytes, das séries completas dos fundos mais
+ consultados, com o mesmo get_series. Um Write_to_SQLlite com o cache anexado (cache=...)
+ estende ou invalida as séries em cache a cada gravação no mesmo processo.
+
+No layout "long", o filtro por CNPJ e por data é uma busca na chave primária (cnpj, Data),
+que contém todas as colunas da tabela (WITHOUT ROWID)."""
+
+import os
+import sqlite3
+import threading
+import logging
+import logging.config
+from collections import OrderedDict, namedtuple
+from urllib.request import pathname2url
+
+import numpy as np
+
+# Configura o display e salvamento de logs
+logging.config.fileConfig(
+    os.path.join(os.path.dirname(os.path.abspath(__file__)), "logging.conf"),
+    disable_existing_loggers=False,
+)
+logger = logging.getLogger("database")
+
+# Colunas de valores das tabelas, na ordem da tabela dgDocDiario
+VALUE_COLUMNS = (
+    "Quota",
+    "Captação_dia",
+    "Resgate_dia",
+    "Patrimônio_Líquido",
+    "Total_da_Carteira",
+    "No_de_Cotistas",
+)
+
+# Limite de fundos por consulta (parâmetros e SELECTs compostos do SQLite)
+_CHUNK = 400
+
+# Data ISO -> dias desde 1970-01-01 (inteiro, lido pelo NumPy como datetime64[D])
+_DAYS = "CAST(julianday(Data) - 2440587.5 AS INTEGER)"
+
+
+def _numeric(column: str) -> str:
+    "Valores não numéricos (como '') viram NULL, lido como NaN pelo NumPy"
+
+    return f"CASE WHEN typeof({column}) IN ('real', 'integer') THEN {column} END"
+
+
+def _split(rows: np.ndarray, counts: list, columns: tuple) -> dict:
+    """Separa o array estruturado (linhas de vários fundos, em sequência) nos arrays
+    contíguos de cada fundo."""
+
+    series = {}
+    bounds = np.cumsum([0] + [count for _, count in counts])
+
+    for (CNPJ, _), start, stop in zip(counts, bounds[:-1], bounds[1:]):
+        fund = rows[start:stop]
+        series[CNPJ] = {"Data": fund["Data"].astype("datetime64[D]")}
+        series[CNPJ].update(
+            {column: np.ascontiguousarray(fund[column]) for column in columns}
+        )
+
+    return series
+
+
+class Read_from_SQLlite(object):
+    """Lê as séries dos fundos de uma base de dados SQLlite do Write_to_SQLlite.
+
+    - data_base_name: arquivo da base de dados, aberto somente para leitura.
+    - layout: "per_fund" ou "long". Se None, utiliza "long" caso a tabela daily_quota exista.
+    - check_same_thread: False permite o uso da conexão por outras threads, desde que uma de
+    cada vez (como no Series_Cache)."""
+
+    def __init__(
+        self, data_base_name: str, layout: str = None, check_same_thread: bool = True
+    ):
+
+        self.conn = sqlite3.connect(
+            f"file:{pathname2url(os.path.abspath(data_base_name))}?mode=ro",
+            uri=True,
+            check_same_thread=check_same_thread,
+        )
+        self.c = self.conn.cursor()
+        self._refresh_tables()
+
+        if layout is None:
+            layout = "long" if "daily_quota" in self.tables else "per_fund"
+        if layout not in ("per_fund", "long"):
+            raise ValueError(f"Layout desconhecido: {layout}.")
+
+        self.layout = layout
+
+        logger.info(f"Base de dados {data_base_name} aberta para leitura ({layout}).")
+
+    def _refresh_tables(self):
+
+        self.c.execute("SELECT name FROM sqlite_master WHERE type = 'table';")
+        self.tables = {name for name, in self.c.fetchall()}
+
+    def funds(self) -> list:
+        "CNPJs (somente dígitos) dos fundos com dados na base"
+
+        if self.layout == "long":
+            self.c.execute("SELECT DISTINCT cnpj FROM daily_quota ORDER BY cnpj;")
+            return [CNPJ for CNPJ, in self.c.fetchall()]
+
+        return sorted(
+            name[len("table_") :] for name in self.tables if name.startswith("table_")
+        )
+
+    def get_series(self, cnpjs=None, start=None, end=None, columns=("Quota",)) -> dict:
+        """Definições:
+         - cnpjs: lista de CNPJs (com ou sem pontuação). Se None, todos os fundos da base.
+         - start / end: datas (datetime.date ou 'yyyy-mm-dd') do intervalo, inclusive.
+         - columns: colunas de VALUE_COLUMNS que devem ser lidas.
+
+         Retorna {CNPJ (somente dígitos): {"Data": datetime64[D], coluna: float64, ...}},
+         em ordem cronológica. Fundos sem dados no intervalo têm arrays vazios."""
+
+        columns = (columns,) if isinstance(columns, str) else tuple(columns)
+        unknown = set(columns) - set(VALUE_COLUMNS)
+        if unknown:
+            raise ValueError(f"Colunas desconhecidas: {sorted(unknown)}.")
+
+        if cnpjs is None:
+            cnpjs = self.funds()
+        else:
+            cnpjs = ["".join([i for i in CNPJ if i.isdigit()]) for CNPJ in cnpjs]
+
+        conditions, parameters = [], []
+        if start is not None:
+            conditions.append("Data >= ?")
+            parameters.append(str(start))
+        if end is not None:
+            conditions.append("Data <= ?")
+            parameters.append(str(end))
+
+        select = ", ".join([_DAYS] + [_numeric(c) for c in columns])
+        dtype = [("Data", np.int64)] + [(column, np.float64) for column in columns]
+
+        empty = np.array([], dtype=dtype)
+
+        series = {}
+        for index in range(0, len(cnpjs), _CHUNK):
+            chunk = cnpjs[index : index + _CHUNK]
+
+            # Contagem e leitura na mesma transação: o mesmo snapshot da base de dados
+            self.c.execute("BEGIN;")
+            try:
+                if self.layout == "long":
+                    counts = self._query_long(chunk, select, conditions, parameters)
+                else:
+                    counts = self._query_per_fund(chunk, select, conditions, parameters)
+
+                rows = np.fromiter(self.c, dtype=dtype) if counts else empty
+            finally:
+                self.c.execute("COMMIT;")
+
+            series.update(_split(rows, counts, columns))
+
+        # Fundos sem dados no intervalo
+        for CNPJ in cnpjs:
+            if CNPJ not in series:
+                series.update(_split(empty, [(CNPJ, 0)], columns))
+
+        return {CNPJ: series[CNPJ] for CNPJ in cnpjs}
+
+    def _query_long(self, cnpjs, select, conditions, parameters) -> list:
+        """Executa a consulta dos fundos no layout long e retorna [(CNPJ, nº de linhas)], na
+        mesma ordem das linhas do cursor. Ambas as consultas percorrem a chave primária."""
+
+        where = " AND ".join([f"cnpj IN ({', '.join('?' * len(cnpjs))})"] + conditions)
+
+        self.c.execute(
+            f"SELECT cnpj, COUNT(*) FROM daily_quota WHERE {where} GROUP BY cnpj ORDER BY cnpj;",
+            list(cnpjs) + parameters,
+        )
+        counts = self.c.fetchall()
+
+        self.c.execute(
+            f"SELECT {select} FROM daily_quota WHERE {where} ORDER BY cnpj, Data;",
+            list(cnpjs) + parameters,
+        )
+
+        return counts
+
+    def _query_per_fund(self, cnpjs, select, conditions, parameters) -> list:
+        "Mesmo contrato do _query_long, com um SELECT por tabela table_CNPJ (UNION ALL)"
+
+        where = f"WHERE {' AND '.join(conditions)}" if conditions else ""
+
+        # Tabelas criadas após a abertura da conexão
+        if any(f"table_{CNPJ}" not in self.tables for CNPJ in cnpjs):
+            self._refresh_tables()
+
+        cnpjs = [CNPJ for CNPJ in cnpjs if f"table_{CNPJ}" in self.tables]
+
+        if not cnpjs:
+            return []
+
+        self.c.execute(
+            " UNION ALL ".join(
+                f"SELECT ?, COUNT(*) FROM table_{CNPJ} {where}" for CNPJ in cnpjs
+            ),
+            [value for CNPJ in cnpjs for value in [CNPJ] + parameters],
+        )
+        counts = self.c.fetchall()
+
+        self.c.execute(
+            " UNION ALL ".join(
+                f"SELECT * FROM (SELECT {select} FROM table_{CNPJ} {where} ORDER BY Data)"
+                for CNPJ in cnpjs
+            ),
+            parameters * len(cnpjs),
+        )
+
+        return counts
+
+    def close_connection(self):
+
+        self.c.close()
+        self.conn.close()
+        logger.info("Encerrada a conexão de leitura com o banco de dados.")
+
+
+# Estatísticas do Series_Cache
+Cache_Info = namedtuple(
+    "Cache_Info", ["hits", "misses", "evictions", "invalidations", "entries", "nbytes"]
+)
+
+
+def _nbytes(series: dict) -> int:
+
+    return sum(array.nbytes for array in series.values())
+
+
+class Series_Cache(object):
+    """Cache LRU das séries completas (todas as colunas) dos fundos, em memória.
+
+    - reader: Read_from_SQLlite utilizado nas faltas. Em servidores com várias threads,
+    criá-lo com check_same_thread=False: o acesso à conexão é serializado pelo cache.
+    - max_bytes: tamanho máximo das séries em cache. Os fundos menos usados recentemente
+    são descartados primeiro.
+
+    get_series tem o mesmo contrato do Read_from_SQLlite.get_series: as séries em cache são
+    recortadas por data e coluna (cópias, o cache não é alterado por quem as recebe)."""
+
+    def __init__(self, reader: Read_from_SQLlite, max_bytes: int = 256 * 2 ** 20):
+
+        self.reader = reader
+        self.max_bytes = max_bytes
+
+        self._series = OrderedDict()
+        self._nbytes = 0
+        self._lock = threading.Lock()
+
+        self.hits = self.misses = self.evictions = self.invalidations = 0
+
+    def get_series(self, cnpjs=None, start=None, end=None, columns=("Quota",)) -> dict:
+
+        columns = (columns,) if isinstance(columns, str) else tuple(columns)
+        unknown = set(columns) - set(VALUE_COLUMNS)
+        if unknown:
+            raise ValueError(f"Colunas desconhecidas: {sorted(unknown)}.")
+
+        with self._lock:
+            if cnpjs is None:
+                cnpjs = self.reader.funds()
+            else:
+                cnpjs = ["".join([i for i in CNPJ if i.isdigit()]) for CNPJ in cnpjs]
+
+            # Séries em cache tomadas antes da inclusão dos fundos ausentes, que pode
+            # descartá-las
+            cached, missing = {}, []
+            for CNPJ in dict.fromkeys(cnpjs):
+                if CNPJ in self._series:
+                    self._series.move_to_end(CNPJ)
+                    cached[CNPJ] = self._series[CNPJ]
+                else:
+                    missing.append(CNPJ)
+            self.misses += len(missing)
+            self.hits += len(cnpjs) - len(missing)
+
+            # Uma única leitura para todos os fundos ausentes do cache
+            if missing:
+                fetched = self.reader.get_series(missing, columns=VALUE_COLUMNS)
+                for CNPJ, series in fetched.items():
+                    self._put(CNPJ, series)
+                cached.update(fetched)
+
+            found = {CNPJ: _slice(cached[CNPJ], start, end, columns) for CNPJ in cnpjs}
+
+        return found
+
+    def _put(self, CNPJ: str, series: dict):
+
+        size = _nbytes(series)
+        if size > self.max_bytes:
+            return None
+
+        self._discard(CNPJ)
+        self._series[CNPJ] = series
+        self._nbytes += size
+
+        while self._nbytes > self.max_bytes:
+            _, evicted = self._series.popitem(last=False)
+            self._nbytes -= _nbytes(evicted)
+            self.evictions += 1
+
+    def _discard(self, CNPJ: str) -> bool:
+
+        series = self._series.pop(CNPJ, None)
+        if series is None:
+            return False
+
+        self._nbytes -= _nbytes(series)
+        return True
+
+    def invalidate(self, CNPJ: str = None):
+        "Descarta a série de um fundo (ou de todos os fundos, se CNPJ for None)"
+
+        with self._lock:
+            if CNPJ is None:
+                self.invalidations += len(self._series)
+                self._series.clear()
+                self._nbytes = 0
+            elif self._discard("".join([i for i in CNPJ if i.isdigit()])):
+                self.invalidations += 1
+
+    def extend(self, CNPJ: str, rows: list):
+        """Chamado pelo Write_to_SQLlite após gravar as linhas (data, Quota, ...) de um fundo.
+        Linhas posteriores à série em cache são anexadas a ela; caso contrário, a série é
+        descartada e será lida novamente da base de dados na próxima consulta."""
+
+        CNPJ = "".join([i for i in CNPJ if i.isdigit()])
+
+        with self._lock:
+            series = self._series.get(CNPJ)
+            if series is None or not rows:
+                return None
+
+            rows = sorted(rows, key=lambda row: row[0])
+            dates = np.array([row[0] for row in rows], dtype="datetime64[D]")
+
+            if series["Data"].size and dates[0] <= series["Data"][-1]:
+                self._discard(CNPJ)
+                self.invalidations += 1
+                return None
+
+            # Valores não numéricos (como '') viram NaN, como na leitura da base de dados
+            values = np.array(
+                [
+                    [
+                        value if isinstance(value, (int, float)) else np.nan
+                        for value in row[1:]
+                    ]
+                    for row in rows
+                ],
+                dtype=np.float64,
+            )
+
+            extended = {"Data": np.concatenate([series["Data"], dates])}
+            for index, column in enumerate(VALUE_COLUMNS):
+                extended[column] = np.concatenate([series[column], values[:, index]])
+
+            self._put(CNPJ, extended)
+
+    def cache_info(self) -> Cache_Info:
+
+        with self._lock:
+            return Cache_Info(
+                self.hits,
+                self.misses,
+                self.evictions,
+                self.invalidations,
+                len(self._series),
+                self._nbytes,
+            )
+
+
+def _slice(series: dict, start, end, columns: tuple) -> dict:
+    "Recorte [start, end] (inclusive) das colunas de uma série completa"
+
+    dates = series["Data"]
+    first = 0 if start is None else np.searchsorted(dates, np.datetime64(start, "D"))
+    last = (
+        dates.size
+        if end is None
+        else np.searchsorted(dates, np.datetime64(end, "D"), side="right")
+    )
+
+    sliced = {"Data": dates[first:last].copy()}
+    sliced.update({column: series[column][first:last].copy() for column in columns})
+
+    return sliced
@@ -0,0 +1,107 @@
+"""Parser rápido da tabela dgDocDiario (dados diários do fundo), alternativo ao BeautifulSoup.
+
+ 1) _iter_rows: percorre as linhas <tr> do html com expressões regulares, sem construir a
+ árvore do documento, retornando o texto das células de cada linha.
+
+ 2) parse_daily_table: converte as colunas inteiras de uma vez com NumPy. Os dias viram
+ datas (datetime64) a partir do mês da tabela e os números no formato brasileiro
+ (1.234,56) viram floats.
+
+O resultado é idêntico ao do Write_to_SQLlite.feed_SQL_DB com o BeautifulSoup: mesmas
+linhas descartadas (sem valor da cota ou já gravadas) e células vazias gravadas como ''."""
+
+import re
+import datetime
+from html import unescape
+
+import numpy as np
+
+_ROW = re.compile(r"<tr\b[^>]*>(.*?)</tr\s*>", re.IGNORECASE | re.DOTALL)
+_CELL = re.compile(r"<td\b[^>]*>(.*?)</td\s*>", re.IGNORECASE | re.DOTALL)
+_TAG = re.compile(r"<[^>]*>")
+
+
+def _cell_text(cell: str) -> str:
+    "Texto da célula, como o .text do BeautifulSoup (&nbsp; vira \\xa0)"
+
+    if "<" in cell:
+        cell = _TAG.sub("", cell)
+
+    return unescape(cell) if "&" in cell else cell
+
+
+def _iter_rows(table: str):
+    """Texto das células de cada linha da tabela, exceto o cabeçalho (primeira linha)."""
+
+    rows = _ROW.finditer(table)
+    next(rows, None)
+
+    for row in rows:
+        yield [_cell_text(cell) for cell in _CELL.findall(row.group(1))]
+
+
+def _to_dates(days: list, month: str) -> np.ndarray:
+    """Converte os dias (strings) do mês mm/yyyy em datetime64[D]."""
+
+    month_start = np.datetime64(f"{month[3:]}-{month[:2]}", "M")
+    dates = month_start.astype("datetime64[D]") + (np.array(days, dtype=np.int64) - 1)
+
+    # Dias fora do mês não existem, como no strptime do caminho original
+    invalid = np.flatnonzero(dates.astype("datetime64[M]") != month_start)
+    if invalid.size:
+        raise ValueError(f"Dia inválido em {month}: {days[invalid[0]]}.")
+
+    return dates
+
+
+def _to_floats(cells: np.ndarray) -> list:
+    """Converte a matriz de células numéricas para float. Células vazias ou que não sejam
+    números permanecem como string, como no _convert_data."""
+
+    cleaned = np.char.replace(np.char.replace(cells, ".", ""), ",", ".")
+    filled = cleaned != ""
+
+    values = cleaned.astype(object)
+    try:
+        values[filled] = cleaned[filled].astype(np.float64).tolist()
+    except ValueError:
+        # Alguma célula não numérica: conversão célula a célula
+        for index in zip(*np.nonzero(filled)):
+            try:
+                values[index] = float(cleaned[index])
+            except ValueError:
+                values[index] = str(cells[index])
+
+    return values.tolist()
+
+
+def parse_daily_table(table: str, month: str, last_update: datetime.date) -> list:
+    """Definição:
+     - table: innerHTML da tabela dgDocDiario.
+     - month: mês e ano da tabela, no formato mm/yyyy.
+     - last_update: somente os dias posteriores a esta data são retornados.
+
+     Retorna a lista de tuplas (data, Quota, Captação_dia, Resgate_dia, Patrimônio_Líquido,
+     Total_da_Carteira, No_de_Cotistas), pronta para o Write_to_SQLlite._data_entry_many."""
+
+    # A última coluna (data da próxima informação do PL) é descartada
+    rows = [cells[:-1] for cells in _iter_rows(table)]
+    if not rows:
+        return []
+
+    dates = _to_dates([cells[0] for cells in rows], month)
+
+    # Somente dias inéditos e com o valor da cota
+    keep = dates > np.datetime64(last_update, "D")
+    keep &= np.array([cells[1] != "\xa0" for cells in rows])
+
+    kept = [cells for cells, selected in zip(rows, keep) if selected]
+    if not kept:
+        return []
+
+    cells = np.char.replace(np.array([cells[1:] for cells in kept]), "\xa0", "")
+
+    return [
+        (date,) + tuple(values)
+        for date, values in zip(dates[keep].tolist(), _to_floats(cells))
+    ]
@@ -1,115 +1,121 @@
 import os
 import json
+import asyncio
 import logging
 import logging.config
 
-from tensorflow.keras.models import load_model
 from selenium import webdriver
-import numpy as np
 
 # Mudando para o diretório dos módulos
 os.chdir(os.path.dirname(__file__))
 
-from Captcha_Processor import digits_extractor
-from CVM_WebPage import CVM_Page
+from Captcha_Solver import Captcha_Solver
+from Fund_Scraper import run_concurrently
 from Write_on_DB import Write_to_SQLlite
 
 
-# Configura o display e salvamento de logs e desabilita os logs do tensor flow
+# Configura o display e salvamento de logs
 logging.config.fileConfig("logging.conf", disable_existing_loggers=False)
-logging.getLogger("tensorflow").setLevel(logging.ERROR)
 logger = logging.getLogger("main")
 
-# Carregando a rede neural
-model = load_model("Captcha_model.h5", compile=False)
+# Carregando a rede neural uma única vez, no motor de inferência NumPy (sem TensorFlow)
+solver = Captcha_Solver("Captcha_model.h5")
 
 # Realizando a leitura da lista de fundos.
 with open("fundos.json") as json_file:
     fundos = json.load(json_file)
 
-keys = (key for key, _ in fundos.items())
+# Número de fundos coletados simultaneamente e de fundos coletados por browser
+WORKERS = 4
+MAX_USES = 20
+
+# "selenium" (headless Chrome), "http" (formulários enviados diretamente, sem browser)
+# ou "async" (http com asyncio, para milhares de fundos num único processo)
+ENGINE = "selenium"
+
+# Meses de um mesmo fundo coletados simultaneamente, após o login (engines "http" e "async")
+MONTH_WORKERS = 4
+
+# Limites do engine "async": fundos em andamento e requisições simultâneas (total e por host)
+MAX_FUNDS = 200
+GLOBAL_LIMIT = 100
+PER_HOST_LIMIT = 20
 
 # Configurando o proxy e headless mode
 PROXY = "socks5://127.0.0.1:9050"
+HTTP_PROXIES = {"http": "socks5h://127.0.0.1:9050", "https": "socks5h://127.0.0.1:9050"}
 chrome_options = webdriver.ChromeOptions()
 chrome_options.add_argument(f"--proxy-server={PROXY}")
 chrome_options.add_argument("--headless")
 chrome_options.add_argument("--no-sandbox")
 
-# Conectando-se a base de dados SQLlite
-SQL_DB = Write_to_SQLlite("Fundos de Investimento2.db")
 
-# Percorrendo os fundos disponíveis:
-for key in keys:
+def make_driver():
 
-    browser = webdriver.Chrome(options=chrome_options)
-    CVM = CVM_Page(driver=browser)
+    return webdriver.Chrome(options=chrome_options)
 
-    logger.info(f"Atualizando dados do fundo: {fundos[key]}.")
-    CVM.go()
-    CVM.find_frame.go_to_frame()
 
-    max_tries = 7
-    tries = 0
+# "per_fund" (uma tabela por fundo) ou "long" (tabela única daily_quota, ver
+# "Maintain DataBase.py migrate" para migrar uma base de dados existente)
+DB_LAYOUT = "per_fund"
 
-    while tries < max_tries:
-        tries += 1
-        captcha = digits_extractor(
-            bites_stream=CVM.find_captcha.grab_captcha(), filename=fundos[key]
-        )
+# Parser das tabelas mensais: "fast" (Table_Parser) ou "soup" (BeautifulSoup)
+DB_PARSER = "fast"
 
-        if captcha is not None:
-            interpreted_captcha = "".join(
-                [str(np.argmax(result)) for result in model.predict(captcha)]
-            )
+# Conectando-se a base de dados SQLlite
+SQL_DB = Write_to_SQLlite(
+    "Fundos de Investimento2.db", layout=DB_LAYOUT, parser=DB_PARSER
+)
 
-        else:
-            CVM.ask_new_captcha.click()
-            continue
+# Categoria de cada fundo nos totais diários (daily_category_totals)
+SQL_DB.register_funds(fundos)
 
-        CVM.CNPJ.input_text(text=key)
-        CVM.captcha_field.input_text(text=interpreted_captcha)
-        CVM.log_in_btn.click()
+# Percorrendo os fundos disponíveis, WORKERS fundos por vez:
+if ENGINE == "async":
+    from aiohttp_socks import ProxyConnector
+    from Async_Scraper import run_async
 
-        # Verificando se tive sucesso em logar:
-        if CVM.select_fund(fund_id=key).is_present():
-            break
+    async def update_funds():
 
-    if tries >= max_tries:
+        connector = ProxyConnector.from_url(
+            PROXY, rdns=True, limit=GLOBAL_LIMIT, limit_per_host=PER_HOST_LIMIT
+        )
+        try:
+            return await run_async(
+                fundos,
+                solver,
+                SQL_DB,
+                max_funds=MAX_FUNDS,
+                global_limit=GLOBAL_LIMIT,
+                per_host_limit=PER_HOST_LIMIT,
+                connector=connector,
+                month_workers=MONTH_WORKERS,
+            )
+        finally:
+            await connector.close()
+
+    results = asyncio.run(update_funds())
+
+else:
+    results = run_concurrently(
+        fundos,
+        make_driver,
+        solver,
+        SQL_DB,
+        workers=WORKERS,
+        max_uses=MAX_USES,
+        engine=ENGINE,
+        proxies=HTTP_PROXIES,
+        month_workers=MONTH_WORKERS,
+    )
+
+# Fundos já atualizados (status "up_to_date") não abrem sessão no site da CVM
+for result in results:
+    if result.status not in ("ok", "up_to_date"):
         logger.warning(
-            f"Não conseguimos logar na tentativa de atualização do fundo: {fundos[key]}"
+            f"Fundo {result.fund_name} não foi atualizado (status: {result.status})."
         )
-        CVM.close_browser()
-        continue
-
-    logger.info(f"Número de tentativas de log no fundo {fundos[key]}: {tries}.")
-
-    # Clicando no fundo de interesse:
-    CVM.select_fund(fund_id=key).click()
-
-    # Indo para a tabela de interesse:
-    CVM.go_to_tables.click()
-
-    # Obtendo os meses disponíveis para aquele dado fundo:
-    all_months = CVM.select_months.months_available()
-
-    # Obtendo uma lista com os dois últimos meses disponíveis:
-    list_of_months = [
-        month.strip() for month in all_months.split("\n") if month.strip() is not ""
-    ][0:2]
-
-    # Conectando-se a tabela daquele referido fundo:
-    SQL_DB.get_last_update(CNPJ_fund=key)
-
-    for month in list_of_months:
-        CVM.select_months.pick_month(month_year=month)
-        table_data = CVM.table.fetch_data()
-        SQL_DB.feed_SQL_DB(table_data, month)
-
-    logger.info(f"Base de dados atualizada com dados do fundo: {fundos[key]}")
-    CVM.close_browser()
 
-CVM.quit_browser()
 SQL_DB.close_connection()
 
 logger.info("Fim da rotina de atualização dos fundos.")
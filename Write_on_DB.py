@@ -1,3 +1,5 @@
+import re
+import hashlib
 import datetime
 import sqlite3
 import logging
@@ -5,23 +7,283 @@ import logging.config
 
 from bs4 import BeautifulSoup
 
+from Table_Parser import parse_daily_table
+
 # Configura o display e salvamento de logs
 logging.config.fileConfig("logging.conf")
 logger = logging.getLogger("database")
 
+# Data de atualização de fundos ainda sem dados na base
+NEVER_UPDATED = datetime.date(1969, 12, 31)
 
-class Write_to_SQLlite(object):
-    """Insere os dados do site da CVM numa base de dados SQLlite."""
+# Categorias dos fundos, identificadas pela classe no nome do fundo (na ordem da lista)
+CATEGORIES = (
+    ("Ações", re.compile(r"\b(FIA|A[çc][õo]es)\b", re.IGNORECASE)),
+    ("Renda Fixa", re.compile(r"\b(FIRF|RF|Renda Fixa|Referenciado)\b", re.IGNORECASE)),
+    ("Cambial", re.compile(r"\bCambial\b", re.IGNORECASE)),
+    ("Multimercado", re.compile(r"\b(FIM|Multimercado)\b", re.IGNORECASE)),
+)
+DEFAULT_CATEGORY = "Outros"
+
+# Valor numérico da coluna nos totais diários: células em branco ('') somam zero
+_NUMERIC = "(CASE WHEN typeof({0}) IN ('real', 'integer') THEN {0} ELSE 0 END)"
+
+
+def fund_category(fund_name: str) -> str:
+    "Categoria do fundo a partir do nome (ex.: FIA -> Ações, FIC FIM -> Multimercado)"
+
+    for category, pattern in CATEGORIES:
+        if pattern.search(fund_name):
+            return category
+
+    return DEFAULT_CATEGORY
+
+
+def _number(value) -> float:
 
-    def __init__(self, data_base_name: str):
+    return value if isinstance(value, (int, float)) else 0.0
 
+
+class Write_to_SQLlite(object):
+    """Insere os dados do site da CVM numa base de dados SQLlite.
+
+    - tuning: ajustes opcionais para cargas intensas de dados (journal WAL,
+    synchronous=NORMAL e cache de páginas maior). Com synchronous=NORMAL em WAL, uma queda de
+    energia pode desfazer as últimas transações, mas não corrompe o banco de dados.
+    - layout: "per_fund" (uma tabela table_CNPJ por fundo) ou "long" (tabela única daily_quota,
+    com chave primária (cnpj, Data)). No layout "long" a reinserção de um dia já gravado é
+    ignorada e consultas de todos os fundos numa data são buscas no índice.
+
+    A data do último dado gravado de cada fundo fica na tabela fund_watermarks, atualizada na
+    mesma transação que grava os dados, e é carregada em self.watermarks numa única query.
+    O hash do html de cada mês gravado fica na tabela month_hashes (self.month_hashes): um
+    mês coletado novamente sem alterações não é processado.
+
+    - parser: "soup" (BeautifulSoup, célula a célula) ou "fast" (Table_Parser, expressões
+    regulares e conversão vetorizada das colunas). Ambos gravam exatamente os mesmos dados.
+    - cache: Series_Cache (Read_from_DB) do mesmo processo, estendido ou invalidado a cada
+    gravação.
+
+    As tabelas daily_totals (por data) e daily_category_totals (por data e categoria do
+    fundo) somam o patrimônio líquido e a captação líquida (captação - resgate) de todos os
+    fundos. São atualizadas na mesma transação que grava os dados e podem ser recalculadas
+    com rebuild_aggregates(). A categoria de cada fundo fica na tabela fund_categories."""
+
+    def __init__(
+        self,
+        data_base_name: str,
+        tuning: bool = False,
+        layout: str = "per_fund",
+        parser: str = "soup",
+        cache=None,
+    ):
+
+        if layout not in ("per_fund", "long"):
+            raise ValueError(f"Layout desconhecido: {layout}.")
+        if parser not in ("soup", "fast"):
+            raise ValueError(f"Parser desconhecido: {parser}.")
+
+        self.layout = layout
+        self.parser = parser
+        self.cache = cache
+
+        # A conexão pode ser utilizada por outra thread (ex.: thread de gravação do
+        # Async_Scraper), desde que uma de cada vez
         self.conn = sqlite3.connect(
-            data_base_name, detect_types=sqlite3.PARSE_DECLTYPES
+            data_base_name,
+            detect_types=sqlite3.PARSE_DECLTYPES,
+            check_same_thread=False,
         )
         self.c = self.conn.cursor()
 
+        if tuning:
+            self.c.execute("PRAGMA journal_mode=WAL;")
+            self.c.execute("PRAGMA synchronous=NORMAL;")
+            # Valor negativo: tamanho do cache em KiB (64 MiB)
+            self.c.execute("PRAGMA cache_size=-65536;")
+            self.c.execute("PRAGMA temp_store=MEMORY;")
+
+        if layout == "long":
+            self._create_long_table()
+
+        self.c.execute(
+            """CREATE TABLE IF NOT EXISTS fund_watermarks(cnpj TEXT PRIMARY KEY, last_date DATE)
+            WITHOUT ROWID"""
+        )
+        self.watermarks = self._load_watermarks()
+
+        self.c.execute(
+            """CREATE TABLE IF NOT EXISTS month_hashes(cnpj TEXT, month TEXT, sha1 TEXT,
+            PRIMARY KEY (cnpj, month)) WITHOUT ROWID"""
+        )
+        self.c.execute("SELECT cnpj, month, sha1 FROM month_hashes;")
+        self.month_hashes = {
+            (CNPJ, month): sha1 for CNPJ, month, sha1 in self.c.fetchall()
+        }
+
+        self.c.execute(
+            """CREATE TABLE IF NOT EXISTS fund_categories(cnpj TEXT PRIMARY KEY, category TEXT)
+            WITHOUT ROWID"""
+        )
+        self.c.execute("SELECT cnpj, category FROM fund_categories;")
+        self.categories = dict(self.c.fetchall())
+
+        self._create_aggregate_tables()
+
         logger.info("Conexão com o banco de dados estabelecida com sucesso.")
 
+    def _load_watermarks(self) -> dict:
+        """Datas de última atualização de todos os fundos, {CNPJ(somente dígitos): data}.
+        Numa base de dados anterior à tabela fund_watermarks, a tabela é preenchida a partir
+        dos dados já gravados."""
+
+        self.c.execute("SELECT cnpj, last_date FROM fund_watermarks;")
+        watermarks = dict(self.c.fetchall())
+
+        if not watermarks:
+            self.rebuild_watermarks()
+            self.c.execute("SELECT cnpj, last_date FROM fund_watermarks;")
+            watermarks = dict(self.c.fetchall())
+
+        return watermarks
+
+    def rebuild_watermarks(self):
+        """Recalcula a tabela fund_watermarks a partir dos dados gravados no layout desta
+        conexão."""
+
+        with self.conn:
+            if self.layout == "long":
+                self.c.execute(
+                    """INSERT OR REPLACE INTO fund_watermarks (cnpj, last_date)
+                    SELECT cnpj, MAX(Data) FROM daily_quota GROUP BY cnpj;"""
+                )
+            else:
+                for table_name in self._per_fund_tables():
+                    self.c.execute(
+                        f"""INSERT OR REPLACE INTO fund_watermarks (cnpj, last_date)
+                        SELECT ?, last_date FROM (SELECT MAX(Data) AS last_date FROM {table_name})
+                        WHERE last_date IS NOT NULL;""",
+                        (table_name[len("table_") :],),
+                    )
+
+        self.c.execute("SELECT cnpj, last_date FROM fund_watermarks;")
+        self.watermarks = dict(self.c.fetchall())
+
+        logger.info(
+            f"Recalculadas as datas de atualização de {len(self.watermarks)} fundos."
+        )
+
+    def _create_aggregate_tables(self):
+        """Cria as tabelas de totais diários. Numa base de dados anterior a essas tabelas,
+        os totais são calculados a partir dos dados já gravados."""
+
+        self.c.execute(
+            """CREATE TABLE IF NOT EXISTS daily_totals(Data DATE PRIMARY KEY, Patrimônio_Líquido REAL,
+            Captação_Líquida REAL, No_de_Fundos INTEGER) WITHOUT ROWID"""
+        )
+        self.c.execute(
+            """CREATE TABLE IF NOT EXISTS daily_category_totals(Data DATE, category TEXT,
+            Patrimônio_Líquido REAL, Captação_Líquida REAL, No_de_Fundos INTEGER,
+            PRIMARY KEY (Data, category)) WITHOUT ROWID"""
+        )
+
+        self.c.execute("SELECT 1 FROM daily_totals LIMIT 1;")
+        if self.watermarks and self.c.fetchone() is None:
+            self.rebuild_aggregates()
+
+    def register_funds(self, funds: dict):
+        """Grava a categoria dos fundos ({CNPJ: nome do fundo}) ainda sem categoria, a partir
+        do nome. Categorias já gravadas (inclusive alteradas manualmente) são mantidas; após
+        alterar a categoria de um fundo com dados, execute rebuild_aggregates()."""
+
+        new_categories = {}
+        for CNPJ_fund, fund_name in funds.items():
+            CNPJ = "".join([i for i in CNPJ_fund if i.isdigit()])
+            if CNPJ not in self.categories:
+                new_categories[CNPJ] = fund_category(fund_name)
+
+        with self.conn:
+            self.c.executemany(
+                "INSERT OR IGNORE INTO fund_categories (cnpj, category) VALUES (?, ?);",
+                new_categories.items(),
+            )
+
+        self.categories.update(new_categories)
+
+    def rebuild_aggregates(self):
+        """Recalcula as tabelas daily_totals e daily_category_totals a partir dos dados
+        gravados no layout desta conexão, numa única transação."""
+
+        if self.layout == "long":
+            sources = [("SELECT * FROM daily_quota", ())]
+        else:
+            sources = [
+                (
+                    f"SELECT ? AS cnpj, * FROM {table_name}",
+                    (table_name[len("table_") :],),
+                )
+                for table_name in self._per_fund_tables()
+            ]
+
+        with self.conn:
+            self.c.execute("DELETE FROM daily_totals;")
+            self.c.execute("DELETE FROM daily_category_totals;")
+
+            for source, parameters in sources:
+                for table, keys in (
+                    ("daily_totals", "Data"),
+                    ("daily_category_totals", "Data, category"),
+                ):
+                    self.c.execute(
+                        f"""INSERT INTO {table} ({keys}, Patrimônio_Líquido, Captação_Líquida,
+                        No_de_Fundos) SELECT {keys}, SUM(pl), SUM(flow), SUM(reported) FROM (
+                        SELECT source.Data, COALESCE(fund_categories.category, ?) AS category,
+                        {_NUMERIC.format("source.Patrimônio_Líquido")} AS pl,
+                        {_NUMERIC.format("source.Captação_dia")}
+                        - {_NUMERIC.format("source.Resgate_dia")} AS flow,
+                        typeof(source.Patrimônio_Líquido) IN ('real', 'integer') AS reported
+                        FROM ({source}) AS source LEFT JOIN fund_categories USING (cnpj)
+                        WHERE source.Data IS NOT NULL) GROUP BY {keys}
+                        ON CONFLICT ({keys}) DO UPDATE SET
+                        Patrimônio_Líquido = Patrimônio_Líquido + excluded.Patrimônio_Líquido,
+                        Captação_Líquida = Captação_Líquida + excluded.Captação_Líquida,
+                        No_de_Fundos = No_de_Fundos + excluded.No_de_Fundos;""",
+                        (DEFAULT_CATEGORY,) + parameters,
+                    )
+
+        logger.info(f"Recalculados os totais diários de {len(sources)} tabelas.")
+
+    def _per_fund_tables(self, schema: str = "main") -> list:
+        "Nomes das tabelas table_CNPJ do layout per_fund"
+
+        self.c.execute(
+            f"""SELECT name FROM {schema}.sqlite_master WHERE type = 'table'
+            AND name LIKE 'table\\_%' ESCAPE '\\' ORDER BY name;"""
+        )
+
+        return [name for name, in self.c.fetchall()]
+
+    def last_update_of(self, CNPJ_fund: str) -> datetime.date:
+        "Data do último dado gravado do fundo, sem consultar a base de dados"
+
+        CNPJ = "".join([i for i in CNPJ_fund if i.isdigit()])
+
+        return self.watermarks.get(CNPJ, NEVER_UPDATED)
+
+    def _create_long_table(self):
+        """Cria a tabela única daily_quota caso não exista. WITHOUT ROWID: as linhas ficam
+        armazenadas na própria árvore da chave primária (cnpj, Data)."""
+
+        self.c.execute(
+            """CREATE TABLE IF NOT EXISTS daily_quota(cnpj TEXT NOT NULL, Data DATE NOT NULL,
+            Quota REAL, Captação_dia REAL, Resgate_dia REAL, Patrimônio_Líquido REAL,
+            Total_da_Carteira REAL, No_de_Cotistas INTEGER, PRIMARY KEY (cnpj, Data)) WITHOUT ROWID"""
+        )
+        # Consultas por data (todos os fundos num dia)
+        self.c.execute(
+            "CREATE INDEX IF NOT EXISTS daily_quota_data ON daily_quota(Data);"
+        )
+
     def _create_table(self, CNPJ_fund: str):
         """Cria a tabela no banco de dados caso não exista. 
         
@@ -31,7 +293,11 @@ class Write_to_SQLlite(object):
 
         # Caso a tabela não exita, opto por "criá-la" com uma data no passado
         # Recurso para reaproveitamento de código
-        self.last_update = datetime.date(1969, 12, 31)
+        self.last_update = NEVER_UPDATED
+
+        # No layout "long" a tabela daily_quota já foi criada no __init__
+        if self.layout == "long":
+            return None
 
         try:
             self.c.execute(
@@ -44,6 +310,95 @@ class Write_to_SQLlite(object):
                 f"Ocorreu o seguinte erro ao tentar criar a tabela {CNPJ_fund}: {err2}."
             )
 
+    def _insert_statement(self) -> str:
+
+        if self.layout == "long":
+            return """INSERT OR IGNORE INTO daily_quota (cnpj, Data, Quota, Captação_dia, Resgate_dia,
+            Patrimônio_Líquido, Total_da_Carteira, No_de_Cotistas) VALUES (?,?,?,?,?,?,?,?)"""
+
+        return f"""INSERT INTO table_{self.CNPJ} (data, Quota, Captação_dia, Resgate_dia, Patrimônio_Líquido,
+                Total_da_Carteira, No_de_Cotistas) VALUES (?,?,?,?,?,?,?)"""
+
+    def _update_watermark(self, dates) -> datetime.date:
+        """Grava a data mais recente entre dates e a data de atualização do fundo. Deve ser
+        executada dentro da transação que insere os dados."""
+
+        last_date = max(dates, default=NEVER_UPDATED)
+        last_date = max(last_date, self.watermarks.get(self.CNPJ, NEVER_UPDATED))
+
+        self.c.execute(
+            "INSERT OR REPLACE INTO fund_watermarks (cnpj, last_date) VALUES (?, ?);",
+            (self.CNPJ, last_date),
+        )
+
+        return last_date
+
+    def _new_rows(self, rows) -> list:
+        """Linhas de rows que serão de fato gravadas: a primeira de cada data, somente das
+        datas ainda não gravadas para o fundo (no layout long, as demais seriam ignoradas pelo
+        INSERT OR IGNORE). Os totais diários, a data de atualização e o cache consideram
+        somente estas linhas. Deve ser executada dentro da transação que insere os dados."""
+
+        rows = list(rows)
+        seen = set()
+
+        if rows:
+            dates = [row[0] for row in rows]
+            if self.layout == "long":
+                query = "SELECT Data FROM daily_quota WHERE cnpj = ? AND Data BETWEEN ? AND ?;"
+                parameters = (self.CNPJ, min(dates), max(dates))
+            else:
+                query = (
+                    f"SELECT Data FROM table_{self.CNPJ} WHERE Data BETWEEN ? AND ?;"
+                )
+                parameters = (min(dates), max(dates))
+
+            seen.update(date for (date,) in self.c.execute(query, parameters))
+
+        new_rows = []
+        for row in rows:
+            if row[0] not in seen:
+                seen.add(row[0])
+                new_rows.append(row)
+
+        return new_rows
+
+    def _update_aggregates(self, rows):
+        """Soma as linhas inéditas do fundo corrente aos totais diários (geral e da categoria
+        do fundo). Deve ser executada dentro da transação que insere os dados."""
+
+        category = self.categories.get(self.CNPJ, DEFAULT_CATEGORY)
+        deltas = [
+            (
+                row[0],
+                _number(row[4]),
+                _number(row[2]) - _number(row[3]),
+                int(isinstance(row[4], (int, float))),
+            )
+            for row in rows
+        ]
+
+        updates = """Patrimônio_Líquido = Patrimônio_Líquido + excluded.Patrimônio_Líquido,
+            Captação_Líquida = Captação_Líquida + excluded.Captação_Líquida,
+            No_de_Fundos = No_de_Fundos + excluded.No_de_Fundos"""
+
+        self.c.executemany(
+            f"""INSERT INTO daily_totals (Data, Patrimônio_Líquido, Captação_Líquida, No_de_Fundos)
+            VALUES (?, ?, ?, ?) ON CONFLICT (Data) DO UPDATE SET {updates};""",
+            deltas,
+        )
+        self.c.executemany(
+            f"""INSERT INTO daily_category_totals (Data, category, Patrimônio_Líquido,
+            Captação_Líquida, No_de_Fundos) VALUES (?, ?, ?, ?, ?)
+            ON CONFLICT (Data, category) DO UPDATE SET {updates};""",
+            ((delta[0], category) + delta[1:] for delta in deltas),
+        )
+
+    def _with_CNPJ(self, data: tuple) -> tuple:
+        "No layout long, o CNPJ do fundo é a primeira coluna de cada linha"
+
+        return (self.CNPJ,) + tuple(data) if self.layout == "long" else data
+
     def _data_entry(self, data: tuple):
         """Definições: Insere no banco de dados as informações processadas por _convert_data()
 
@@ -55,15 +410,108 @@ class Write_to_SQLlite(object):
         with self.conn:
 
             try:
-                self.c.execute(
-                    f"""INSERT INTO table_{self.CNPJ} (data, Quota, Captação_dia, Resgate_dia, Patrimônio_Líquido,
-                Total_da_Carteira, No_de_Cotistas) VALUES (?,?,?,?,?,?,?)""",
-                    data,
-                )
+                if not self._new_rows([data]):
+                    return None
+
+                self.c.execute(self._insert_statement(), self._with_CNPJ(data))
+                last_date = self._update_watermark([data[0]])
+                self._update_aggregates([data])
             except Exception as err:
                 logger.exception(
                     f"Erro ao tentar acessar registar o fundo na base de dados {err}."
                 )
+                return None
+
+        self.watermarks[self.CNPJ] = last_date
+
+        if self.cache is not None:
+            self.cache.extend(self.CNPJ, [data])
+
+    def _data_entry_many(self, rows: list, month_hash: tuple = None):
+        """Definições: Insere no banco de dados, numa única transação, todas as linhas
+        processadas por _convert_data()
+
+        - rows: lista de tuplas de dados que se deseja inserir no banco de dados
+        - month_hash: tupla (mês, hash do html) gravada na mesma transação, se fornecida
+
+        Retorna False caso a transação não tenha sido gravada."""
+
+        if not rows and month_hash is None:
+            return True
+
+        try:
+            with self.conn:
+                rows = self._new_rows(rows)
+                if rows:
+                    self.c.executemany(
+                        self._insert_statement(),
+                        (self._with_CNPJ(row) for row in rows),
+                    )
+                    last_date = self._update_watermark(row[0] for row in rows)
+                    self._update_aggregates(rows)
+
+                if month_hash is not None:
+                    self.c.execute(
+                        "INSERT OR REPLACE INTO month_hashes (cnpj, month, sha1) VALUES (?, ?, ?);",
+                        (self.CNPJ,) + month_hash,
+                    )
+        except Exception as err:
+            logger.exception(
+                f"Erro ao tentar acessar registar o fundo na base de dados {err}."
+            )
+            return False
+
+        # Somente após o commit da transação
+        if rows:
+            self.watermarks[self.CNPJ] = last_date
+
+            if self.cache is not None:
+                self.cache.extend(self.CNPJ, rows)
+        if month_hash is not None:
+            month, sha1 = month_hash
+            self.month_hashes[(self.CNPJ, month)] = sha1
+
+        return True
+
+    def _data_entry_funds(self, funds: dict) -> int:
+        """Definições: Insere no banco de dados, numa única transação, as linhas de vários
+        fundos (cargas em lote, ex.: Open_Data_Loader)
+
+        - funds: {CNPJ(somente dígitos): lista de tuplas de dados}. As tabelas dos fundos
+        já devem existir (get_last_update).
+
+        Retorna o número de linhas inseridas."""
+
+        last_dates, inserted = {}, {}
+        try:
+            with self.conn:
+                for CNPJ, rows in funds.items():
+                    self.CNPJ = CNPJ
+                    rows = self._new_rows(rows)
+                    if not rows:
+                        continue
+
+                    self.c.executemany(
+                        self._insert_statement(),
+                        (self._with_CNPJ(row) for row in rows),
+                    )
+                    last_dates[CNPJ] = self._update_watermark(row[0] for row in rows)
+                    self._update_aggregates(rows)
+                    inserted[CNPJ] = rows
+        except Exception as err:
+            logger.exception(
+                f"Erro ao tentar acessar registar os fundos na base de dados {err}."
+            )
+            return 0
+
+        # Somente após o commit da transação
+        for CNPJ, last_date in last_dates.items():
+            self.watermarks[CNPJ] = last_date
+
+            if self.cache is not None:
+                self.cache.extend(CNPJ, inserted[CNPJ])
+
+        return sum(len(rows) for rows in inserted.values())
 
     def _convert_data(self, n: str, month: str, i):
 
@@ -89,10 +537,44 @@ class Write_to_SQLlite(object):
          - Data são convertidas para o formato datetime.date.
          - Automaticamente elimina linhas em branco.
          - Compara a data disponível com a data de última atulização do banco de dados e grava
-        no banco caso o dado seja inédito."""
+        no banco caso o dado seja inédito.
+         - Todas as linhas inéditas do mês são gravadas numa única transação.
+         - Se o html do mês não mudou desde a última gravação (mesmo hash), não é processado.
+
+        Retorna False se a tabela não estava disponível, não pôde ser lida (ex.: dia
+        inválido, linha incompleta) ou não pôde ser gravada."""
+
+        if table is None:
+            logger.error(
+                f"Tabela do mês {month} não disponível para o fundo {self.CNPJ}."
+            )
+            return False
+
+        sha1 = hashlib.sha1(table.encode()).hexdigest()
+        if self.month_hashes.get((self.CNPJ, month)) == sha1:
+            logger.debug(f"Mês {month} do fundo {self.CNPJ} sem alterações.")
+            return True
+
+        try:
+            rows = self.parse_table(table, month)
+        except Exception as err:
+            logger.exception(
+                f"Erro ao ler a tabela do mês {month} do fundo {self.CNPJ}: {err}."
+            )
+            return False
+
+        return self._data_entry_many(rows, (month, sha1))
+
+    def parse_table(self, table, month: str) -> list:
+        """Linhas inéditas da tabela (posteriores a self.last_update), já convertidas, com o
+        parser escolhido no __init__."""
+
+        if self.parser == "fast":
+            return parse_daily_table(table, month, self.last_update)
 
         soup = BeautifulSoup(table, "lxml")
         table_rows = soup.find_all("tr")
+        rows = []
 
         for row in table_rows[1:]:
             # Coleta o dia e converte para datetime.date
@@ -113,7 +595,9 @@ class Write_to_SQLlite(object):
                         for i, item in enumerate(data)
                     )
 
-                    self._data_entry(final_result)
+                    rows.append(final_result)
+
+        return rows
 
     def close_connection(self):
 
@@ -127,6 +611,12 @@ class Write_to_SQLlite(object):
 
         CNPJ_fund = "".join([i for i in CNPJ_fund if i.isdigit()])
 
+        if self.layout == "long":
+            self.c.execute(
+                "SELECT * FROM daily_quota WHERE cnpj = ? AND Quota = '';", (CNPJ_fund,)
+            )
+            return self.c.fetchall()
+
         table_name = f"table_{CNPJ_fund}"
 
         # A query de leitura fica sob sua responsabilidade
@@ -135,21 +625,64 @@ class Write_to_SQLlite(object):
         return self.c.fetchall()
 
     def get_last_update(self, CNPJ_fund: str):
-        """Realiza uma query na base de dados SQLlite para obter a data mais recente
-        de atualização. Cria a tabela com os dados do fundo caso o mesmo não exista."""
+        """Define o fundo corrente e a sua data mais recente de atualização, a partir de
+        self.watermarks. Cria a tabela com os dados do fundo caso o mesmo não tenha dados."""
 
         self.CNPJ = "".join([i for i in CNPJ_fund if i.isdigit()])
 
-        table_name = f"table_{self.CNPJ}"
+        if self.CNPJ not in self.watermarks:
+            # CREATE TABLE IF NOT EXISTS: a tabela pode existir, mas ainda sem dados
+            self._create_table(CNPJ_fund)
+
+        self.last_update = self.watermarks.get(self.CNPJ, NEVER_UPDATED)
+
+        return None
+
+    def migrate_to_long_format(self, source_name: str = None) -> int:
+        """Copia as tabelas table_CNPJ para a tabela única daily_quota, uma transação por
+        fundo. A cópia é feita dentro do SQLite (INSERT ... SELECT), sem carregar as tabelas
+        na memória, e pode ser repetida: dias já migrados são ignorados.
+
+        - source_name: base de dados com as tabelas table_CNPJ. Se None, utiliza a própria
+        base de dados desta conexão.
+
+        Retorna o número de linhas inseridas em daily_quota."""
+
+        self._create_long_table()
+
+        schema = "main"
+        if source_name is not None:
+            self.c.execute("ATTACH DATABASE ? AS source;", (source_name,))
+            schema = "source"
 
         try:
-            self.c.execute(
-                f"""SELECT Data from {table_name} ORDER by Data DESC LIMIT 1;"""
-            )
-            self.last_update, = self.c.fetchall()[0]
+            table_names = self._per_fund_tables(schema)
+
+            inserted = 0
+            for table_name in table_names:
+                with self.conn:
+                    self.c.execute(
+                        f"""INSERT OR IGNORE INTO main.daily_quota (cnpj, Data, Quota, Captação_dia,
+                        Resgate_dia, Patrimônio_Líquido, Total_da_Carteira, No_de_Cotistas)
+                        SELECT ?, Data, Quota, Captação_dia, Resgate_dia, Patrimônio_Líquido,
+                        Total_da_Carteira, No_de_Cotistas FROM {schema}.{table_name}
+                        WHERE Data IS NOT NULL ORDER BY Data;""",
+                        (table_name[len("table_") :],),
+                    )
+                inserted += self.c.rowcount
+                logger.info(
+                    f"Tabela {table_name} migrada: {self.c.rowcount} linhas inseridas."
+                )
 
-        except sqlite3.OperationalError:
+        finally:
+            if source_name is not None:
+                self.c.execute("DETACH DATABASE source;")
 
-            self._create_table(CNPJ_fund)
+        logger.info(
+            f"Migração concluída: {len(table_names)} tabelas, {inserted} linhas inseridas."
+        )
 
-        return None
+        self.rebuild_watermarks()
+        self.rebuild_aggregates()
+
+        return inserted